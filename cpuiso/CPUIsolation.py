@@ -9,7 +9,10 @@ from mininet.topo import SingleSwitchTopo
 from CPUIsolationLib import ( CPUIsolationHost, CPUIsolationTopo,
                               sanityCheck,
                               intListCallback, initOutput, parse_cpuacct,
-                              appendOutput )
+                              appendOutput, cpuacct_rates, cpuacct_lists,
+                              calibrateInterval )
+from CPUSampler import CgroupSampler
+from MonitorCgroup import monitorCgroup
 from mininet.util import quietRun, numCores, custom
 from mininet.cli import CLI
 
@@ -17,7 +20,8 @@ def parseOptions():
     "Parse command line options"
     parser = OptionParser()
     parser.add_option( '-o', '--output', dest='outfile',
-        default=None, help='write output to file' )
+        default=None,
+        help='write output to file (binary format if it ends in .mbr)' )
     parser.add_option( '-t', '--time', dest='time',
         type='int', default=10, help='select cpu-stress time interval' )
     parser.add_option( '-r', '--runs', dest='runs',
@@ -40,6 +44,19 @@ def parseOptions():
     parser.add_option( '-b', '--bwsched', dest='sched',
                        default='cfs',
                        help='bandwidth scheduler: cfs (default) | rt | none' )
+    parser.add_option( '-p', '--sampler', dest='sampler',
+                       type='choice', choices=[ 'cpumonitor', 'python' ],
+                       default='cpumonitor',
+                       help='CPU sampler: cpumonitor (default) | python' )
+    parser.add_option( '-k', '--calibrate', dest='calibrate',
+                       type='float', default=0.0,
+                       help='calibrate the monitor interval to keep the '
+                            'quantization error under this fraction, '
+                            'e.g. .02 (default: fixed rule)' )
+    parser.add_option( '--no-monitorcg', dest='monitorcg',
+                       default=True, action='store_false',
+                       help="don't measure the monitors' own CPU use "
+                            "in a separate cgroup" )
     ( options, args ) = parser.parse_args()
     if options.sched not in [ 'cfs', 'rt', 'none' ]:
         print "CPU bandwidth scheduler should be 'cfs' or 'rt' or 'none'."
@@ -59,6 +76,7 @@ def CPUIsolationTest(opts):
     cpumonitor = 'cpu/cpumonitor'
     results = []
     initOutput( opts.outfile, opts )
+    monitor = monitorCgroup( warn ) if opts.monitorcg else None
 
     for n in opts.counts:
         for run in xrange(1, opts.runs+1):
@@ -102,13 +120,32 @@ def CPUIsolationTest(opts):
             if cpumon_interval < cpumon_min:
                 cpumon_interval = cpumon_min
                 print "Adjusting cpumon_interval to %.2f seconds" % cpumon_interval
+            if monitor:
+                monitor.enter()
+            calibration = None
+            if opts.calibrate > 0:
+                cpumon_interval, calibration = calibrateInterval(
+                    net.hosts, cpu, opts.calibrate, cpumon_length,
+                    cpumon_interval)
             hosts = ' '.join([h.name for h in net.hosts])
             info('*** Running test and monitoring output\n')
-            cmd = ( '%s %d %f %s' % 
-                    (cpumonitor, cpumon_length, cpumon_interval, hosts) )
-            stats = quietRun(cmd)
-            # parse cpu monitor results
-            cpu_usage = parse_cpuacct(stats, cpulimit=cpu)
+            if opts.sampler == 'python':
+                sampler = CgroupSampler([h.name for h in net.hosts])
+                raws = sampler.sample(cpumon_length, cpumon_interval)
+                sampler.close()
+                info('*** Sampler cost per tick: %(mean).6fs mean, '
+                     '%(max).6fs max, %(missed)d ticks missed\n' %
+                     sampler.costSummary())
+            else:
+                cmd = ( '%s %d %f %s' % 
+                        (cpumonitor, cpumon_length, cpumon_interval, hosts) )
+                stats = quietRun(cmd)
+            overhead = monitor.leave() if monitor else None
+            if opts.sampler == 'python':
+                cpu_usage = cpuacct_lists(cpuacct_rates(raws, cpulimit=cpu))
+            else:
+                # parse cpu monitor results
+                cpu_usage = parse_cpuacct(stats, cpulimit=cpu)
             #fetch the results
             # BL: Ignore this for now to avoid shutdown effects!
             if False:
@@ -129,9 +166,17 @@ def CPUIsolationTest(opts):
                 print ','.join(result)
             else:
                 quietRun( 'pkill -9 ' + cpustress )
+            if calibration:
+                for host in cpu_usage:
+                    host['calibration'] = calibration
+            if overhead:
+                for host in cpu_usage:
+                    host.update(overhead)
             #appendOutput(opts, cpu_log)
             appendOutput(opts.outfile, cpu_usage)
             net.stop()
+    if monitor:
+        monitor.remove()
 
 if __name__ == '__main__':
     setLogLevel( 'info' )
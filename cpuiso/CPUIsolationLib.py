@@ -13,6 +13,16 @@ from time import sleep
 from sys import exit, stdout, stderr
 from json import dumps
 
+import numpy as np
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib.resultfile import isBinary, initBinary, appendBinary, sync
+from lib.jsonstream import writeJSON
+from lib.warmup import waitSteady, total
+from ProcMonitor import cgroupPids
+from CPUSampler import CgroupSampler, chooseInterval
+
 from mininet.node import CPULimitedHost
 from mininet.topo import Topo
 from mininet.util import quietRun, numCores, natural
@@ -26,14 +36,40 @@ class CPUIsolationHost( CPULimitedHost ):
         "Ignore attempts to set an IP address"
         pass
 
+    def setCPULimit( self, cpu, sched=None ):
+        """Change our CPU limit while we're running, and check that our
+           cgroup took the new period and quota"""
+        sched = sched or self.sched
+        self.setCPUFrac( cpu, sched )
+        if sched == 'cfs':
+            pstr, qstr, period, quota = self.cfsInfo( cpu )
+        elif sched == 'rt':
+            pstr, qstr, period, quota = self.rtInfo( cpu )
+        else:
+            return
+        got = self.cgroupGet( pstr ), self.cgroupGet( qstr )
+        if got != ( period, quota ):
+            raise Exception( '%s: cgroup has %s=%s, %s=%s; expected %s, %s'
+                             % ( self.name, pstr, got[ 0 ], qstr, got[ 1 ],
+                                 period, quota ) )
+        self.params[ 'cpu' ] = cpu
+
 class CPUIsolationTopo( Topo ):
-    "Topology for a set of disconnected hosts"
-    def __init__( self, N ):
+    """Topology for a set of disconnected hosts; prefix keeps their
+       names apart from another topology's running at the same time"""
+    def __init__( self, N, prefix='' ):
         Topo.__init__( self )
         for i in range( 1, N+1 ):
-            self.add_host( 'h%s' % i )
+            self.add_host( '%sh%s' % ( prefix, i ) )
 
 def get_cpu_pid(s):
+    "Return the pid of a cpu-stress process in host s, or None"
+    try:
+        pids = cgroupPids(s.name)
+        return pids[0] if pids else None
+    except (IOError, OSError):
+        # No cgroup for s: fall back to ps
+        pass
     out, err, code  = s.pexec( 'ps aux' )
     lines = out.split('\n')
     for l in lines:
@@ -42,7 +78,9 @@ def get_cpu_pid(s):
                 return int(l.split()[1])
     return None
 
-def start_monitor_cpu(s, fname):
+def start_monitor_cpu(s, fname, monitor=None):
+    """Monitor the cpu-stress process in host s with top, writing to
+       fname; monitor is an optional MonitorCgroup to charge top to"""
     bash = quietRun('which bash').strip()
     pid = None
     print 'Getting PID of the cpu-stress process in host %s' % s.name
@@ -52,8 +90,9 @@ def start_monitor_cpu(s, fname):
         sleep(0.5)
     print 'pid: %d' % pid
     quietRun('rm -rf %s' % fname)
-    cpu_stress_cmd = ('%s -c "(top -b -p %d -d 1 | grep --line-buffered cpu-stress) > %s" &' % 
-                      (bash, pid, fname))
+    join = monitor.joinCommand().replace('$', '\\$') if monitor else ''
+    cpu_stress_cmd = ('%s -c "%s(top -b -p %d -d 1 | grep --line-buffered cpu-stress) > %s" &' % 
+                      (bash, join, pid, fname))
     print cpu_stress_cmd
     return s.cmd(cpu_stress_cmd)
 
@@ -84,94 +123,212 @@ def diff_list(L):
 def double_diff_list(L):
     return [[y - x for x, y in zip(a, b)] for a, b in zip(L, L[1:])]
 
+# One cpumonitor record per cgroup per tick:
+#   cgroup h1,time 1330000000.250000
+#   usage 123456789
+#   user 12
+#   system 3
+#   percpu 61728394 61728395
+#   throttle nr_periods 250          (optional: the cgroup's cpu.stat)
+#   nr_throttled 12
+#   throttled_time 73400000
+# A record cut short by cpumonitor's buffer limit doesn't match: its
+# percpu line must end in a newline.
+cpuacct_re = re.compile(r'cgroup (\S+),time (\S+)\s+usage\s+(\d+)\s+'
+                        r'user\s+(\d+)\s+system\s+(\d+)\s+percpu([^\n]*)\n'
+                        r'(?:\s*throttle\s+nr_periods\s+(\d+)\s+'
+                        r'nr_throttled\s+(\d+)\s+throttled_time\s+(\d+))?')
+
+def parse_cpuacct_raw(stats):
+    """Parse cpumonitor output in one pass; return a list, sorted by
+       host name, of dicts of raw per-tick NumPy arrays:
+       host, times (s), usage (ns), user and system (USER_HZ ticks)
+       and percpu (ns, ticks x cpus); and, if every record has CFS
+       throttling stats, periods, throttled (counts) and throttledtime
+       (ns)"""
+    records = cpuacct_re.findall(stats)
+    widths = [len(r[5].split()) for r in records]
+    if widths and min(widths) != max(widths):
+        # Ragged percpu lines (e.g. CPU hotplug): drop the odd records
+        # rather than make up counters for them
+        width = max(set(widths), key=widths.count)
+        records = [r for r, w in zip(records, widths) if w == width]
+    if not records:
+        return []
+    (hosts, times, usage, user, system, percpu,
+     periods, throttled, throttledtime) = zip(*records)
+    hosts = np.array(hosts)
+    columns = [times, usage, user, system]
+    throttling = all(periods)
+    if throttling:
+        columns += [periods, throttled, throttledtime]
+    columns = np.array(columns, dtype=np.float64)
+    percpu = np.array(' '.join(percpu).split(),
+                      dtype=np.float64).reshape(len(records), -1)
+    names, index = np.unique(hosts, return_inverse=True)
+    order = np.argsort(index, kind='mergesort')
+    bounds = np.searchsorted(index[order], np.arange(1, len(names)))
+    ret = []
+    for name, rows in zip(names, np.split(order, bounds)):
+        raw = {'host': str(name), 'times': columns[0, rows],
+               'usage': columns[1, rows], 'user': columns[2, rows],
+               'system': columns[3, rows], 'percpu': percpu[rows]}
+        if throttling:
+            raw.update(periods=columns[4, rows], throttled=columns[5, rows],
+                       throttledtime=columns[6, rows])
+        ret.append(raw)
+    return sorted(ret, key=lambda h: natural(h['host']))
+
+def cpuacct_rates(raws, cpulimit=None):
+    """Turn raw per-host counters (from parse_cpuacct_raw or
+       CPUSampler.CgroupSampler.sample) into per-interval rates: a list
+       of dicts of NumPy arrays, as returned by parse_cpuacct_arrays"""
+    # Report CPU limit in CPU seconds rather than as a fraction (!)
+    cores = numCores()
+    if cpulimit is not None:
+        cpulimit *= cores
+    ret = []
+    for raw in raws:
+        times = raw['times']
+        intervals = np.diff(times)
+        # Round results to reported (though not necessarily actual)
+        # accuracy (ns, HZ)
+        ret.append({
+            'host': raw['host'],
+            'xvals': np.round(times[1:] - times[0], 9),
+            'cpuvals': np.round(1e-9 * np.diff(raw['usage']) / intervals, 9),
+            'uservals': np.round(1e-2 * np.diff(raw['user']) / intervals, 2),
+            'systemvals': np.round(1e-2 * np.diff(raw['system']) / intervals,
+                                   2),
+            'percpuvals': np.round(1e-9 * np.diff(raw['percpu'], axis=0) /
+                                   intervals[:, None], 9),
+            'cpulimit': cpulimit,
+            'cpucount': cores })
+        if 'periods' in raw:
+            ret[-1].update(throttle_rates(raw, intervals))
+    return ret
+
+def throttle_rates(raw, intervals):
+    """Return CFS throttling series and run totals for one host:
+       throttlevals, the fraction of each interval's bandwidth periods
+       that were throttled, throttledvals, seconds throttled per second,
+       and the nr_periods, nr_throttled and throttled_time (ns) deltas
+       over the run"""
+    periods = np.diff(raw['periods'])
+    throttled = np.diff(raw['throttled'])
+    ratio = np.divide(throttled, periods, out=np.zeros_like(throttled),
+                      where=periods > 0)
+    total = lambda a: float(a[-1] - a[0]) if len(a) else 0.0
+    return {
+        'throttlevals': np.round(ratio, 6),
+        'throttledvals': np.round(1e-9 * np.diff(raw['throttledtime']) /
+                                  intervals, 9),
+        'nr_periods': total(raw['periods']),
+        'nr_throttled': total(raw['throttled']),
+        'throttled_time': total(raw['throttledtime']) }
+
+def parse_cpuacct_arrays(stats, cpulimit=None):
+    """Like parse_cpuacct, but each host's values are NumPy arrays
+       (percpuvals is ticks x cpus) computed with vectorized
+       differences, and each dict also has a 'host' name"""
+    return cpuacct_rates(parse_cpuacct_raw(stats), cpulimit)
+
+def cpuacct_lists(hosts):
+    "Convert the result of cpuacct_rates to the lists parse_cpuacct returns"
+    ret = []
+    for host in hosts:
+        host = dict(host)
+        del host['host']
+        for k, v in host.items():
+            if isinstance(v, np.ndarray):
+                host[k] = v.tolist()
+        ret.append(host)
+    return ret
+
 def parse_cpuacct(stats, cpulimit=None):
     '''Return the following:
         cpu_usage[n], with each element a dict{'xvals':[], 'cpuvals':[]}
         cpu_stat[n] with each element a dict{'xvals':[], 'uservals': [], 'systemvals': []}
         '''
-    cpu_usage = {}
-
-    rec_re = re.compile(r'cgroup (\S+),time (\d+.\d+)')
-    spaces = re.compile('\s+')
+    return cpuacct_lists(parse_cpuacct_arrays(stats, cpulimit))
+
+def run_errors(hosts):
+    """Return the ( rmserr, maxerr ) of a run's host records: the rms and
+       the largest deviation of all their CPU samples from the CPU limit,
+       both in percent of the limit (as rmserr in the sweep plot's
+       table); nan if there are no samples"""
+    samples = [np.asarray(h['cpuvals'], dtype=np.float64).ravel()
+               for h in hosts]
+    samples = np.concatenate(samples) if samples else np.zeros(0)
+    if not samples.size:
+        return float('nan'), float('nan')
+    limit = float(hosts[0]['cpulimit'])
+    deviation = samples - limit
+    return (float(100.0 * np.sqrt(np.mean(deviation ** 2)) / limit),
+            float(100.0 * np.abs(deviation).max() / limit))
+
+def waitSteadyCPU(hosts, tolerance, timeout, fallback=1.0):
+    """Wait until the total CPU usage rate of hosts' cgroups has settled
+       within tolerance (see lib/warmup.py), instead of sleeping for a
+       fixed warm-up time; return the seconds waited, or raise
+       lib.warmup.WarmupTimeout after timeout seconds.  If we can't read
+       the cgroups' counters, warn and just sleep for fallback seconds,
+       returning None"""
+    try:
+        sampler = CgroupSampler([h.name for h in hosts])
+    except (IOError, OSError) as e:
+        warn('*** Cannot watch CPU usage (%s): waiting %gs instead\n' %
+             (e, fallback))
+        sleep(fallback)
+        return None
+    try:
+        waited, rates = waitSteady(total(sampler.usage), tolerance,
+                                   timeout=timeout,
+                                   name='CPU usage of %d hosts' % len(hosts))
+    finally:
+        sampler.close()
+    info('*** CPU usage steady at %.2f cores after %.2fs\n' %
+         (1e-9 * rates[0], waited))
+    return waited
+
+def calibrateInterval(hosts, cpu, target, seconds, interval):
+    """Calibrate the monitor interval on the running hosts: measure the
+       accounting granularity, timer jitter and sampling cost, and pick
+       the shortest interval whose quantization error bound is within
+       target (see CPUSampler.chooseInterval).  cpu is each host's
+       fraction of the machine; interval is the fallback if the
+       calibration sees no accounting updates.
+       Returns (interval, calibration dict, for the run record)"""
+    sampler = CgroupSampler([h.name for h in hosts])
+    try:
+        calibration = sampler.calibrate()
+    finally:
+        sampler.close()
+    chosen, bound = chooseInterval(calibration, cpu * numCores(), target,
+                                   longest=seconds / 2.0)
+    if chosen is None:
+        warn('*** Calibration saw no CPU accounting updates; '
+             'keeping interval %.3f s\n' % interval)
+        chosen = interval
+    else:
+        info('*** Calibrated monitor interval: %.3f s, error bound %.2f%%\n'
+             % (chosen, 100.0 * bound))
+    calibration.update(target=target, interval=chosen, errorbound=bound)
+    return chosen, calibration
 
-    host = None
-    time = None
+# Incrementally create and append to output file
 
-    # Report CPU limit in CPU seconds rather than as a fraction (!)
-    cores = numCores()
-    cpulimit *= cores
+COMMENT = '# CPU Isolation results - times are in seconds'
 
-    for line in stats.split('\n'):
-        m = rec_re.match(line)
-        if m:
-            host = m.group(1)
-            time = float(m.group(2))
-        else:
-            line = spaces.sub( ' ', line ).split()
-            if 'usage' in line:
-                cpuval = float(line[1])
-                if host is None or time is None:
-                    continue
-                if host not in cpu_usage:
-                    cpu_usage[host] = {'xvals':[], 'cpuvals':[], 'uservals':[],
-                     'systemvals':[], 'percpuvals':[], 'cpulimit': cpulimit }
-                cpu_usage[host]['xvals'].append(time)
-                cpu_usage[host]['cpuvals'].append(cpuval)
-
-            elif 'user' in line:
-                userval = float(line[1])
-                if host is None or time is None:
-                    continue
-                cpu_usage[host]['uservals'].append(userval)
-
-            elif 'system' in line:
-                systemval = float(line[1])
-                if host is None or time is None:
-                    continue
-                cpu_usage[host]['systemvals'].append(systemval)
-            elif 'percpu' in line:
-                percpuval = map(float, line[1:])
-                if host is None or time is None:
-                    continue
-                cpu_usage[host]['percpuvals'].append(percpuval)
-
-    # Round results to reported (though not necessarily actual) accuracy (ns, HZ)
-    def r9(x):
-        return round(x,9)
-    def r2(x):
-        return round(x,2)
-
-    for k,v in cpu_usage.iteritems():
-        intervals = diff_list(v['xvals'])
-        v['xvals'] = [r9(x - v['xvals'][0]) for x in v['xvals']]
-        v['xvals'].pop(0)
-        v['cpuvals'] = [r9(1e-9*x/y) for x, y in zip(diff_list(v['cpuvals']), intervals)]
-        v['uservals'] = [r2(1e-2*x/y) for x, y in zip(diff_list(v['uservals']), intervals)]
-        v['systemvals'] = [r2(1e-2*x/y) for x, y in zip(diff_list(v['systemvals']), intervals)]
-        v['percpuvals'] = [[r9(1e-9*x/y) for x in l] 
-                           for l, y in zip(double_diff_list(v['percpuvals']), intervals)]
-        v['cpucount'] = cores
-
-    return [cpu_usage[k] for k in sorted(cpu_usage.keys(), key=natural)]
-
-
-# Floating point madness; thanks stackoverflow
-
-class PrettyFloats( float ):
-    def __repr__( self ):
-        return '%.15g' % self
-
-def prettyFloats( obj):
-    if isinstance( obj, float ):
-        return PrettyFloats( obj )
-    elif isinstance( obj, dict ):
-        return dict((k, prettyFloats(v)) for k, v in obj.items())
-    elif isinstance( obj, ( list, tuple ) ):
-        return map( prettyFloats, obj )             
-    return obj
-   
 def initOutput( name, opts ):
-    "Initialize an output file"
+    """Initialize an output file; names ending in .mbr get the binary
+       format of lib.resultfile"""
+    if name and isBinary( name ):
+        dirname = os.path.dirname( name )
+        if dirname and not os.path.exists( dirname ):
+            os.makedirs( dirname )
+        initBinary( name, COMMENT, opts.__dict__ )
+        return
     if name:
         dirname = os.path.dirname(name)
         if not os.path.exists(dirname):
@@ -179,7 +336,7 @@ def initOutput( name, opts ):
         f = open( name, 'w')
     else:
         f = stdout
-    print >>f, '# CPU Isolation results - times are in seconds'
+    print >>f, COMMENT
     print >>f, dumps( opts.__dict__ )
     if name:
         f.close()
@@ -187,11 +344,26 @@ def initOutput( name, opts ):
 def appendOutput( outfile, totals ):
     "Append results as JSON to stdout or opts.outfile"
     info( '*** Dumping result\n' )
+    if outfile and isBinary( outfile ):
+        appendBinary( outfile, totals )
+        return
     f = open( outfile, 'a' ) if outfile else stdout
-    print >>f, dumps( prettyFloats( totals ) )
+    writeJSON( f, totals )
+    f.write( '\n' )
     if outfile:
+        # On disk before we report the run done (see lib/resultfile.py)
+        sync( f )
         f.close()
 
+def appendComment( outfile, comment ):
+    "Append a '#' comment line (ignored by readers) to stdout or outfile"
+    if outfile and isBinary( outfile ):
+        appendBinary( outfile, comment, kind='comment' )
+        return
+    f = open( outfile, 'a' ) if outfile else stdout
+    print >>f, '# ' + comment
+    if outfile:
+        f.close()
 
 def checkForExec( prog,dirname ):
     """Check for executable prog; if not found,
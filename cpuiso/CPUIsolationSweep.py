@@ -4,6 +4,9 @@ Sweep over a number of hosts and max CPU utilizations, looking at CPU
 scheduling variance.
 '''
 
+import os
+import signal
+from glob import glob
 from optparse import OptionParser
 from time import sleep, time
 
@@ -14,8 +17,18 @@ from CPUIsolationLib import (
     floatListCallback, intListCallback,
     sanityCheck,
     CPUIsolationTopo, CPUIsolationHost,
-    initOutput, parse_cpuacct, appendOutput )
+    initOutput, parse_cpuacct_arrays, cpuacct_rates,
+    cpuacct_lists, appendOutput, appendComment, calibrateInterval,
+    run_errors, waitSteadyCPU )
+from CPUSampler import CgroupSampler
+from ProcMonitor import ProcMonitor, hostPids
+from MonitorCgroup import MONITOR_CGROUP, monitorCgroup
+from Partitions import (partitionCores, cpuset, partFile, forkPartitions,
+                        mergeParts, interference)
 from mininet.util import quietRun, run, numCores, custom
+from lib.resultfile import BINARY_EXT, isBinary, readRecords, dropPartial
+from lib.resultindex import buildIndex, runKey
+from lib.stats import ci95
 
 CPUSTRESS = 'cpu/cpu-stress'
 CPUMONITOR = 'cpu/cpumonitor'
@@ -62,96 +75,491 @@ def parseOptions():
     parser.add_option( '-b', '--bwsched', dest='sched',
                        default='cfs',
                        help='bandwidth scheduler: cfs (default) | rt | none' )
+    parser.add_option( '-f', '--format',
+        default='json',
+        type='choice',
+        choices=[ 'json', 'binary' ],
+        help='output format: json (default) | binary (see lib/resultfile.py)' )
+    parser.add_option( '-p', '--sampler',
+        default='cpumonitor',
+        type='choice',
+        choices=[ 'cpumonitor', 'python' ],
+        help='CPU sampler: cpumonitor (default) | python (CPUSampler.py)' )
+    parser.add_option( '-P', '--procmon',
+        default=0.0,
+        type='float',
+        help='also sample the cpu-stress processes every PROCMON seconds '
+             'with ProcMonitor.py, recording run-queue delay, context '
+             'switches and migrations (default: off)' )
+    parser.add_option( '-k', '--calibrate',
+        default=0.0,
+        type='float',
+        help='calibrate the monitor interval for each run to keep the '
+             'quantization error under this fraction, e.g. .02 '
+             '(default: fixed rule)' )
+    parser.add_option( '-R', '--reuse',
+        default=False,
+        action='store_true',
+        help='build the network once per host count and change the '
+             "hosts' CPU limits between runs instead of rebuilding it" )
+    parser.add_option( '-j', '--partitions',
+        default=1,
+        type='int',
+        help='run sweep points concurrently on this many disjoint sets '
+             'of cores, after a control run for interference '
+             '(default: 1, one point at a time)' )
+    parser.add_option( '-a', '--adaptive',
+        default=0.0,
+        type='float',
+        help='instead of --runs, repeat each (hosts, util) point until '
+             'the half-widths of the 95%% confidence intervals of its '
+             'rmserr and maxerr are within this many percent of the CPU '
+             'limit (default: off)' )
+    parser.add_option( '--min-runs',
+        default=3,
+        type='int',
+        help='fewest runs of each point with --adaptive (default: 3)' )
+    parser.add_option( '--max-runs',
+        default=10,
+        type='int',
+        help='most runs of each point with --adaptive (default: 10)' )
+    parser.add_option( '--steady',
+        default=0.1,
+        type='float',
+        help='start measuring once the stressors\' total CPU usage rate '
+             'is steady within this fraction (default: .1); 0 for a '
+             'fixed one-second wait' )
+    parser.add_option( '--warmup-timeout', dest='warmuptimeout',
+        default=30.0,
+        type='float',
+        help='give up if the CPU usage is not steady after this many '
+             'seconds (default: 30)' )
+    parser.add_option( '--resume',
+        default=False,
+        action='store_true',
+        help='keep the existing output file and run only the points it '
+             'has no results for yet' )
+    parser.add_option( '--no-monitorcg', dest='monitorcg',
+        default=True,
+        action='store_false',
+        help="don't measure the monitors' own CPU use in a separate cgroup" )
     options, args = parser.parse_args()
     if options.sched not in [ 'cfs', 'rt', 'none' ]:
         print "CPU bandwidth scheduler should be either 'cfs' or 'rt' or 'none'."
         parser.print_help()
         exit( 1 )
+    if not 1 <= options.min_runs <= options.max_runs:
+        parser.error( '--min-runs and --max-runs need '
+                      '1 <= min-runs <= max-runs' )
     options.host = quietRun( 'hostname' ).strip()
     options.cores = numCores()
     return options, args
 
 
-def appendResults(net, outfile, n, cpu):
+# Process monitor series stored in each host's record, as proc<name>
+PROCSERIES = ('xvals', 'cpuvals', 'waitvals', 'delayvals', 'vcswvals',
+              'ivcswvals', 'migrationvals', 'delaydist')
+
+def addProcStats(cpu_usage, procmon):
+    """Add each host's process monitor series (scheduling latency,
+       context switches, migrations) and overhead to cpu_usage"""
+    procs = procmon.byLabel()
+    for host in cpu_usage:
+        proc = procs.get(host['host'])
+        if proc:
+            for name in PROCSERIES:
+                host['proc' + name] = proc[name]
+        host['procmon'] = procmon.overhead
+
+def killStressors(hosts):
+    "Kill the stress processes of hosts (all of them if we can't tell)"
+    try:
+        pids = hostPids(hosts)
+    except (IOError, OSError):
+        quietRun('pkill -9 -f ' + CPUSTRESS)
+        return
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+def appendResults(net, outfile, n, cpu, monitor=None, extra=None):
+    """Run the stressors on net's hosts and append their CPU usage to
+       outfile, and return their records; monitor is an optional
+       MonitorCgroup that charges our monitoring to its own cgroup and
+       records its cost, and extra holds fields to add to each host's
+       record"""
     result = [''] * n
     cmd = [None] * n  # Command objects for CPU stressers
-    monitor = [None]*n
     monitor_outfile = [None]*n  # Filenames
     cpu_log = [None]*n
 
-    info ("Starting CPU stressors\n")
-    # Start cpu-stressers
-    for i in xrange(0, n):
-        server = net.hosts[i]
-        # run for 120 secs extra; terminated below
-        scmd = '%s %d %d' % (CPUSTRESS, opts.time+120, 0) 
-        server.cmd(scmd + '&')
-        monitor_outfile[i] = '/tmp/%s_cpu.out' % server.name
-    sleep(1)
-
-    info ("Starting CPU monitor\n")
-    # Start cpu monitor
-    startTime = int(time())
-    cpumon_length = opts.time
-    # Was always one second.
-    # Now we will try the following: since cpuacct is adjusted every
-    # 10 ms, we should try to make sure that each process makes some
-    # progress each time interval.
-    # for a minimum cpu time of 20 ms,
-    # the interval should be 20 ms * n / (cpu% * numCores())
-    cpumon_interval = 1.0
-    cpumon_min = .020 / cpu / numCores()
-    if cpumon_interval < cpumon_min:
-        cpumon_interval = cpumon_min
-        print "Adjusting cpumon_interval to %.2f seconds" % cpumon_interval
-    hosts = ' '.join([h.name for h in net.hosts])
-    stats = quietRun('%s %d %f %s' % (CPUMONITOR, cpumon_length, cpumon_interval, hosts))
-
-    info ("Terminating processes\n")
-    quietRun( 'pkill -9 -f ' + CPUSTRESS )
+    overhead = warmup = None
+    try:
+        info ("Starting CPU stressors\n")
+        # Start cpu-stressers
+        for i in xrange(0, n):
+            server = net.hosts[i]
+            # run for 120 secs extra; terminated below
+            scmd = '%s %d %d' % (CPUSTRESS, opts.time+120, 0) 
+            server.cmd(scmd + '&')
+            monitor_outfile[i] = '/tmp/%s_cpu.out' % server.name
+        if opts.steady > 0:
+            warmup = waitSteadyCPU(net.hosts, opts.steady, opts.warmuptimeout)
+        else:
+            sleep(1)
+
+        info ("Starting CPU monitor\n")
+        # Start cpu monitor
+        startTime = int(time())
+        cpumon_length = opts.time
+        # Was always one second.
+        # Now we will try the following: since cpuacct is adjusted every
+        # 10 ms, we should try to make sure that each process makes some
+        # progress each time interval.
+        # for a minimum cpu time of 20 ms,
+        # the interval should be 20 ms * n / (cpu% * numCores())
+        cpumon_interval = 1.0
+        cpumon_min = .020 / cpu / numCores()
+        if cpumon_interval < cpumon_min:
+            cpumon_interval = cpumon_min
+            print "Adjusting cpumon_interval to %.2f seconds" % cpumon_interval
+        if monitor:
+            monitor.enter()
+        calibration = None
+        if opts.calibrate > 0:
+            cpumon_interval, calibration = calibrateInterval(
+                net.hosts, cpu, opts.calibrate, cpumon_length, cpumon_interval)
+        procmon = None
+        if opts.procmon > 0:
+            # One /proc monitor for every host's stress processes
+            labels = hostPids(net.hosts)
+            procmon = ProcMonitor(sorted(labels), labels)
+            procthread = procmon.background(cpumon_length, opts.procmon)
+        if opts.sampler == 'python':
+            sampler = CgroupSampler([h.name for h in net.hosts])
+            raws = sampler.sample(cpumon_length, cpumon_interval)
+            sampler.close()
+            info("Sampler cost per tick: %(mean).6fs mean, %(max).6fs max, "
+                 "%(missed)d ticks missed\n" % sampler.costSummary())
+        else:
+            hosts = ' '.join([h.name for h in net.hosts])
+            stats = quietRun('%s %d %f %s' % (CPUMONITOR, cpumon_length,
+                                          cpumon_interval, hosts))
+
+        if procmon:
+            procthread.join()
+            procmon.close()
+            info("Process monitor used %(cpupercent).3f%% of one CPU, "
+                 "%(tickmean).6fs per tick\n" % procmon.overhead)
+        overhead = monitor.leave() if monitor else None
+    finally:
+        # Clean up even if the warm-up or a monitor failed
+        if monitor:
+            monitor.leave()
+        info ("Terminating processes\n")
+        # Only ours: other partitions may be running stressors too
+        killStressors(net.hosts)
 
     # parse cpu monitor results
     info ("Parsing CPU monitor results\n")
-    cpu_usage = parse_cpuacct(stats, cpulimit=cpu)
+    if opts.sampler == 'python':
+        cpu_usage = cpuacct_rates(raws, cpulimit=cpu)
+    else:
+        cpu_usage = parse_cpuacct_arrays(stats, cpulimit=cpu)
+    if procmon:
+        addProcStats(cpu_usage, procmon)
+    if calibration:
+        for host in cpu_usage:
+            host['calibration'] = calibration
+    if warmup is not None:
+        for host in cpu_usage:
+            host['warmup'] = round(warmup, 3)
+    if overhead:
+        info("Monitors used %(monitorcpu).3f CPU seconds in "
+             "%(monitortime).1f seconds\n" % overhead)
+        for host in cpu_usage:
+            host.update(overhead)
+    if extra:
+        for host in cpu_usage:
+            host.update(extra)
+    if not (outfile and isBinary(outfile)):
+        # Binary output stores the arrays as they are
+        cpu_usage = cpuacct_lists(cpu_usage)
 
     appendOutput(outfile, cpu_usage)
+    return cpu_usage
 
 
 def hostWithSched(sched):
     return lambda n, *args, **kwargs: Host(n, *args, sched=sched, **kwargs)
 
+def buildNet(n, cpu, cores=None, prefix=''):
+    """Build and start a network of n CPU-limited hosts; cores (a list)
+       confines them to those cores, one each with --static, and prefix
+       makes their names unique"""
+    if not cores:
+        host = custom(CPUIsolationHost, cpu=cpu, sched=opts.sched)
+        net = Mininet(topo=CPUIsolationTopo(n),
+                      host=host, autoPinCpus=opts.static)
+        net.start()
+        return net
+    host = custom(CPUIsolationHost, cpu=cpu, sched=opts.sched, cores=cores)
+    # No switches, so no controller: concurrent networks would fight
+    # over its port
+    net = Mininet(topo=CPUIsolationTopo(n, prefix), host=host,
+                  controller=None)
+    net.start()
+    if opts.static:
+        for i, h in enumerate(net.hosts):
+            h.setCPUs([cores[i % len(cores)]])
+    return net
+
+def stopNet(net, outfile, setup, reconfigs):
+    """Stop a network kept for --reuse; record and return the time its
+       reconfigurations saved"""
+    start = time()
+    net.stop()
+    # Each reconfiguration replaced a network setup and teardown
+    rebuild = setup + time() - start
+    saving = rebuild * len(reconfigs) - sum(reconfigs)
+    comment = ('reuse: %d hosts: setup+teardown %.2fs, '
+               '%d reconfigurations %.3fs, saved %.1fs' %
+               (len(net.hosts), rebuild, len(reconfigs), sum(reconfigs),
+                saving))
+    info('*** %s\n' % comment)
+    appendComment(outfile, comment)
+    return saving
+
+def sweepPoints(opts):
+    """Return the sweep's points ( hosts, util, run ) in order, or with
+       --adaptive its ( hosts, util ) pairs"""
+    if opts.adaptive > 0:
+        return [(n, util) for n in opts.counts for util in opts.utils]
+    return [(n, util, r) for n in opts.counts for util in opts.utils
+            for r in xrange(1, opts.runs+1)]
+
+def sweepOrder(opts):
+    """Return a function giving the place of a run record's ( hosts,
+       util ) in the sweep, for mergeParts()"""
+    pairs = [(n, round(util, 6)) for n in opts.counts for util in opts.utils]
+    places = dict((pair, i) for i, pair in reversed(list(enumerate(pairs))))
+    return lambda run: places.get(runKey({}, run)[:2], len(pairs))
+
+def trials(jobs, errors, outfile):
+    """Return the points to run for jobs from sweepPoints(): the points
+       themselves, or with adaptive errors the runs adaptivePoints()
+       chooses"""
+    return jobs if errors is None else adaptivePoints(jobs, errors, outfile)
+
+def adaptivePoints(pairs, errors, outfile):
+    """Yield points ( hosts, util, run ) for each ( hosts, util ) pair
+       until the half-widths of the 95% confidence intervals of its
+       rmserr and maxerr are within opts.adaptive percent, with
+       opts.min_runs to opts.max_runs runs.  errors maps ( hosts, util )
+       to the ( rmserr, maxerr ) of each run so far, and runPoints() adds
+       to it after every run.
+       Each stop decision is logged as a comment in outfile."""
+    for n, util in pairs:
+        key = (n, round(util, 6))
+        while True:
+            done = errors.get(key, [])
+            runs = len(done)
+            if runs >= opts.min_runs:
+                rmserr, rmsci = ci95([e[0] for e in done])
+                maxerr, maxci = ci95([e[1] for e in done])
+                if rmsci <= opts.adaptive and maxci <= opts.adaptive:
+                    reason = 'converged'
+                elif runs >= opts.max_runs:
+                    reason = 'max runs'
+                else:
+                    reason = None
+                if reason:
+                    comment = ('adaptive: %d hosts, util %.3f: stop after %d '
+                               'runs (%s): rmserr %.2f +/- %.2f%%, maxerr '
+                               '%.2f +/- %.2f%%, target %.2f%%' % (
+                                   n, util, runs, reason, rmserr, rmsci,
+                                   maxerr, maxci, opts.adaptive))
+                    info('*** %s\n' % comment)
+                    appendComment(outfile, comment)
+                    break
+            yield n, util, runs + 1
+
+def runPoints(points, outfile, monitor, cores=None, prefix='', label='',
+              errors=None):
+    """Run sweep points ( hosts, util, run ) one after another, appending
+       the results to outfile.  With cores (a list), the hosts run on
+       those cores only, which stand for the whole machine: utilizations
+       are fractions of them and records give them as cpucount and
+       cpuset; prefix then names the hosts.  If errors is given, each
+       run's ( rmserr, maxerr ) is added to errors[ ( hosts, util ) ]
+       (see adaptivePoints())"""
+    share = float(len(cores)) / numCores() if cores else 1.0
+    extra = {'cpucount': len(cores), 'cpuset': cpuset(cores)} if cores else {}
+    net, saved = None, 0.0
+    try:
+        for i, (n, util, r) in enumerate(points):
+
+            info('\n*****  Running CPU Test %s%i: %d nodes,'
+                 ' max util = %0.3f, trial %d\n' % (label, i, n, util, r))
+
+            # Split system utilization evenly across hosts
+            cpu = util * share / float(n)
+
+            if net is not None and len(net.hosts) != n:
+                saved += stopNet(net, outfile, setup, reconfigs)
+                net = None
+            start = time()
+            if net is not None:
+                # --reuse: just change the live hosts' cgroup limits
+                for h in net.hosts:
+                    h.setCPULimit(cpu, opts.sched)
+                reconfigs.append(time() - start)
+            else:
+                net = buildNet(n, cpu, cores, prefix)
+                setup, reconfigs = time() - start, []
+            info('*** Running test\n')
+            cpu_usage = appendResults(net, outfile, n, cpu, monitor, extra)
+            if errors is not None:
+                errors.setdefault((n, round(util, 6)), []).append(
+                    run_errors(cpu_usage))
+            if not opts.reuse:
+                net.stop()
+                net = None
+        if net is not None:
+            saved += stopNet(net, outfile, setup, reconfigs)
+            net = None
+    finally:
+        if net is not None:
+            # A run failed: don't leave the hosts running
+            net.stop()
+    if opts.reuse:
+        info('*** Network reuse saved %.1fs in this sweep\n' % saved)
+        appendComment(outfile, 'reuse: saved %.1fs in this sweep' % saved)
+
+def firstRun(fname):
+    "Return the first run record in fname, or None"
+    for record in readRecords(fname):
+        if isinstance(record, list):
+            return record
+    return None
+
+def partitionedSweep(jobs, outfile, errors=None):
+    """Run jobs (see sweepPoints()) concurrently on opts.partitions
+       disjoint sets of cores (see Partitions.py), after a control run of
+       the first point alone, and merge the results into outfile in
+       sweep order"""
+    partitions = partitionCores(opts.partitions)
+    info('*** Running on %d partitions: %s\n' %
+         (len(partitions), ' '.join(cpuset(c) for c in partitions)))
+    # Control run: partition 0's first point with the others idle
+    control = partFile(outfile, 'control')
+    if os.path.exists(control):
+        os.remove(control)
+    n, util = jobs[0][:2]
+    runPoints([(n, util, 1)], control, None, partitions[0], 'c', 'control ')
+    alone = firstRun(control)
+    os.remove(control)
+
+    def worker(p, cores, jobs, partfile):
+        "Run a partition's share of the sweep"
+        monitor = None
+        if opts.monitorcg:
+            monitor = monitorCgroup(warn, '%s-p%d' % (MONITOR_CGROUP, p))
+        runPoints(trials(jobs, errors, partfile), partfile, monitor, cores,
+                  'p%d' % p, 'p%d/' % p, errors)
+        if monitor:
+            monitor.remove()
+
+    partfiles, failed = forkPartitions(jobs, partitions, worker, outfile)
+    if failed:
+        warn('*** Partitions failed: %s; their results are incomplete\n' %
+             ' '.join(str(p) for p in failed))
+    shared = firstRun(partfiles[0])
+    mergeParts(outfile, partfiles, sweepOrder(opts))
+    if alone and shared:
+        ok, comparison = interference(alone, shared)
+        comment = 'partitions: %s: %s' % (
+            ' '.join(cpuset(c) for c in partitions), comparison)
+        (info if ok else warn)('*** %s\n' % comment)
+        appendComment(outfile, comment)
+
+def recoverOutput(outfile):
+    """Get outfile ready to resume: drop any incomplete record at its
+       end and merge the part files of an interrupted partitioned sweep"""
+    dropped = dropPartial(outfile)
+    if dropped:
+        warn('*** Dropped %d bytes of an incomplete run from %s\n' %
+             (dropped, outfile))
+    control = partFile(outfile, 'control')
+    if os.path.exists(control):
+        os.remove(control)
+    parts = sorted(glob(partFile(outfile, '[0-9]*')))
+    if parts:
+        info('*** Merging %d part files into %s\n' % (len(parts), outfile))
+        mergeParts(outfile, parts, sweepOrder(opts))
+
+def remainingPoints(points, outfile):
+    "Return the points that outfile has no run record for yet"
+    done = {}
+    for entry in buildIndex(outfile)['entries']:
+        key = entry['hosts'], entry['util']
+        done[key] = done.get(key, 0) + 1
+    # A point's runs may have finished out of order (partitions), but
+    # what matters is how many there are
+    return [(n, util, r) for n, util, r in points
+            if r > done.get((n, round(util, 6)), 0)]
+
+def previousErrors(outfile):
+    """Return the ( rmserr, maxerr ) of each run in outfile, by
+       ( hosts, util ), to resume an adaptive sweep"""
+    errors, runopts = {}, {}
+    for record in readRecords(outfile):
+        if isinstance(record, dict):
+            runopts = record
+            continue
+        hosts, util, sched = runKey(runopts, record)
+        errors.setdefault((hosts, util), []).append(run_errors(record))
+    return errors
+
 def CPUIsolationSweep(opts):
     "Check CPU isolation for various no. of nodes."
     outfile = None
     if opts.output:
         outfile_base = 'results/' + opts.machine + '/' + opts.experiment + '/'
         placement = 'static' if opts.static else 'dyn'
-        filename = 'cpuiso-%s-%s-%s-%s.out' % (
-            opts.host, opts.sched, opts.cores, placement )
+        ext = BINARY_EXT if opts.format == 'binary' else '.out'
+        filename = 'cpuiso-%s-%s-%s-%s%s' % (
+            opts.host, opts.sched, opts.cores, placement, ext )
         outfile = outfile_base + filename
     info("writing to file: %s\n" % outfile)
-    initOutput( outfile, opts )
-
-    i = 0
-    for n in opts.counts:
-        for util in opts.utils:
-            for r in xrange(1, opts.runs+1):
-
-                info('\n*****  Running CPU Test %i: %d nodes,'
-                     ' max util = %0.3f, trial %d\n' % (i, n, util, r))
-
-                # Split system utilization evenly across hosts
-                cpu = util / float(n)
-                
-                host = custom(CPUIsolationHost, cpu=cpu, sched=opts.sched)
-                net = Mininet(topo=CPUIsolationTopo(n),
-                              host=host, autoPinCpus=opts.static)
-                net.start()
-                info('*** Running test\n')
-                appendResults(net, outfile, n, cpu)
-                net.stop()
-                
-                i+=1
+    points = sweepPoints(opts)
+    # With --adaptive, runs add to errors and adaptivePoints() reads them
+    errors = {} if opts.adaptive > 0 else None
+    if opts.resume and outfile and os.path.exists(outfile):
+        recoverOutput(outfile)
+        if errors is not None:
+            errors = previousErrors(outfile)
+            info('*** Resuming: %d earlier runs\n' %
+                 sum(len(e) for e in errors.values()))
+        else:
+            total = len(points)
+            points = remainingPoints(points, outfile)
+            info('*** Resuming: %d of %d points left to run\n' %
+                 (len(points), total))
+            if not points:
+                return
+    else:
+        initOutput( outfile, opts )
+    if opts.partitions > 1:
+        partitionedSweep(points, outfile, errors)
+        return
+    monitor = monitorCgroup(warn) if opts.monitorcg else None
+    runPoints(trials(points, errors, outfile), outfile, monitor,
+              errors=errors)
+    if monitor:
+        monitor.remove()
 
 if __name__ == '__main__':
     setLogLevel( 'info' )
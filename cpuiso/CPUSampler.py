@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+"""
+In-process cgroup CPU sampler: an alternative to cpu/cpumonitor.
+
+The sampler opens each cgroup's accounting files once, then on every
+tick re-reads them with pread() (lseek()+read() where os.pread is
+missing, as on Python 2) and stores the counters straight into
+preallocated NumPy arrays.  Ticks fall on absolute deadlines -- the
+next whole second, then every interval after it -- so timing errors
+don't accumulate, and a tick that falls more than a whole interval
+behind is skipped and counted rather than bunched up.  The time spent
+reading each tick is measured and kept.
+
+Both hierarchies are supported:
+
+cgroup v1: <root>/cpuacct/<cgroup>/cpuacct.{usage,stat,usage_percpu},
+           and CFS throttling stats from <root>/cpu/<cgroup>/cpu.stat
+cgroup v2: <root>/<cgroup>/cpu.stat (usage_usec, user_usec,
+           system_usec, and nr_periods, nr_throttled, throttled_usec
+           if bandwidth control is on; there is no per-cpu breakdown)
+
+sample() returns the same per-host dicts of raw counters as
+CPUIsolationLib.parse_cpuacct_raw: times (s), usage (ns), user and
+system (USER_HZ ticks, converted from usec for v2) and percpu (ns,
+ticks x cpus, zero columns for v2); and periods, throttled and
+throttledtime (ns) if every cgroup reports throttling.
+
+Command line: sample cgroups and print the per-tick cost
+
+    python CPUSampler.py seconds interval cgroups...
+"""
+
+import os
+import resource
+import sys
+from math import ceil
+from time import time, sleep
+
+import numpy as np
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+# cpuacct.stat and cgroup v2 user/system times are reported in these
+USER_HZ = 100
+
+if hasattr( os, 'pread' ):
+    pread = os.pread
+else:
+    def pread( fd, size, offset ):
+        "pread() for Pythons without os.pread"
+        os.lseek( fd, offset, os.SEEK_SET )
+        return os.read( fd, size )
+
+def cgroupVersion( root=CGROUP_ROOT ):
+    "Return 1 or 2, the cgroup hierarchy that accounts CPU time under root"
+    if os.path.isdir( os.path.join( root, 'cpuacct' ) ):
+        return 1
+    if os.path.exists( os.path.join( root, 'cgroup.controllers' ) ):
+        return 2
+    raise IOError( 'no cgroup cpuacct (v1) or unified (v2) hierarchy '
+                   'under %s' % root )
+
+def tickLoop( ticks, interval, start=None ):
+    """Yield ( tick, missed ) for ticks ticks, each at its absolute
+       deadline start + k * interval (start defaults to the next whole
+       second); missed counts the deadlines skipped so far because we
+       fell a whole interval or more behind"""
+    if interval <= 0:
+        raise ValueError( 'interval should be > 0' )
+    start = ceil( time() ) if start is None else start
+    tick, k, missed = 0, 0, 0
+    while tick < ticks:
+        deadline = start + k * interval
+        now = time()
+        if now < deadline:
+            sleep( deadline - now )
+        elif now - deadline >= interval:
+            # Overran a whole tick: skip to the next deadline
+            skipped = int( ( now - deadline ) / interval )
+            missed += skipped
+            k += skipped
+            continue
+        yield tick, missed
+        tick += 1
+        k += 1
+
+def reserveFds( count ):
+    """Make sure we may open count more files: raise our soft
+       RLIMIT_NOFILE up to the hard limit if we need to, or raise IOError
+       saying how many descriptors we need"""
+    try:
+        used = len( os.listdir( '/proc/self/fd' ) )
+    except OSError:
+        used = 0
+    needed = used + count
+    soft, hard = resource.getrlimit( resource.RLIMIT_NOFILE )
+    if soft == resource.RLIM_INFINITY or needed <= soft:
+        return
+    if hard != resource.RLIM_INFINITY and needed > hard:
+        raise IOError( 'sampling needs %d more file descriptors (%d in '
+                       'all), but RLIMIT_NOFILE is %d: raise it with '
+                       'ulimit -n' % ( count, needed, hard ) )
+    resource.setrlimit( resource.RLIMIT_NOFILE, ( hard, hard ) )
+
+def statFields( text ):
+    "Parse 'key value' lines (cpuacct.stat, cpu.stat) into a dict"
+    fields = text.split()
+    return dict( zip( fields[ ::2 ], fields[ 1::2 ] ) )
+
+
+class CgroupSampler( object ):
+    "Sample CPU accounting counters for a list of cgroups"
+
+    def __init__( self, cgroups, root=CGROUP_ROOT, version=None ):
+        self.cgroups = list( cgroups )
+        self.root = root
+        self.version = version or cgroupVersion( root )
+        self.fds = []   # per cgroup: list of ( fd, read size )
+        self.cpus = 0
+        # Up to 4 files per cgroup (3 accounting + cpu.stat) for v1
+        reserveFds( len( self.cgroups ) * ( 4 if self.version == 1 else 1 ) )
+        try:
+            for cgroup in self.cgroups:
+                self.fds.append( self._open( cgroup ) )
+        except:
+            self.close()
+            raise
+        if self.version == 1:
+            percpu = self._read( self.fds[ 0 ][ 2 ] ) if self.fds else b''
+            self.cpus = len( percpu.split() )
+            self.throttling = all( len( f ) == 4 for f in self.fds )
+        else:
+            self.throttling = all(
+                b'nr_periods' in statFields( self._read( f[ 0 ] ) )
+                for f in self.fds )
+        self.throttling = self.throttling and bool( self.fds )
+        self.cost = self.times = None
+        self.missed = 0
+
+    def _files( self, cgroup ):
+        "Return the accounting file names for cgroup"
+        if self.version == 1:
+            base = os.path.join( self.root, 'cpuacct', cgroup )
+            return [ os.path.join( base, f ) for f in
+                     ( 'cpuacct.usage', 'cpuacct.stat',
+                       'cpuacct.usage_percpu' ) ]
+        return [ os.path.join( self.root, cgroup, 'cpu.stat' ) ]
+
+    def _open( self, cgroup ):
+        "Open cgroup's files; return a list of ( fd, read size )"
+        files = []
+        for fname in self._files( cgroup ):
+            fd = os.open( fname, os.O_RDONLY )
+            files.append( ( fd, 4096 ) )
+            # Leave room for the counters to grow
+            size = len( self._read( files[ -1 ] ) )
+            files[ -1 ] = ( fd, max( 4096, 2 * size ) )
+        if self.version == 1:
+            # Throttling stats are optional
+            fname = os.path.join( self.root, 'cpu', cgroup, 'cpu.stat' )
+            if os.path.exists( fname ):
+                files.append( ( os.open( fname, os.O_RDONLY ), 4096 ) )
+        return files
+
+    def _read( self, f ):
+        "Read a whole accounting file from its start"
+        fd, size = f
+        data = pread( fd, size, 0 )
+        while len( data ) == size:
+            # Bigger than we thought: read the rest
+            more = pread( fd, size, len( data ) )
+            if not more:
+                break
+            data += more
+        return data
+
+    def close( self ):
+        "Close all open accounting files"
+        for files in self.fds:
+            for fd, _size in files:
+                os.close( fd )
+        self.fds = []
+
+    def _sampleV1( self, tick, usage, user, system, percpu, throttle ):
+        "Store one tick of cgroup v1 counters"
+        read = self._read
+        for i, files in enumerate( self.fds ):
+            fusage, fstat, fpercpu = files[ :3 ]
+            usage[ tick, i ] = int( read( fusage ) )
+            stat = statFields( read( fstat ) )
+            user[ tick, i ] = int( stat[ b'user' ] )
+            system[ tick, i ] = int( stat[ b'system' ] )
+            values = read( fpercpu ).split()
+            percpu[ tick, i, :len( values ) ] = [ int( v ) for v in values ]
+            if self.throttling:
+                stat = statFields( read( files[ 3 ] ) )
+                throttle[ :, tick, i ] = ( int( stat[ b'nr_periods' ] ),
+                                           int( stat[ b'nr_throttled' ] ),
+                                           int( stat[ b'throttled_time' ] ) )
+
+    def _sampleV2( self, tick, usage, user, system, percpu, throttle ):
+        "Store one tick of cgroup v2 counters, in v1 units"
+        read = self._read
+        scale = 1e-6 * USER_HZ
+        for i, ( fstat, ) in enumerate( self.fds ):
+            stat = statFields( read( fstat ) )
+            usage[ tick, i ] = 1000 * int( stat[ b'usage_usec' ] )
+            user[ tick, i ] = int( int( stat[ b'user_usec' ] ) * scale )
+            system[ tick, i ] = int( int( stat[ b'system_usec' ] ) * scale )
+            if self.throttling:
+                throttle[ :, tick, i ] = (
+                    int( stat[ b'nr_periods' ] ),
+                    int( stat[ b'nr_throttled' ] ),
+                    1000 * int( stat[ b'throttled_usec' ] ) )
+
+    def _buffers( self, ticks ):
+        "Return zeroed usage, user, system, percpu and throttle arrays"
+        n = len( self.cgroups )
+        return ( np.zeros( ( ticks, n ) ), np.zeros( ( ticks, n ) ),
+                 np.zeros( ( ticks, n ) ), np.zeros( ( ticks, n, self.cpus ) ),
+                 # periods, throttled, throttledtime
+                 np.zeros( ( 3, ticks, n ) ) )
+
+    def _usage( self, files ):
+        "Read one cgroup's total CPU usage (ns)"
+        if self.version == 1:
+            return int( self._read( files[ 0 ] ) )
+        return 1000 * int( statFields( self._read( files[ 0 ] ) )[
+            b'usage_usec' ] )
+
+    def usage( self ):
+        "Return each cgroup's total CPU usage so far (ns)"
+        return [ self._usage( files ) for files in self.fds ]
+
+    def calibrate( self, duration=.5, repeats=5 ):
+        """Measure, on this kernel and machine, what limits how finely
+           we can sample.  The cgroups should be busy (e.g. stressors
+           running).  Return a dict of
+           quantum: median step by which usage advances (s of CPU),
+           updateperiod: median time between usage updates (s),
+           jitter: 95th percentile of how late a short sleep wakes (s),
+           tickcost: median cost of one full sample() tick (s),
+           or quantum None if usage never advanced"""
+        # Accounting granularity: poll usage as fast as we can
+        samples = []
+        end = time() + duration
+        while time() < end:
+            samples.append( [ time() ] + [ self._usage( f )
+                                           for f in self.fds ] )
+        samples = np.array( samples )
+        steps, periods = [], []
+        for i in range( 1, samples.shape[ 1 ] ):
+            changed = np.flatnonzero( np.diff( samples[ :, i ] ) > 0 ) + 1
+            steps.extend( np.diff( samples[ changed, i ] ) )
+            periods.extend( np.diff( samples[ changed, 0 ] ) )
+        # Timer jitter: how late do short sleeps wake up?
+        late = []
+        for _ in range( 20 ):
+            start = time()
+            sleep( .001 )
+            late.append( time() - start - .001 )
+        # Cost of a whole tick, into scratch arrays
+        store = self._sampleV1 if self.version == 1 else self._sampleV2
+        buffers = self._buffers( 1 )
+        costs = []
+        for _ in range( repeats ):
+            start = time()
+            store( 0, *buffers )
+            costs.append( time() - start )
+        return { 'quantum': 1e-9 * float( np.median( steps ) )
+                            if steps else None,
+                 'updateperiod': float( np.median( periods ) )
+                                 if periods else None,
+                 'jitter': float( np.percentile( late, 95 ) ),
+                 'tickcost': float( np.median( costs ) ) }
+
+    def sample( self, seconds, interval ):
+        """Sample every interval seconds for seconds, starting on the
+           next whole second; return a list of raw per-cgroup dicts
+           (see parse_cpuacct_raw)"""
+        ticks = max( int( seconds / interval ), 1 )
+        times = np.zeros( ticks )
+        cost = np.zeros( ticks )
+        usage, user, system, percpu, throttle = self._buffers( ticks )
+        store = self._sampleV1 if self.version == 1 else self._sampleV2
+        self.missed = 0
+        for tick, self.missed in tickLoop( ticks, interval ):
+            when = time()
+            store( tick, usage, user, system, percpu, throttle )
+            times[ tick ] = when
+            cost[ tick ] = time() - when
+        self.times, self.cost = times, cost
+        raws = []
+        for i, cgroup in enumerate( self.cgroups ):
+            raw = { 'host': cgroup, 'times': times, 'usage': usage[ :, i ],
+                    'user': user[ :, i ], 'system': system[ :, i ],
+                    'percpu': percpu[ :, i ] }
+            if self.throttling:
+                raw.update( periods=throttle[ 0, :, i ],
+                            throttled=throttle[ 1, :, i ],
+                            throttledtime=throttle[ 2, :, i ] )
+            raws.append( raw )
+        return raws
+
+    def costSummary( self ):
+        """Return a dict describing the per-tick read cost (seconds) of
+           the last sample() and the number of missed ticks"""
+        if self.cost is None or not len( self.cost ):
+            return {}
+        return { 'ticks': len( self.cost ), 'missed': self.missed,
+                 'cgroups': len( self.cgroups ),
+                 'mean': float( self.cost.mean() ),
+                 'max': float( self.cost.max() ),
+                 'percgroup': float( self.cost.mean() ) /
+                              max( len( self.cgroups ), 1 ) }
+
+
+def chooseInterval( calibration, cpushare, target, maxcost=.01,
+                    shortest=.01, longest=None ):
+    """Return ( interval, error bound ): the shortest sampling interval
+       (s) whose relative error bound, for a cgroup that should get
+       cpushare CPU seconds per second, is within target, using
+       calibration from CgroupSampler.calibrate().
+       Over an interval T each value is off by up to one accounting
+       quantum q of CPU time and by the timer jitter j, so the bound is
+       ( q / cpushare + j ) / T.  T is also kept long enough that
+       sampling costs at most maxcost of one CPU, and within
+       [ shortest, longest ].  Returns ( None, None ) if calibration
+       saw no accounting updates."""
+    quantum = calibration[ 'quantum' ]
+    if not quantum or cpushare <= 0:
+        return None, None
+    slack = quantum / cpushare + calibration[ 'jitter' ]
+    interval = max( slack / target, calibration[ 'tickcost' ] / maxcost,
+                    shortest )
+    if longest:
+        interval = min( interval, longest )
+    return interval, slack / interval
+
+if __name__ == '__main__':
+    if len( sys.argv ) < 4:
+        sys.stderr.write( 'usage: %s seconds interval cgroups...\n' %
+                          sys.argv[ 0 ] )
+        sys.exit( 1 )
+    sampler = CgroupSampler( sys.argv[ 3: ] )
+    sampler.sample( float( sys.argv[ 1 ] ), float( sys.argv[ 2 ] ) )
+    sampler.close()
+    s = sampler.costSummary()
+    print( 'cgroup v%d, %d cgroups, %d ticks (%d missed): per tick '
+           'mean %.1f us, max %.1f us, %.2f us per cgroup' % (
+               sampler.version, s[ 'cgroups' ], s[ 'ticks' ], s[ 'missed' ],
+               1e6 * s[ 'mean' ], 1e6 * s[ 'max' ], 1e6 * s[ 'percgroup' ] ) )
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Accounting cgroup for the harness's own monitoring.
+
+Monitors -- cpumonitor, packetcount, the Python samplers, top
+pipelines and the quietRun() calls around them -- use CPU on the
+machine under test.  MonitorCgroup puts them in a cgroup of their own
+so that cost can be measured and reported with each run:
+
+    monitor = MonitorCgroup()
+    monitor.enter()         # the harness and everything it now forks
+    stats = quietRun( cpumonitor... )
+    cost = monitor.leave()  # { 'monitorcpu': s, 'monitortime': s }
+
+Processes started before enter() -- Mininet hosts, switches,
+stressors -- stay where they were.  Commands run inside a host (e.g.
+a top pipeline) can join the cgroup with the shell prefix from
+joinCommand().
+"""
+
+import os
+from time import time
+
+from CPUSampler import CGROUP_ROOT, cgroupVersion, statFields
+
+MONITOR_CGROUP = 'mnmonitor'
+
+
+class MonitorCgroup( object ):
+    "A CPU accounting cgroup for monitoring processes"
+
+    def __init__( self, name=MONITOR_CGROUP, root=CGROUP_ROOT ):
+        self.root = root
+        self.version = cgroupVersion( root )
+        if self.version == 1:
+            self.path = os.path.join( root, 'cpuacct', name )
+        else:
+            self.path = os.path.join( root, name )
+        if not os.path.isdir( self.path ):
+            os.mkdir( self.path )
+        self.procs = os.path.join( self.path, 'cgroup.procs' )
+        self.home = self.start = None
+
+    def usage( self ):
+        "Return the CPU time used in the cgroup so far, in seconds"
+        if self.version == 1:
+            f = open( os.path.join( self.path, 'cpuacct.usage' ) )
+            usage = 1e-9 * int( f.read() )
+        else:
+            f = open( os.path.join( self.path, 'cpu.stat' ) )
+            usage = 1e-6 * int( statFields( f.read() )[ 'usage_usec' ] )
+        f.close()
+        return usage
+
+    def _current( self ):
+        "Return the cgroup.procs file of our own current cgroup"
+        f = open( '/proc/self/cgroup' )
+        lines = f.read().split( '\n' )
+        f.close()
+        for line in lines:
+            fields = line.split( ':', 2 )
+            if len( fields ) < 3:
+                continue
+            if self.version == 1 and 'cpuacct' in fields[ 1 ].split( ',' ):
+                base = os.path.join( self.root, 'cpuacct' )
+                break
+            if self.version == 2 and fields[ 0 ] == '0':
+                base = self.root
+                break
+        else:
+            raise IOError( 'cannot find our cgroup in /proc/self/cgroup' )
+        return os.path.join( base, fields[ 2 ].lstrip( '/' ),
+                             'cgroup.procs' )
+
+    def _move( self, procs, pid=None ):
+        "Move pid (default: us) into the cgroup whose cgroup.procs is procs"
+        f = open( procs, 'w' )
+        f.write( '%d\n' % ( pid or os.getpid() ) )
+        f.close()
+
+    def enter( self ):
+        """Move the harness into the cgroup and start measuring; anything
+           it forks from now on is charged to the cgroup too"""
+        self.home = self._current()
+        self._move( self.procs )
+        self.start = time(), self.usage()
+
+    def leave( self ):
+        """Move the harness back to where it was; return the CPU time
+           (monitorcpu) used in the cgroup since enter(), and the wall
+           clock time (monitortime) it covers, both in seconds, or None
+           if we had already left"""
+        if self.home is None:
+            return None
+        now, usage = time(), self.usage()
+        self._move( self.home )
+        self.home = None
+        start, startusage = self.start
+        return { 'monitorcpu': round( usage - startusage, 9 ),
+                 'monitortime': round( now - start, 6 ) }
+
+    def joinCommand( self ):
+        """Return a shell prefix that moves the shell running it into
+           the cgroup, for monitors started in a host"""
+        return 'echo $$ > %s; ' % self.procs
+
+    def remove( self ):
+        "Remove the cgroup, if nothing is left in it"
+        try:
+            os.rmdir( self.path )
+        except OSError:
+            pass
+
+def monitorCgroup( warn=None, name=MONITOR_CGROUP ):
+    """Return a MonitorCgroup, or None (after calling warn( message ),
+       if given) if we can't create one, e.g. when not root"""
+    try:
+        return MonitorCgroup( name )
+    except ( IOError, OSError ) as e:
+        if warn:
+            warn( '*** No monitor cgroup (%s): monitor overhead will not '
+                  'be recorded\n' % e )
+        return None
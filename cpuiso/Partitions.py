@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""
+Run independent sweep points concurrently on disjoint sets of cores.
+
+A sweep point leaves most cores of a many-core machine idle.  Here the
+machine's cores are split into equal, disjoint partitions, and one
+child process per partition runs its share of the points:
+
+    jobs[ p::count ] run in partition p, on cores partitionCores()[ p ]
+
+Each child pins itself, and so every monitor it forks, to its cores
+(taskset), and its Mininet hosts get a unique name prefix and a cpuset
+of the same cores; nothing of one partition runs on another's cores.
+Children append to their own part file, and mergeParts() puts the
+records back into the output file in sweep order once all are done.
+
+Disjoint cpusets don't isolate everything -- caches, memory bandwidth
+and the cgroup accounting code are shared -- so a sweep also makes a
+control run: one point alone on an otherwise idle machine, repeated as
+the first point of partition 0 while the others are busy.
+interference() compares the two.
+"""
+
+import os
+import sys
+import traceback
+from heapq import merge
+from json import loads
+
+import numpy as np
+
+from mininet.util import quietRun, numCores
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib.resultfile import isBinary, readBinary, appendBinary
+
+# Largest acceptable increase, in percent of the target, in a point's
+# rms error when it shares the machine with the other partitions
+INTERFERENCE = 2.0
+
+def partitionCores( count, cores=None ):
+    """Split cores (default: all) into count equal, disjoint lists of
+       consecutive cores; leftover cores are not used"""
+    if cores is None:
+        cores = range( numCores() )
+    size = len( cores ) // count if count > 0 else 0
+    if size < 1:
+        raise ValueError( 'cannot split %d cores into %d partitions' %
+                          ( len( cores ), count ) )
+    return [ list( cores[ p * size: ( p + 1 ) * size ] )
+             for p in range( count ) ]
+
+def cpuset( cores ):
+    "Return a list of cores in cpuset/taskset form, e.g. '0-3,8'"
+    ranges, start = [], None
+    for i, core in enumerate( cores ):
+        if start is None:
+            start = core
+        if i + 1 == len( cores ) or cores[ i + 1 ] != core + 1:
+            ranges.append( str( start ) if start == core
+                           else '%d-%d' % ( start, core ) )
+            start = None
+    return ','.join( ranges )
+
+def pinSelf( cores ):
+    "Confine all our threads, and anything we fork, to cores"
+    quietRun( 'taskset -apc %s %d' % ( cpuset( cores ), os.getpid() ) )
+
+def partFile( outfile, p ):
+    "Return the name of partition p's part of outfile"
+    root, ext = os.path.splitext( outfile or '/tmp/cpuiso.out' )
+    return '%s.part%s%s' % ( root, p, ext )
+
+def forkPartitions( jobs, partitions, worker, outfile ):
+    """Run worker( p, cores, jobs, partfile ) for each partition p in a
+       child process of its own, on cores partitions[ p ], with jobs
+       dealt out round robin; wait for them all and return the part
+       files, with a list of the partitions that failed"""
+    count = len( partitions )
+    children = {}
+    for p, cores in enumerate( partitions ):
+        partfile = partFile( outfile, p )
+        if os.path.exists( partfile ):
+            os.remove( partfile )
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                pinSelf( cores )
+                worker( p, cores, jobs[ p::count ], partfile )
+            except:
+                traceback.print_exc()
+                status = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit( status )
+        children[ pid ] = p
+    failed = []
+    while children:
+        pid, status = os.wait()
+        p = children.pop( pid, None )
+        if p is not None and status:
+            failed.append( p )
+    return [ partFile( outfile, p ) for p in range( count ) ], sorted( failed )
+
+def partRecords( partfile ):
+    """Yield ( kind, record ) for the records of a part file: 'comment'
+       or 'run', and raw lines for JSON or objects for binary files; a
+       truncated last line (from a failed child) is ignored"""
+    if not os.path.exists( partfile ):
+        return
+    if isBinary( partfile ):
+        for kind, obj in readBinary( partfile, arrays=True ):
+            yield kind, obj
+        return
+    f = open( partfile )
+    for line in f:
+        if not line.endswith( '\n' ):
+            break
+        yield 'comment' if line[ 0 ] == '#' else 'run', line
+    f.close()
+
+def partBlocks( partfile, p, order ):
+    """Yield a part file's records in blocks, as ( key, records ): its
+       leading comments, then each run with the comments that follow it
+       (such as a stop decision for its point).  key sorts the blocks
+       into sweep order: order( run ) gives the place of the run's point
+       in the sweep, and repeated runs of a point take turns by
+       partition, as the jobs were dealt"""
+    seen = {}
+    key, block = ( 0, p ), []
+    for kind, record in partRecords( partfile ):
+        if kind == 'run':
+            if block:
+                yield key, block
+            run = record if isinstance( record, list ) else loads( record )
+            point = order( run )
+            seen[ point ] = seen.get( point, 0 ) + 1
+            key, block = ( 1, point, seen[ point ], p ), []
+        block.append( ( kind, record ) )
+    if block:
+        yield key, block
+
+def mergeParts( outfile, partfiles, order ):
+    """Append the part files' records to outfile (stdout if None) in
+       sweep order, where order( run ) gives the place of a run record's
+       point in the sweep, and remove them.  Each part file must already
+       be in sweep order; its runs may be spread over the sweep in any
+       way (e.g. --adaptive runs a point until it converges)"""
+    binary = outfile and isBinary( outfile )
+    out = None
+    if not binary:
+        out = open( outfile, 'a' ) if outfile else sys.stdout
+    parts = [ partBlocks( name, p, order )
+              for p, name in enumerate( partfiles ) ]
+    # Keys are unique, so merge() never compares the blocks themselves
+    for _key, block in merge( *parts ):
+        for kind, record in block:
+            if binary:
+                appendBinary( outfile, record, kind )
+            else:
+                out.write( record )
+    if outfile and out:
+        out.close()
+    for name in partfiles:
+        if os.path.exists( name ):
+            os.remove( name )
+
+def runError( run ):
+    """Return the rms error of a run record's CPU samples, in percent of
+       their target (cpulimit)"""
+    errors = [ np.asarray( h[ 'cpuvals' ], dtype=np.float64 ) -
+               h[ 'cpulimit' ] for h in run ]
+    errors = np.concatenate( errors )
+    return 100.0 * np.sqrt( np.mean( errors ** 2 ) ) / run[ 0 ][ 'cpulimit' ]
+
+def interference( control, concurrent, tolerance=INTERFERENCE ):
+    """Compare a point's control run, made alone, with the same point run
+       alongside the other partitions; return ( ok, description )"""
+    alone, shared = runError( control ), runError( concurrent )
+    ok = bool( shared - alone <= tolerance )
+    return ok, ( 'control run rms error %.2f%% alone, %.2f%% with all '
+                 'partitions busy: %s' % (
+                     alone, shared, 'ok' if ok else 'INTERFERENCE' ) )
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+"""
+Low-overhead /proc monitor for the processes under test.
+
+This replaces the per-host 'top -b -p PID | grep' pipelines of
+CPUIsolationLib.start_monitor_cpu: a single monitor finds the stress
+processes -- by cgroup membership or by scanning /proc -- opens each
+one's /proc/<pid>/stat, schedstat, status and sched files once, and
+re-reads them all on every tick (see CPUSampler.tickLoop) into
+preallocated arrays.  Ticks can be well under a second apart.
+
+Besides CPU time, this gives the scheduling latency that total CPU
+share hides: run-queue wait and delay per timeslice (schedstat),
+voluntary and involuntary context switches (status) and migrations
+(sched, or CPU changes between ticks where the kernel lacks it).
+
+The monitor measures its own cost: the wall-clock time of each tick's
+reads, and the CPU time its thread used over the whole run (as a
+percentage of one CPU), so its perturbation of the measurement can be
+reported with the results.
+
+Command line: monitor processes by name and print a summary
+
+    python ProcMonitor.py seconds interval [name]
+"""
+
+import os
+import sys
+import resource
+from time import time
+from threading import Thread
+
+import numpy as np
+
+from CPUSampler import CGROUP_ROOT, cgroupVersion, pread, tickLoop
+
+CLOCK_TICKS = os.sysconf( 'SC_CLK_TCK' )
+# The calling thread's /proc stat (Linux 3.17 and later)
+THREAD_STAT = '/proc/thread-self/stat'
+STRESS = 'cpu-stress'
+
+def procComm( pid ):
+    "Return the command name of pid, or None if it has gone"
+    try:
+        f = open( '/proc/%d/comm' % pid )
+        comm = f.read().strip()
+        f.close()
+        return comm
+    except ( IOError, OSError ):
+        return None
+
+def findPids( name=STRESS ):
+    "Return the pids, from a scan of /proc, whose command name is name"
+    pids = []
+    for entry in os.listdir( '/proc' ):
+        if entry.isdigit() and procComm( int( entry ) ) == name:
+            pids.append( int( entry ) )
+    return sorted( pids )
+
+def cgroupPids( cgroup, name=STRESS, root=CGROUP_ROOT ):
+    """Return the pids in cgroup (a Mininet host's cgroup is named after
+       the host) whose command name is name; all of them if name is None"""
+    if cgroupVersion( root ) == 1:
+        procs = os.path.join( root, 'cpuacct', cgroup, 'cgroup.procs' )
+    else:
+        procs = os.path.join( root, cgroup, 'cgroup.procs' )
+    f = open( procs )
+    pids = [ int( line ) for line in f if line.strip() ]
+    f.close()
+    return sorted( pid for pid in pids
+                   if name is None or procComm( pid ) == name )
+
+def hostPids( hosts, name=STRESS, root=CGROUP_ROOT ):
+    "Return { pid: host name } for the name processes of Mininet hosts"
+    labels = {}
+    for host in hosts:
+        host = getattr( host, 'name', host )
+        for pid in cgroupPids( host, name, root ):
+            labels[ pid ] = host
+    return labels
+
+def parseStat( data ):
+    "Return ( utime, stime, processor ) from a /proc/<pid>/stat line"
+    # The command name may contain spaces, so split after its ')'
+    fields = data[ data.rindex( b')' ) + 2: ].split()
+    return int( fields[ 11 ] ), int( fields[ 12 ] ), int( fields[ 36 ] )
+
+def cpuTime():
+    """Return ( seconds, scope ): the CPU time the calling thread has
+       used, and 'thread'.  Python 2 has no RUSAGE_THREAD, so we read
+       the thread's /proc stat instead; if the kernel lacks that too,
+       return the whole process's CPU time, and 'process'"""
+    if hasattr( resource, 'RUSAGE_THREAD' ):
+        usage = resource.getrusage( resource.RUSAGE_THREAD )
+        return usage.ru_utime + usage.ru_stime, 'thread'
+    try:
+        f = open( THREAD_STAT, 'rb' )
+        utime, stime, _processor = parseStat( f.read() )
+        f.close()
+        return float( utime + stime ) / CLOCK_TICKS, 'thread'
+    except ( IOError, OSError ):
+        usage = resource.getrusage( resource.RUSAGE_SELF )
+        return usage.ru_utime + usage.ru_stime, 'process'
+
+def procField( data, name ):
+    """Return the integer value of field name in a /proc/<pid>/status
+       ('name:  value') or /proc/<pid>/sched ('name  :  value') file"""
+    # Match whole field names: 'voluntary_ctxt_switches' is also the
+    # tail of 'nonvoluntary_ctxt_switches'
+    start = data.index( b'\n' + name ) + len( name ) + 1
+    return int( data[ data.index( b':', start ) + 1:
+                      data.index( b'\n', start ) ] )
+
+# Counters sampled per process per tick
+COUNTERS = ( 'user', 'system', 'run', 'wait', 'slices', 'vcsw', 'ivcsw',
+             'migrations', 'processor' )
+# Run-queue delay quantiles reported in each result
+QUANTILES = ( 0.5, 0.95, 0.99 )
+
+
+class ProcMonitor( object ):
+    """Sample /proc/<pid>/stat, schedstat, status and (where the kernel
+       has it) sched for a set of processes"""
+
+    def __init__( self, pids, labels=None ):
+        """pids: processes to monitor
+           labels: optional { pid: label }, e.g. from hostPids()"""
+        self.pids = list( pids )
+        self.labels = labels or {}
+        self.fds = []
+        try:
+            for pid in self.pids:
+                fds = [ os.open( '/proc/%d/%s' % ( pid, f ), os.O_RDONLY )
+                        for f in ( 'stat', 'schedstat', 'status' ) ]
+                self.fds.append( fds )
+                # Migration counts need CONFIG_SCHED_DEBUG
+                sched = '/proc/%d/sched' % pid
+                if os.path.exists( sched ):
+                    fds.append( os.open( sched, os.O_RDONLY ) )
+        except:
+            self.close()
+            raise
+        self.result = None
+        self.overhead = {}
+
+    def close( self ):
+        "Close all open /proc files"
+        for fds in self.fds:
+            for fd in fds:
+                os.close( fd )
+        self.fds = []
+
+    def _store( self, tick, c ):
+        "Store one tick of counters in c; processes that exit become NaN"
+        for i, fds in enumerate( self.fds ):
+            try:
+                c[ 'user' ][ tick, i ], c[ 'system' ][ tick, i ], \
+                    c[ 'processor' ][ tick, i ] = parseStat(
+                        pread( fds[ 0 ], 1024, 0 ) )
+                sched = pread( fds[ 1 ], 256, 0 ).split()
+                c[ 'run' ][ tick, i ] = int( sched[ 0 ] )
+                c[ 'wait' ][ tick, i ] = int( sched[ 1 ] )
+                c[ 'slices' ][ tick, i ] = int( sched[ 2 ] )
+                status = pread( fds[ 2 ], 4096, 0 )
+                c[ 'vcsw' ][ tick, i ] = procField(
+                    status, b'voluntary_ctxt_switches' )
+                c[ 'ivcsw' ][ tick, i ] = procField(
+                    status, b'nonvoluntary_ctxt_switches' )
+                if len( fds ) > 3:
+                    c[ 'migrations' ][ tick, i ] = procField(
+                        pread( fds[ 3 ], 8192, 0 ), b'se.nr_migrations' )
+            except ( OSError, IOError, ValueError, IndexError ):
+                for a in c.values():
+                    a[ tick, i ] = np.nan
+
+    def sample( self, seconds, interval ):
+        """Sample every interval seconds for seconds; return and keep in
+           self.result a list of per-process dicts (see series())"""
+        ticks = max( int( seconds / interval ), 2 )
+        n = len( self.pids )
+        times, cost = np.zeros( ticks ), np.zeros( ticks )
+        counters = dict( ( name, np.zeros( ( ticks, n ) ) )
+                         for name in COUNTERS )
+        missed = 0
+        used0, scope = cpuTime()
+        start = time()
+        for tick, missed in tickLoop( ticks, interval ):
+            when = time()
+            self._store( tick, counters )
+            times[ tick ] = when
+            cost[ tick ] = time() - when
+        elapsed = time() - start
+        # Monitor CPU time, as a percentage of one CPU; cpuscope says
+        # whether it is just our thread's or the whole process's
+        used = cpuTime()[ 0 ] - used0
+        self.overhead = { 'ticks': ticks, 'missed': missed, 'processes': n,
+                          'tickmean': float( cost.mean() ),
+                          'tickmax': float( cost.max() ),
+                          'cpupercent': 100.0 * used / elapsed,
+                          'cpuscope': scope }
+        if not all( len( fds ) > 3 for fds in self.fds ):
+            # No /proc/<pid>/sched: count the CPU changes we saw
+            counters[ 'migrations' ] = np.vstack( [
+                np.zeros( ( 1, n ) ),
+                np.cumsum( np.diff( counters[ 'processor' ], axis=0 ) != 0,
+                           axis=0 ) ] )
+        deltas = dict( ( name, np.diff( a, axis=0 ) )
+                       for name, a in counters.items() )
+        intervals = np.diff( times )
+        xvals = np.round( times[ 1: ] - times[ 0 ], 9 )
+        self.result = []
+        for i, pid in enumerate( self.pids ):
+            proc = series( xvals, intervals,
+                           dict( ( k, v[ :, i ] ) for k, v in deltas.items() ) )
+            proc.update( pid=pid, label=self.labels.get( pid ),
+                         processor=counters[ 'processor' ][ 1:, i ] )
+            self.result.append( proc )
+        return self.result
+
+    def background( self, seconds, interval ):
+        """Run sample() in a thread, e.g. alongside cpumonitor;
+           join() the returned thread, then read self.result"""
+        thread = Thread( target=self.sample, args=( seconds, interval ) )
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def byLabel( self ):
+        """Return { label: dict } with the series of each label's
+           processes combined (see series())"""
+        groups = {}
+        for proc in self.result or []:
+            groups.setdefault( proc[ 'label' ], [] ).append( proc )
+        ret = {}
+        for label, procs in groups.items():
+            deltas = dict( ( k, sum( p[ 'deltas' ][ k ] for p in procs ) )
+                           for k in procs[ 0 ][ 'deltas' ] )
+            ret[ label ] = series( procs[ 0 ][ 'xvals' ],
+                                   procs[ 0 ][ 'intervals' ], deltas )
+            ret[ label ][ 'pids' ] = [ p[ 'pid' ] for p in procs ]
+        return ret
+
+
+def series( xvals, intervals, deltas ):
+    """Return per-tick series from per-tick counter deltas:
+       xvals (s),
+       cpuvals (% of one CPU, as top reports, from schedstat run time),
+       uservals and systemvals (% of one CPU, from stat),
+       waitvals (% of the interval spent waiting on a run queue),
+       delayvals (mean run-queue delay per timeslice, ms; NaN for ticks
+       without timeslices or data),
+       vcswvals, ivcswvals (voluntary and involuntary context switches
+       per second), migrationvals (CPU migrations per second),
+       delaydist (delayvals quantiles QUANTILES and max), and the
+       deltas and intervals they came from"""
+    percent = lambda a, scale: np.round( 100.0 * scale * a / intervals, 2 )
+    rate = lambda a: np.round( a / intervals, 2 )
+    slices = deltas[ 'slices' ]
+    # Ticks with no timeslices, or no data (the process had exited),
+    # have no delay, and stay out of the quantiles
+    delay = np.divide( 1e-6 * deltas[ 'wait' ], slices,
+                       out=np.full_like( slices, np.nan ), where=slices > 0 )
+    valid = delay[ ~np.isnan( delay ) ]
+    dist = {}
+    if valid.size:
+        dist = dict( ( 'p%g' % ( 100 * q ), float( v ) ) for q, v in
+                     zip( QUANTILES, np.percentile( valid, [
+                         100 * q for q in QUANTILES ] ) ) )
+        dist[ 'max' ] = float( valid.max() )
+    return { 'xvals': xvals,
+             'cpuvals': percent( deltas[ 'run' ], 1e-9 ),
+             'uservals': percent( deltas[ 'user' ], 1.0 / CLOCK_TICKS ),
+             'systemvals': percent( deltas[ 'system' ], 1.0 / CLOCK_TICKS ),
+             'waitvals': percent( deltas[ 'wait' ], 1e-9 ),
+             'delayvals': np.round( delay, 6 ),
+             'vcswvals': rate( deltas[ 'vcsw' ] ),
+             'ivcswvals': rate( deltas[ 'ivcsw' ] ),
+             'migrationvals': rate( deltas[ 'migrations' ] ),
+             'delaydist': dist,
+             'deltas': deltas, 'intervals': intervals }
+
+if __name__ == '__main__':
+    if len( sys.argv ) < 3:
+        sys.stderr.write( 'usage: %s seconds interval [name]\n' %
+                          sys.argv[ 0 ] )
+        sys.exit( 1 )
+    name = sys.argv[ 3 ] if len( sys.argv ) > 3 else STRESS
+    pids = findPids( name )
+    if not pids:
+        sys.stderr.write( 'no %s processes found\n' % name )
+        sys.exit( 1 )
+    monitor = ProcMonitor( pids )
+    for proc in monitor.sample( float( sys.argv[ 1 ] ),
+                                float( sys.argv[ 2 ] ) ):
+        print( '%-8d cpu %6.2f%%  wait %6.2f%%  delay p99 %.3f ms  '
+               'csw %.1f/s  ivcsw %.1f/s  migrations %.1f/s' % (
+                   proc[ 'pid' ], np.nanmean( proc[ 'cpuvals' ] ),
+                   np.nanmean( proc[ 'waitvals' ] ),
+                   proc[ 'delaydist' ].get( 'p99', np.nan ),
+                   np.nanmean( proc[ 'vcswvals' ] ),
+                   np.nanmean( proc[ 'ivcswvals' ] ),
+                   np.nanmean( proc[ 'migrationvals' ] ) ) )
+    monitor.close()
+    o = monitor.overhead
+    print( 'monitor: %d processes, %d ticks (%d missed), per tick mean '
+           '%.1f us, max %.1f us; %.2f%% of one CPU' % (
+               o[ 'processes' ], o[ 'ticks' ], o[ 'missed' ],
+               1e6 * o[ 'tickmean' ], 1e6 * o[ 'tickmax' ],
+               o[ 'cpupercent' ] ) )
@@ -50,18 +50,25 @@ int bufcount = 0;
 int *statfd= NULL;
 int *usagefd= NULL;
 int *percpufd= NULL;
+int *throttlefd= NULL;
 
 /* Open cpuacct files for measuring cpu time */
 #define OLDCGROUP "/cgroup/%s/"
 #define CGROUP "/sys/fs/cgroup/cpuacct/%s/"
+/* CFS bandwidth (throttling) statistics, if the cpu controller has them */
+#define CPUCGROUP "/sys/fs/cgroup/cpu/%s/"
 void openstats(const char *cgroup, int index) {
     char usage_fname[100], stat_fname[100], percpu_fname[100];
+    char throttle_fname[100];
     sprintf(usage_fname, CGROUP "cpuacct.usage", cgroup);
     sprintf(stat_fname, CGROUP "cpuacct.stat", cgroup);
     sprintf(percpu_fname, CGROUP "cpuacct.usage_percpu", cgroup);
     usagefd[index] = open(usage_fname, O_RDONLY);
     statfd[index] = open(stat_fname, O_RDONLY);
     percpufd[index] = open(percpu_fname, O_RDONLY);
+    snprintf(throttle_fname, sizeof(throttle_fname), CPUCGROUP "cpu.stat",
+             cgroup);
+    throttlefd[index] = open(throttle_fname, O_RDONLY);
     if (statfd[index] < 0 || usagefd[index] < 0 || percpufd[index] < 0) {
         perror("could not open device and cpu stats files");
         exit(1);
@@ -126,6 +133,27 @@ void readstats(double when, const char *cgroup, int index) {
             bufcount += count;
         }
     }
+    // read throttling stats: optional, since not every cgroup has them
+    if (throttlefd[index] >= 0) {
+        assert(BUFSIZE - bufcount >= 0);
+        count = snprintf(buffer + bufcount,
+                         BUFSIZE - bufcount, "throttle ");
+        if (count < 0 || bufcount + count >= BUFSIZE) {
+            bufcount = BUFSIZE;
+            return;
+        }
+        bufcount += count;
+        count = 1;
+        lseek(throttlefd[index], 0, SEEK_SET);
+        while (count > 0 && bufcount < BUFSIZE) {
+            assert(BUFSIZE - bufcount >= 0);
+            count = read(throttlefd[index], buffer + bufcount,
+                         BUFSIZE - bufcount);
+            if (count > 0) {
+                bufcount += count;
+            }
+        }
+    }
     if ( bufcount >= BUFSIZE) {
         fprintf( stderr, "*** BUFFER FILLED - results may be truncated\n" );
     }
@@ -159,6 +187,7 @@ main(int argc, char *argv[]) {
     usagefd = malloc(sizeof(int) * num_cgroups);
     statfd = malloc(sizeof(int) * num_cgroups);
     percpufd = malloc(sizeof(int) * num_cgroups);
+    throttlefd = malloc(sizeof(int) * num_cgroups);
     for(i = 0; i < num_cgroups; i++) {
         openstats(argv[3+i], i);
     }
@@ -1,7 +1,11 @@
 
-import csv, pprint, numpy, sys
+import os, pprint, numpy, sys
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..'))
+from lib.csvarray import read_array
+
 import matplotlib as m
 m.use('SVG')
 import matplotlib.pyplot as plt
@@ -10,11 +14,10 @@ import matplotlib.pyplot as plt
 fields = ['timer', 'count', 'latency']
 MEG = 1e6
 def read_csv_file(fname):
-  f = open(fname,'r')
-  d = csv.DictReader(f, fieldnames=fields)
-  ret = list(d)
-  f.close()
-  return ret
+  """Return fname's timer, count and latency columns as float64 arrays,
+  by field name (memory-mapped from a cached sidecar, see csvarray)"""
+  data = read_array(fname)
+  return dict((f, data[:, i]) for i, f in enumerate(fields))
 
 def save_plot(values, t, fname):
   plt.figure()
@@ -35,14 +38,12 @@ def save_plot(values, t, fname):
   plt.clf()
 
 def stats(data):
-  timers = set(int(r['timer']) for r in data)
   ret = []
-  for t in sorted(timers):
+  for t in np.unique(data['timer']).astype(int).tolist():
     stat = {}
-    # damn slow, but doesnt matter
-    counts = [int(r['count']) for r in data if int(r['timer']) == t]
-    latencies = [float(r['latency']) for r in data if int(r['timer']) == t]
-    latencies = map(lambda x: x / (t / MEG), latencies)
+    rows = data['timer'] == t
+    counts = data['count'][rows]
+    latencies = data['latency'][rows] / (t / MEG)
     
     save_plot(latencies, t, "latency_%d.svg" % t)
 
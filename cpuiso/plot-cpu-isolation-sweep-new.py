@@ -3,23 +3,28 @@
 Accumulate results and calculate variance
 """
 
-import plot_defaults
-
-import fileinput
 from math import sqrt
-from json import loads, dumps
+from json import dumps
 from optparse import OptionParser
-from sys import exit
+from sys import exit, path
 from operator import and_, add
 import os
 import re
 
-# We use python-matplotlib and numpy for graphing
-import matplotlib as mpl
-import matplotlib.pyplot as plt
+path.append( '..' )
+
+# We use python-matplotlib and numpy for graphing; pyplot (and our
+# plot defaults) are only imported once we actually draw something
 import numpy as np
+from lib.lazyplot import pyplot
+plt = pyplot( 'lib.plot_defaults' )
 
 from CPUIsolationLib import intListCallback
+from lib.render import ( formatListCallback, saveFigure, figureJob,
+                         renderJobs, reportJobs )
+from lib.plotcache import PlotCache, cacheKey
+from lib.resultfile import readRecords
+from lib.plot import plotCDF
 
 FONTSIZE = 12 
 
@@ -210,6 +215,91 @@ def dumpResults( results ):
                 print "time:", host[ 'xvals' ]
 
 
+def throttleStats( run ):
+    """Return CFS throttling for a run: the percentage of bandwidth
+       periods throttled, over all hosts, and the mean time each host
+       was throttled in ms per second; ( None, None ) if the run has no
+       throttling stats"""
+    if not all( 'nr_periods' in r for r in run ):
+        return None, None
+    periods = sum( r[ 'nr_periods' ] for r in run )
+    throttled = sum( r[ 'nr_throttled' ] for r in run )
+    ratio = 100.0 * throttled / periods if periods else 0.0
+    thrtime = [ 1000.0 * v for r in run for v in r[ 'throttledvals' ] ]
+    return ratio, sum( thrtime ) / len( thrtime ) if thrtime else 0.0
+
+def delays( run ):
+    """Return the run-queue delays per timeslice (ms) of all of a run's
+       hosts, if it was run with a process monitor (CPUIsolationSweep
+       --procmon)"""
+    return [ d for r in run for d in r.get( 'procdelayvals', [] )
+             if d == d ]
+
+def plotLatency( plotopts, results ):
+    "Plot the CDF of run-queue delay per timeslice for each configuration"
+    lines = []
+    for opts, runs in results:
+        static = 'static' if opts['static'] else 'dyn'
+        configs = {}
+        for run in runs:
+            hosts = len( run )
+            util = ( float( run[0]['cpulimit'] ) * hosts /
+                     run[0]['cpucount'] * 100.0 )
+            label = "%sp*%.0f%%/%sh-%s-%s" % (
+                run[0]['cpucount'], util, hosts, opts['sched'], static )
+            configs.setdefault( label, [] ).extend( delays( run ) )
+        for label in sorted( configs ):
+            if configs[ label ]:
+                lines.append( { 'y': configs[ label ], 'label': label } )
+    if not lines:
+        print 'No process monitor data (run CPUIsolationSweep --procmon)'
+        return
+    plotCDF( lines, 'Mininet: ' + str( plotopts.args ),
+             'run-queue delay per timeslice (ms)', 'fraction', step=False )
+    if not plotopts.nolegend:
+        plt.legend( loc='lower right' )
+    savePlot( plotopts, 'latency' )
+
+def plotThrottle( plotopts, results ):
+    "Plot each host's CFS throttle ratio over time"
+    fig = plt.figure( 2 )
+    fig.canvas.set_window_title( 'Mininet: ' +
+                                str( plotopts.args ) )
+    ax = fig.add_subplot( 111 )
+    colors = {}
+    cgen = colorGenerator()
+    for opts, runs in results:
+        sched = opts['sched']
+        static = 'static' if opts['static'] else 'dyn'
+        for run in runs:
+            hosts = len( run )
+            for r in run:
+                if 'throttlevals' not in r:
+                    continue
+                util = ( float( r['cpulimit'] ) * hosts / r['cpucount'] *
+                         100.0 )
+                label = "%sp*%.0f%%/%sh-%s-%s" % (
+                    r['cpucount'], util, hosts, sched, static )
+                color, label = linkLegend( cgen, colors, label )
+                ax.plot( r['xvals'], [ 100.0 * v for v in r['throttlevals'] ],
+                         '-', color=color, label=label, linewidth=1 )
+    plt.title( 'CFS throttling per host' )
+    plt.ylabel( 'throttled periods (%)' )
+    plt.xlabel( 'time (s)' )
+    plt.grid()
+    if not plotopts.nolegend:
+        plt.legend()
+    savePlot( plotopts, 'throttle' )
+
+def monitorOverhead( run ):
+    """Return the monitors' CPU use during a run as a percentage of
+       the whole machine, or None if it wasn't recorded"""
+    host = run[ 0 ]
+    if not host.get( 'monitortime' ):
+        return None
+    return ( 100.0 * host[ 'monitorcpu' ] /
+             ( host[ 'monitortime' ] * int( host[ 'cpucount' ] ) ) )
+
 def table( plotopts, results, tex=False):
     "Print table of sample mean, min and max"
 
@@ -221,13 +311,13 @@ def table( plotopts, results, tex=False):
             
     format = ("%-7s  %-5s  %-6s  "
               # "%-6s  %-6s  " 
-              "%-6s  %-6s  %-6s" )
+              "%-6s  %-6s  %-6s  %-6s  %-6s  %-6s  %-6s" )
     headings = ('sched', 'util', 'goal',
                 'mean', 'maxerr', 
                 # 'maxerr%', 
                 #'rmserr', 
-                'rmserr')
-    units= ('', '', 'cpu%', 'cpu%', 'cpu%', '%' )
+                'rmserr', 'thrott', 'thrtime', 'dly99', 'monov')
+    units= ('', '', 'cpu%', 'cpu%', 'cpu%', '%', '%', 'ms/s', 'ms', '%' )
     
     dashes = tuple( [ re.sub('.', '-', h) for h in headings ] )
     
@@ -293,6 +383,9 @@ def table( plotopts, results, tex=False):
             r_err_pct = r_err/cpulimit * 100.0
             r_rmse = rmse( samples, cpulimit )
             r_rmse_pct = r_rmse/cpulimit * 100.0
+            r_thr, r_thrtime = throttleStats( run )
+            r_delay = delays( run )
+            r_monov = monitorOverhead( run )
             # Output
             output( format % (
                             sched, '%.0f%%' % util ,
@@ -301,7 +394,13 @@ def table( plotopts, results, tex=False):
                             '%.2f' % r_err,
                             # '%.1f%%' % r_err_pct,
                             #% '%.2f' % r_rmse,
-                            '%.1f' % r_rmse_pct ) )
+                            '%.1f' % r_rmse_pct,
+                            '-' if r_thr is None else '%.1f' % r_thr,
+                            '-' if r_thrtime is None else
+                            '%.1f' % r_thrtime,
+                            '%.2f' % np.percentile( r_delay, 99 )
+                            if len( r_delay ) else '-',
+                            '-' if r_monov is None else '%.2f' % r_monov ) )
             sched = ''
         if tex:
             print '  \hline'
@@ -529,7 +628,8 @@ def dictPlot( d, barchart=True, label='run', **plotargs ):
 def readData( files ):
     """Read input data from CPUIsolationSweep run
     
-    Each run generates a file, which is a set of lines with:
+    Each run generates a file (JSON lines or binary, see
+    lib/resultfile.py) with:
     - a comment
     - a dict of params
     - a list of experiment results
@@ -539,12 +639,9 @@ def readData( files ):
     all_results = []
     for file in files:
         results = []
-        for line in fileinput.input( file ):
-            if line[ 0 ] == '#':
-                continue
-            data = loads( line )
+        for data in readRecords( file ):
             if type( data ) == dict:
-                opts = loads(line)
+                opts = data
             elif type( data ) == list:
                 results.append(data)
         all_results.append((opts, results))
@@ -556,9 +653,9 @@ def savePlot(opts, plot_name):
         return
     file_prefix = (os.path.splitext(os.path.basename(opts.args[0]))[0] 
                     if opts.prefix == '' else opts.prefix)
-    fname = '%s/%s_%s.png' % (opts.dir, file_prefix, plot_name)
-    print 'Saving plot to %s' % fname
-    plt.savefig(fname)
+    basename = '%s/%s_%s' % (opts.dir, file_prefix, plot_name)
+    print 'Saving plot to %s.{%s}' % (basename, ','.join(opts.formats))
+    saveFigure(plt.gcf(), basename, opts.formats)
 
 def parseOptions():
     "Parse command line options"
@@ -571,7 +668,8 @@ def parseOptions():
                       help='custom prefix for saved figures' )
     parser.add_option( '-t', '--type',
                       type='string', default='lines', 
-                      help='plot type [box|lines|time]' )
+                      help='plot type(s), comma-separated '
+                           '[box|lines|time|throttle|latency|table|tex]' )
     parser.add_option( '-m', '--metric',
                       type='string', default='sigma', 
                       help='metric to plot [sigma|cv]' )
@@ -592,6 +690,21 @@ def parseOptions():
         action='callback', callback=intListCallback, default=[],
         type='string',
         help='specify pair counts, e.g. 10,20,40' )
+    parser.add_option( '-f', '--formats', dest='formats',
+        action='callback', callback=formatListCallback, default=[ 'png' ],
+        type='string',
+        help='figure formats to save with --dir, e.g. pdf,png,svg' )
+    parser.add_option( '-j', '--jobs', dest='jobs',
+                      type='int', default=0,
+                      help='parallel rendering processes with --dir '
+                           '(default: one per core)' )
+    parser.add_option( '--cache', dest='cache',
+                      type='string', default='',
+                      help='reuse parsed data and unchanged figures '
+                           'from cache directory "cache"' )
+    parser.add_option( '--cachemb', dest='cachemb',
+                      type='int', default=1024,
+                      help='plot cache size limit in MB (1024)' )
     ( options, args ) = parser.parse_args()
     plotFlags = [ 'var', 'series']
     if options.prefix != '' and options.dir == '':
@@ -603,21 +716,36 @@ def parseOptions():
 if __name__ == '__main__':
     plotopts, args = parseOptions()
     plotopts.args = args
-    all_results = readData( files=args )
+    cache = None
+    if plotopts.cache:
+        cache = PlotCache( plotopts.cache, plotopts.cachemb << 20 )
+        all_results = cache.memoize( cacheKey( args, func=readData ),
+                                     lambda: readData( files=args ) )
+    else:
+        all_results = readData( files=args )
     dumpResults( all_results )
 
-    if plotopts.type == 'box':
-        plotVariance( plotopts, all_results )
-    elif plotopts.type == 'time':
-        plotIntervals( plotopts, all_results )
-    elif plotopts.type == 'lines':
-        plotAllVariances( plotopts, all_results )
-    elif plotopts.type == 'table':
+    plots = { 'box': plotVariance, 'time': plotIntervals,
+              'lines': plotAllVariances, 'throttle': plotThrottle,
+              'latency': plotLatency }
+    types = plotopts.type.split( ',' )
+    for t in types:
+        if t not in plots and t not in ( 'table', 'tex' ):
+            raise Exception("unknown plot type")
+    if 'table' in types:
         table( plotopts, all_results )
-    elif plotopts.type == 'tex':
+    if 'tex' in types:
         table( plotopts, all_results, tex=True )
+    figures = [ t for t in types if t in plots ]
+    if plotopts.dir != '':
+        jobs = [ figureJob( t, plots[ t ], ( plotopts, all_results ),
+                            key=cache and cacheKey( args, plotopts,
+                                                    plots[ t ],
+                                                    volatile=( 'type', ) ) )
+                 for t in figures ]
+        reportJobs( renderJobs( jobs, plotopts.jobs, cache ) )
     else:
-        raise Exception("unknown plot type")
-    if(plotopts.dir == ''):
-        plt.show()
-
+        # Plots share figure 2, so show them one at a time
+        for t in figures:
+            plots[ t ]( plotopts, all_results )
+            plt.show()
@@ -1,18 +1,23 @@
 #!/usr/bin/python
 
-import fileinput
 from math import sqrt
-from json import loads
 from optparse import OptionParser
-from sys import exit
+from sys import exit, path
 from operator import and_, add
 import os
 import re
 
-# We use python-matplotlib and numpy for graphing
-import matplotlib as mpl
-import matplotlib.pyplot as plt
+path.append( '..' )
+
+# We use python-matplotlib and numpy for graphing; pyplot is only
+# imported once we actually draw something
 import numpy as np
+from lib.lazyplot import pyplot
+from lib.render import ( formatListCallback, saveFigure, figureJob,
+                         renderJobs, reportJobs )
+from lib.resultfile import readRecords
+
+plt = pyplot()
 
 # Accumulate results and calculate variance
 
@@ -399,6 +404,14 @@ def parseOptions():
     parser.add_option( '-z', '--zoom', dest='zoom',
                       default=False, action='store_true',
                       help='use zoomed rather than fixed y axis')
+    parser.add_option( '-f', '--formats', dest='formats',
+        action='callback', callback=formatListCallback, default=[ 'png' ],
+        type='string',
+        help='figure formats to save with --dir, e.g. pdf,png,svg' )
+    parser.add_option( '-j', '--jobs', dest='jobs',
+                      type='int', default=0,
+                      help='parallel rendering processes with --dir '
+                           '(default: one per core)' )
     
     ( options, args ) = parser.parse_args()
     plotFlags = [ 'var', 'series']
@@ -419,10 +432,7 @@ def readData( files ):
     "Read input data from pair_intervals run"
     results = []
     opts, entries = {}, []
-    for line in fileinput.input( files ):
-        if line[ 0 ] == '#':
-            continue
-        data = loads( line )
+    for data in ( d for f in files for d in readRecords( f ) ):
         if type( data ) == dict:
             if entries:
                 results.append( (opts, entries ) )
@@ -438,23 +448,30 @@ def savePlot(opts, plot_name):
     if(opts.dir == ''):
         return
     file_prefix = os.path.splitext(os.path.basename(opts.args[0]))[0] if opts.prefix == '' else opts.prefix
-    fname = '%s/%s-%s.png' % (opts.dir, file_prefix, plot_name)
-    print 'Saving plot to %s' % fname
-    plt.savefig(fname)
+    basename = '%s/%s-%s' % (opts.dir, file_prefix, plot_name)
+    print 'Saving plot to %s.{%s}' % (basename, ','.join(opts.formats))
+    saveFigure(plt.gcf(), basename, opts.formats)
 
     
 if __name__ == '__main__':
     plotopts, args = parseOptions()
     plotopts.args = args
     results = readData( files=args )
-    if plotopts.series:
-        plotIntervals( plotopts, results )
-    if plotopts.var:
-        plotVariance( plotopts, results )
     if plotopts.table:
         table( plotopts, results )
     if plotopts.tex:
         table( plotopts, results, tex=True )
-    if (plotopts.dir == '' and (plotopts.series or plotopts.var)):
+    figures = []
+    if plotopts.series:
+        figures.append( figureJob( 'series', plotIntervals,
+                                   ( plotopts, results ) ) )
+    if plotopts.var:
+        figures.append( figureJob( 'var', plotVariance,
+                                   ( plotopts, results ) ) )
+    if plotopts.dir != '':
+        reportJobs( renderJobs( figures, plotopts.jobs ) )
+    elif figures:
+        for name, func, args, basename, formats in figures:
+            func( *args )
         plt.show()
 
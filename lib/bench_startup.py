@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Startup-time benchmark and guard for the analysis libraries.
+
+For each module, time a fresh interpreter that imports it (minus the
+time of a bare interpreter) and check that matplotlib was *not*
+imported as a side effect.  Exits non-zero if any module pulls in
+matplotlib or costs more than --max-ms to import, so it can run as a
+guard in scripted pipelines:
+
+    cd microbench; python lib/bench_startup.py --runs 10 --max-ms 300
+"""
+
+import os
+import sys
+import subprocess
+from optparse import OptionParser
+from time import time
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+# Modules that analysis tools import and that must not load matplotlib
+MODULES = [ 'lib.helper', 'lib.stats', 'lib.sketch', 'lib.smoothing',
+            'lib.csvarray', 'lib.topcpu', 'lib.columns', 'lib.plot',
+            'lib.lazyplot', 'lib.render', 'lib.plotcache',
+            'lib.resultfile', 'lib.resultindex' ]
+
+# Exit status for "imported matplotlib"; import errors exit with 1
+HEAVY = 3
+CHECK = ( "import sys; sys.path.insert(0, %r); %s"
+          "sys.exit(%d if 'matplotlib' in sys.modules else 0)" )
+
+def timeImport( module, runs ):
+    "Return (best seconds, exit status) for importing module"
+    stmt = 'import %s; ' % module if module else ''
+    cmd = [ sys.executable, '-c', CHECK % ( ROOT, stmt, HEAVY ) ]
+    best, status = None, 0
+    for _ in range( runs ):
+        start = time()
+        status = subprocess.call( cmd ) or status
+        elapsed = time() - start
+        best = elapsed if best is None else min( best, elapsed )
+    return best, status
+
+def parseOptions():
+    "Parse command line options"
+    parser = OptionParser()
+    parser.add_option( '-r', '--runs', type='int', default=5,
+                       help='runs per module; the best is reported (5)' )
+    parser.add_option( '-m', '--max-ms', dest='maxms', type='float',
+                       default=300.0,
+                       help='import budget per module in ms, over a bare '
+                            'interpreter (300)' )
+    options, args = parser.parse_args()
+    options.modules = args or MODULES
+    return options
+
+def main():
+    opts = parseOptions()
+    base, _ = timeImport( None, opts.runs )
+    print( '%-16s %8s  %s' % ( 'module', 'ms', 'status' ) )
+    print( '%-16s %8.1f' % ( '(interpreter)', 1000 * base ) )
+    failed = False
+    for module in opts.modules:
+        seconds, code = timeImport( module, opts.runs )
+        ms = 1000 * ( seconds - base )
+        status = 'ok'
+        if code == HEAVY:
+            status = 'FAIL: imports matplotlib'
+        elif code:
+            status = 'FAIL: import error'
+        elif ms > opts.maxms:
+            status = 'FAIL: over %.0f ms budget' % opts.maxms
+        failed = failed or status != 'ok'
+        print( '%-16s %8.1f  %s' % ( module, ms, status ) )
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,133 @@
+"""A lightweight columnar results table.
+
+Table holds named, equal-length NumPy columns, so column access is a
+dict lookup instead of a pass over every row (cf. helper.col,
+helper.transpose).  Numeric columns are float64; anything else is kept
+as an object array.
+"""
+
+import numpy as np
+
+
+def _column(values):
+    "Return values as a float64 array if possible, else an object array"
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        a = np.empty(len(values), dtype=object)
+        a[:] = list(values)
+        return a
+
+
+class Table(object):
+    "Named, NumPy-backed columns of equal length"
+
+    def __init__(self, columns, names=None):
+        self.names = list(names if names is not None else sorted(columns))
+        self.columns = dict((n, _column(columns[n])) for n in self.names)
+        lengths = set(len(c) for c in self.columns.values())
+        if len(lengths) > 1:
+            raise ValueError('Table: columns have different lengths %s'
+                             % sorted(lengths))
+
+    @classmethod
+    def from_rows(cls, rows, names=None):
+        """Build a table from a list of lists/tuples (columns named by
+        names, or 0..n-1) or a list of dicts (columns named by key;
+        missing keys become None)"""
+        rows = list(rows)
+        if rows and isinstance(rows[0], dict):
+            if names is None:
+                names = sorted(set().union(*[r.keys() for r in rows]))
+            cols = dict((n, [r.get(n) for r in rows]) for n in names)
+        else:
+            if names is None:
+                names = list(range(len(rows[0]) if rows else 0))
+            cols = dict((n, [r[i] for r in rows])
+                        for i, n in enumerate(names))
+        return cls(cols, names)
+
+    @classmethod
+    def from_hosts(cls, run, series=('xvals', 'cpuvals'), scalars=None):
+        """Build a long-form table from one run of parse_cpuacct output
+        (a list of per-host dicts): one row per (host, sample), with a
+        'host' index column, the given series columns and every scalar
+        field of the host dicts (e.g. cpulimit, cpucount)"""
+        if scalars is None:
+            scalars = sorted(k for k in run[0] if k not in series
+                             and np.ndim(run[0][k]) == 0) if run else []
+        lengths = [min(len(h[s]) for s in series) for h in run]
+        cols = {'host': np.repeat(np.arange(len(run)), lengths)}
+        for s in series:
+            cols[s] = np.concatenate([np.asarray(h[s][:l], dtype=np.float64)
+                                      for h, l in zip(run, lengths)])
+        for k in scalars:
+            cols[k] = np.repeat([h[k] for h in run], lengths)
+        return cls(cols, ['host'] + list(series) + list(scalars))
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __repr__(self):
+        return 'Table(%d rows: %s)' % (len(self), ', '.join(map(str, self.names)))
+
+    def add(self, name, values):
+        "Add or replace a column"
+        values = _column(values)
+        if self.names and len(values) != len(self):
+            raise ValueError('Table.add: column %s has %d rows, not %d'
+                             % (name, len(values), len(self)))
+        if name not in self.columns:
+            self.names.append(name)
+        self.columns[name] = values
+
+    def take(self, index):
+        "Return a new table with the rows selected by index or mask"
+        return Table(dict((n, c[index]) for n, c in self.columns.items()),
+                     self.names)
+
+    def filter(self, cond):
+        """Return the rows where cond is true; cond is a boolean array
+        or a function of this table returning one"""
+        mask = cond(self) if callable(cond) else cond
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def groupby(self, *names):
+        """Return a list of (key, Table) pairs, in sorted key order.
+        key is a scalar for one name, a tuple for several."""
+        if not len(self):
+            return []
+        keys = [np.unique(self.columns[n], return_inverse=True)
+                for n in names]
+        codes = np.zeros(len(self), dtype=np.int64)
+        for uniq, inv in keys:
+            codes = codes * len(uniq) + inv.ravel()
+        order = np.argsort(codes, kind='mergesort')
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        ret = []
+        for index in np.split(order, bounds):
+            key = tuple(uniq[inv[index[0]]] for uniq, inv in keys)
+            ret.append((key[0] if len(names) == 1 else key,
+                        self.take(index)))
+        return ret
+
+    def aggregate(self, by, funcs):
+        """Group by the names in by and apply funcs ({column: function})
+        to each group; returns a new table with one row per group"""
+        by = [by] if not isinstance(by, (list, tuple)) else list(by)
+        rows = []
+        for key, group in self.groupby(*by):
+            key = key if len(by) > 1 else (key,)
+            rows.append(list(key) + [f(group[c]) for c, f in
+                                     sorted(funcs.items())])
+        return Table.from_rows(rows, by + sorted(funcs))
+
+    def rows(self):
+        "Iterate over rows as tuples, in column order"
+        return zip(*[self.columns[n] for n in self.names])
@@ -0,0 +1,126 @@
+"""Chunked, typed CSV reading with a memory-mapped binary cache.
+
+This is the array counterpart of helper.read_list: cells that are empty
+or just 'ms' or 's' (after stripping) become 0, exactly as read_list
+does, but rows come back as float64 NumPy arrays, a chunk at a time,
+instead of lists of strings.  Rows shorter than the widest row in a
+chunk, and cells that are not numbers, are filled with NaN.
+
+read_array() caches the parsed file in a .npy sidecar next to it and
+memory-maps that on later loads; the sidecar is rebuilt whenever the
+CSV is newer than it.
+"""
+
+import os
+import re
+import tempfile
+from itertools import islice
+
+import numpy as np
+
+CHUNKLINES = 1 << 16
+
+def _cleaner(delim):
+    "Return a function that zeroes empty/'ms'/'s' cells in a block of text"
+    d = re.escape(delim)
+    # Padding is blanks other than the delimiter, or a tab-separated
+    # file's empty cells would be swallowed
+    pad = '[%s]*' % ''.join(re.escape(c) for c in ' \t\r' if c not in delim)
+    empty = re.compile(r'(?m)(^|%s)%s(?:ms|s)?%s(?=%s|$)' % (d, pad, pad, d))
+    return lambda text: empty.sub(r'\g<1>0', text)
+
+def _tofloat(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
+
+def _parse(rows):
+    "Convert a list of lists of strings to a 2D float64 array"
+    try:
+        return np.array(rows, dtype=np.float64)
+    except ValueError:
+        pass
+    # Ragged rows or non-numeric cells: fill with NaN
+    width = max(len(r) for r in rows)
+    ret = np.full((len(rows), width), np.nan)
+    for i, r in enumerate(rows):
+        ret[i, :len(r)] = [_tofloat(c) for c in r]
+    return ret
+
+def read_chunks(fname, delim=',', chunklines=CHUNKLINES):
+    """Yield the file as 2D float64 arrays of up to chunklines rows.
+    Column i of a chunk is chunk[:, i]."""
+    clean = _cleaner(delim)
+    f = open(fname, 'r')
+    try:
+        while True:
+            lines = list(islice(f, chunklines))
+            if not lines:
+                break
+            text = ''.join(lines)
+            if text.endswith('\n'):
+                text = text[:-1]
+            text = clean(text)
+            yield _parse([l.split(delim) for l in text.splitlines()])
+    finally:
+        f.close()
+
+def sidecar_name(fname, delim=','):
+    "Return the cache file name for fname parsed with delim"
+    if delim == ',':
+        return fname + '.npy'
+    return '%s.%02x.npy' % (fname, ord(delim[0]))
+
+def _fresh(fname, cache):
+    return (os.path.exists(cache) and
+            os.path.getmtime(cache) >= os.path.getmtime(fname))
+
+def build_sidecar(fname, delim=',', chunklines=CHUNKLINES):
+    """Parse fname chunk by chunk into its .npy sidecar and return the
+    sidecar name.  Memory use is bounded by one chunk; the sidecar is
+    written under a temporary name and renamed into place."""
+    cache = sidecar_name(fname, delim)
+    dirname = os.path.dirname(os.path.abspath(cache))
+    fd, raw = tempfile.mkstemp(dir=dirname, suffix='.raw')
+    shapes = []
+    try:
+        rawf = os.fdopen(fd, 'wb')
+        for chunk in read_chunks(fname, delim, chunklines):
+            chunk.tofile(rawf)
+            shapes.append(chunk.shape)
+        rawf.close()
+        rows = sum(s[0] for s in shapes)
+        width = max([s[1] for s in shapes] or [0])
+        tmp = cache + '.tmp'
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64,
+                                        shape=(rows, width))
+        rawf = open(raw, 'rb')
+        start = 0
+        for r, w in shapes:
+            block = np.fromfile(rawf, dtype=np.float64, count=r * w)
+            out[start:start + r, :w] = block.reshape(r, w)
+            out[start:start + r, w:] = np.nan
+            start += r
+        rawf.close()
+        out.flush()
+        del out
+        os.rename(tmp, cache)
+    finally:
+        os.remove(raw)
+    return cache
+
+def read_array(fname, delim=',', cache=True):
+    """Return the whole file as a 2D float64 array.
+    With cache=True the result is a read-only memmap of the sidecar,
+    which is (re)built first if it is missing or stale."""
+    if not cache:
+        chunks = list(read_chunks(fname, delim))
+        width = max([c.shape[1] for c in chunks] or [0])
+        return np.vstack([np.hstack([c, np.full((c.shape[0],
+                                                 width - c.shape[1]), np.nan)])
+                          for c in chunks] or [np.empty((0, 0))])
+    sidecar = sidecar_name(fname, delim)
+    if not _fresh(fname, sidecar):
+        build_sidecar(fname, delim)
+    return np.load(sidecar, mmap_mode='r')
@@ -1,16 +1,17 @@
+# Numeric helpers only: keep this module free of matplotlib so that
+# analysis tools start fast.  Plotting lives in lib.plot (lazy pyplot).
 import re
 import itertools
-import matplotlib as m
 import os
-if os.uname()[0] == "Darwin":
-    m.use("MacOSX")
-#else:
-#    m.use("Agg")
-import matplotlib.pyplot as plt
 import argparse
 import math
+from lib.stats import avg, stdev, pc95, pc99, coeff_variation, cdf
+from lib.topcpu import parse_top_cpus, aggregate, IDLE
 
 def read_list(fname, delim=','):
+    """Return rows of fname as lists of strings.
+    For large files use lib.csvarray (read_chunks/read_array), which
+    applies the same cleaning rules but returns float64 arrays."""
     lines = open(fname).xreadlines()
     ret = []
     for l in lines:
@@ -36,6 +37,8 @@ def col(n, obj = None, clean = lambda e: e):
     col(n, [ [...], [...], ... ] => returns the nth column in this matrix
     col('blah', { ... }) => returns the blah-th value in the dict
     col(n) => partial function, useful in maps
+
+    For repeated column access over large results, see lib.columns.Table.
     """
     if obj == None:
         def f(item):
@@ -48,23 +51,15 @@ def col(n, obj = None, clean = lambda e: e):
         try:
             return clean(obj[n])
         except:
-            print T.colored('col(...): column "%s" not found!' % (n), 'red')
+            print 'col(...): column "%s" not found!' % (n)
             return None
     # We wouldn't know what to do here, so just return None
-    print T.colored('col(...): column "%s" not found!' % (n), 'red')
+    print 'col(...): column "%s" not found!' % (n)
     return None
 
 def transpose(l):
     return zip(*l)
 
-def avg(lst):
-    return sum(map(float, lst)) / len(lst)
-
-def stdev(lst):
-    mean = avg(lst)
-    var = avg(map(lambda e: (e - mean)**2, lst))
-    return math.sqrt(var)
-
 def xaxis(values, limit):
     l = len(values)
     return zip(*map(lambda (x,y): (x*1.0*limit/l, y), enumerate(values)))
@@ -74,50 +69,13 @@ def grouper(n, iterable, fillvalue=None):
     args = [iter(iterable)] * n
     return itertools.izip_longest(fillvalue=fillvalue, *args)
 
-def cdf(values):
-    values.sort()
-    prob = 0
-    l = len(values)
-    x, y = [], []
-
-    for v in values:
-        prob += 1.0 / l
-        x.append(v)
-        y.append(prob)
-
-    return (x, y)
-
-def parse_cpu_usage(fname, nprocessors=8):
+def parse_cpu_usage(fname, nprocessors=None):
     """Returns (user,system,nice,iowait,hirq,sirq,steal) tuples
-	aggregated over all processors.  DOES NOT RETURN IDLE times."""
-
-    data = grouper(nprocessors, open(fname).readlines())
-
-    """Typical line looks like:
-    Cpu0  :  0.0%us,  1.0%sy,  0.0%ni, 97.0%id,  0.0%wa,  0.0%hi,  2.0%si,  0.0%st
-    """
-    ret = [] 
-    for collection in data:
-        total = [0]*8
-        for cpu in collection:
-          usages = cpu.split(':')[1]
-          usages = map(lambda e: e.split('%')[0],
-                       usages.split(','))
-          for i in xrange(len(usages)):
-              total[i] += float(usages[i])
-        total = map(lambda t: t/nprocessors, total)
-		# Skip idle time
-        ret.append(total[0:3] + total[4:])
-    return ret
-
-def pc95(lst):
-    l = len(lst)
-    return sorted(lst)[ int(0.95 * l) ]
-
-def pc99(lst):
-    l = len(lst)
-    return sorted(lst)[ int(0.99 * l) ]
+	aggregated over all processors.  DOES NOT RETURN IDLE times.
 
-def coeff_variation(lst):
-    return stdev(lst) / avg(lst)
+    The processor count is detected from the data unless nprocessors
+    is given; see lib.topcpu for the per-CPU array this is built on."""
+    usage = aggregate(parse_top_cpus(fname, cpus=nprocessors))
+    # Skip idle time
+    return [list(row[:IDLE]) + list(row[IDLE+1:]) for row in usage]
 
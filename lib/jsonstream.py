@@ -0,0 +1,113 @@
+"""Streaming JSON writer for result records.
+
+The harnesses used to write each run as dumps( prettyFloats( run ) ):
+prettyFloats() copies the whole result tree, then dumps() builds the
+complete line in memory -- for a run with 1000 hosts that is twice the
+run's size on top of the run itself.  (The copy doesn't even do what it
+was meant to: json calls float.__repr__ directly, so the floats came
+out as repr() rather than '%.15g'.)
+
+writeJSON() walks the record once and writes it in chunks of about
+CHUNKSIZE bytes, producing the same bytes as the old code: the default
+', ' and ': ' separators, ASCII-escaped strings, floats as repr() and
+NaN/Infinity/-Infinity for non-finite values.  Pass precision to print
+floats with that many significant digits instead.
+
+    f = open( outfile, 'a' )
+    writeJSON( f, run )
+    f.write( '\\n' )
+"""
+
+from json.encoder import encode_basestring_ascii
+from math import isinf, isnan
+
+CHUNKSIZE = 1 << 16
+
+try:
+    STRINGS = ( str, unicode )
+    INTEGERS = ( int, long )
+except NameError:
+    STRINGS = ( str, )
+    INTEGERS = ( int, )
+
+def floatJSON( value, precision=None ):
+    """Return the JSON text of a float: repr(), or precision significant
+       digits if given"""
+    if isnan( value ):
+        return 'NaN'
+    if isinf( value ):
+        return 'Infinity' if value > 0 else '-Infinity'
+    if precision is None:
+        return repr( float( value ) )
+    return '%.*g' % ( precision, value )
+
+def _key( key ):
+    "Return the JSON text of a dict key, converted the way dumps() does"
+    if isinstance( key, STRINGS ):
+        return encode_basestring_ascii( key )
+    if key is True:
+        return '"true"'
+    if key is False:
+        return '"false"'
+    if key is None:
+        return '"null"'
+    if isinstance( key, float ):
+        return '"%s"' % floatJSON( key )
+    if isinstance( key, INTEGERS ):
+        return '"%d"' % key
+    raise TypeError( 'key %r is not a string' % ( key, ) )
+
+def iterJSON( obj, precision=None ):
+    "Yield the JSON text of obj in pieces"
+    if isinstance( obj, STRINGS ):
+        yield encode_basestring_ascii( obj )
+    elif obj is None:
+        yield 'null'
+    elif obj is True:
+        yield 'true'
+    elif obj is False:
+        yield 'false'
+    elif isinstance( obj, float ):
+        yield floatJSON( obj, precision )
+    elif isinstance( obj, INTEGERS ):
+        yield str( int( obj ) )
+    elif isinstance( obj, ( list, tuple ) ):
+        if obj and all( type( v ) is float for v in obj ):
+            # Fast path for sample lists, the bulk of a result
+            yield '[' + ', '.join( [ floatJSON( v, precision )
+                                     for v in obj ] ) + ']'
+            return
+        yield '['
+        first = True
+        for v in obj:
+            if not first:
+                yield ', '
+            first = False
+            for s in iterJSON( v, precision ):
+                yield s
+        yield ']'
+    elif isinstance( obj, dict ):
+        yield '{'
+        first = True
+        for k, v in obj.items():
+            yield ( '' if first else ', ' ) + _key( k ) + ': '
+            first = False
+            for s in iterJSON( v, precision ):
+                yield s
+        yield '}'
+    else:
+        raise TypeError( '%r is not JSON serializable' % ( obj, ) )
+
+def writeJSON( f, obj, precision=None, chunksize=CHUNKSIZE ):
+    """Write obj to the open file f as JSON, chunksize bytes or so at a
+       time; floats are printed as repr(), or with precision significant
+       digits if given"""
+    chunk, size = [], 0
+    for s in iterJSON( obj, precision ):
+        chunk.append( s )
+        size += len( s )
+        if size >= chunksize:
+            f.write( ''.join( chunk ) )
+            chunk, size = [], 0
+    if chunk:
+        f.write( ''.join( chunk ) )
@@ -0,0 +1,41 @@
+"""Deferred pyplot import.
+
+Importing matplotlib.pyplot costs hundreds of milliseconds, which
+scripts pay even when they only print a table.  pyplot() returns a
+stand-in that imports (and configures) pyplot the first time one of
+its attributes is used, i.e. when a figure is actually drawn.
+"""
+
+import os
+import sys
+
+
+class LazyPyplot( object ):
+    "Proxy for matplotlib.pyplot that imports it on first use"
+
+    def __init__( self, setup=() ):
+        self._setup = setup
+        self._plt = None
+
+    def _load( self ):
+        if self._plt is None:
+            import matplotlib
+            if 'matplotlib.pyplot' not in sys.modules:
+                if os.uname()[ 0 ] == 'Darwin':
+                    matplotlib.use( 'MacOSX' )
+                elif not os.environ.get( 'DISPLAY' ):
+                    matplotlib.use( 'Agg' )
+            import matplotlib.pyplot
+            # Style modules such as lib.plot_defaults apply rc settings
+            for name in self._setup:
+                __import__( name )
+            self._plt = matplotlib.pyplot
+        return self._plt
+
+    def __getattr__( self, name ):
+        return getattr( self._load(), name )
+
+def pyplot( *setup ):
+    """Return a lazy matplotlib.pyplot; the modules named in setup are
+       imported right after pyplot itself"""
+    return LazyPyplot( setup )
@@ -1,4 +1,8 @@
-import matplotlib.pyplot as plt
+import numpy as np
+
+from lib.lazyplot import pyplot
+
+plt = pyplot()
 
 
 def colorGenerator():
@@ -19,14 +23,11 @@ def markerGenerator():
 
 def convertToStep(x, y):
     """Convert to a "stepped" data format by duplicating all but the last elt."""
-    newx = []
-    newy = []
-    for i, d in enumerate(x):
-        newx.append(d)
-        newy.append(y[i])
-        if i != len(x) - 1:
-            newx.append(x[i + 1])
-            newy.append(y[i])
+    x, y = np.asarray(x), np.asarray(y)
+    newx = np.empty(max(2 * len(x) - 1, 0), dtype=x.dtype)
+    newy = np.empty(len(newx), dtype=y.dtype)
+    newx[0::2], newx[1::2] = x, x[1:]
+    newy[0::2], newy[1::2] = y, y[:-1]
     return newx, newy
 
 def convertToStepUpCDF(x, y):
@@ -34,18 +35,43 @@ def convertToStepUpCDF(x, y):
 
     Step goes up, rather than to the right.
     """
-    newx = []
-    newy = []
-    for i, d in enumerate(x):
-        newx.append(d)
-        newy.append(y[i])
-        if i != len(x) - 1:
-            newx.append(x[i])
-            newy.append(y[i + 1])
-    newx.append(newx[-1])
-    newy.append(1.0)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    newx = np.empty(2 * len(x), dtype=float)
+    newy = np.empty(len(newx), dtype=float)
+    newx[0:-1:2], newx[1:-1:2] = x, x[:-1]
+    newy[0:-1:2], newy[1:-1:2] = y, y[1:]
+    newx[-1], newy[-1] = x[-1], 1.0
     return newx, newy
 
+def figurePixels(fig=None):
+    "Return the larger pixel dimension of fig (or of a default figure)"
+    if fig is None:
+        w, h = plt.rcParams['figure.figsize']
+        dpi = plt.rcParams['figure.dpi']
+    else:
+        (w, h), dpi = fig.get_size_inches(), fig.dpi
+    return int(max(w, h) * dpi)
+
+def downsampleCDF(values, points):
+    """Return (x, y) for the CDF of values, keeping at most about
+    2 * points of the sorted samples.
+
+    y is the fraction of samples strictly below x, as in plotCDF.  The
+    kept samples include a uniform grid in probability and a uniform
+    grid in value, so when drawn with convertToStepUpCDF the curve is
+    never more than 1/(points - 1) + 1/n away from the exact CDF
+    vertically (a Kolmogorov-Smirnov distance bound), and its tails
+    keep their shape.  With points set to the figure's pixel size the error is
+    below one pixel and rendering cost no longer grows with n."""
+    x = np.sort(np.asarray(values, dtype=float))
+    n = len(x)
+    if points <= 1 or n <= 2 * points:
+        return x, np.arange(n, dtype=float) / n
+    pgrid = np.linspace(0, n - 1, points).astype(np.intp)
+    xgrid = np.searchsorted(x, np.linspace(x[0], x[-1], points))
+    index = np.unique(np.concatenate([pgrid, np.minimum(xgrid, n - 1)]))
+    return x[index], index.astype(float) / n
+
 def plotTimeSeries(data, title, xlabel, ylabel, step):
     """Plot a time series.
 
@@ -81,12 +107,17 @@ def plotTimeSeries(data, title, xlabel, ylabel, step):
 
     return fig
 
-def plotCDF(data, title, xlabel, ylabel, step):
+def plotCDF(data, title, xlabel, ylabel, step, points=None):
+    """Plot a CDF for each line in data (dicts with y and label).
+
+    points bounds the samples drawn per line (see downsampleCDF); by
+    default it is the pixel size of a default figure, and 0 draws
+    every sample."""
+    if points is None:
+        points = figurePixels()
     data_mod = []
     for index, line in enumerate(data):
-        vals = sorted(line['y'])
-        x = sorted(vals)
-        y = [(float(i) / len(x)) for i in range(len(x))]
+        x, y = downsampleCDF(line['y'], points)
         x, y = convertToStepUpCDF(x, y)
         entry = {}
         entry['x'] = x
@@ -0,0 +1,193 @@
+"""Content-addressed cache for rendered figures and parsed results.
+
+Entries are keyed on the content hashes of the input files, the plot
+options and the source of the module that does the plotting (and of the
+lib modules it uses), so a figure is only redrawn when its data, its
+options or its code change.  Each input file is hashed once per run.
+Figures are stored as copies of the files the plot wrote (restored to
+the same names on a hit); intermediates such as parsed result files
+are pickled.  The cache is bounded in size: least recently used
+entries are evicted whenever something new is stored.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import inspect
+import pickle
+from time import time
+
+DEFAULT_DIR = os.path.join( os.path.expanduser( '~' ), '.cache',
+                            'microbench' )
+DEFAULT_MAXBYTES = 1 << 30
+
+# Options that change how we render, not what we render; args, the
+# input file names, are keyed on by content already
+VOLATILE_OPTS = ( 'jobs', 'cache', 'cachemb', 'args' )
+
+# fileDigest() results for this run, keyed on path, size and mtime, so
+# that each input file is hashed once however many figures use it
+_digests = {}
+
+def fileDigest( fname, blocksize=1 << 20 ):
+    "Return the SHA-1 hex digest of a file's contents"
+    st = os.stat( fname )
+    stamp = ( os.path.abspath( fname ), st.st_size, st.st_mtime )
+    if stamp not in _digests:
+        _digests[ stamp ] = _hashFile( fname, blocksize )
+    return _digests[ stamp ]
+
+def _hashFile( fname, blocksize ):
+    "Hash a file's contents"
+    h = hashlib.sha1()
+    f = open( fname, 'rb' )
+    block = f.read( blocksize )
+    while block:
+        h.update( block )
+        block = f.read( blocksize )
+    f.close()
+    return h.hexdigest()
+
+def libModules( module ):
+    """Return the lib.* modules that module uses, directly or through
+       other lib modules, by name"""
+    found, todo = { module.__name__: module }, [ module ]
+    while todo:
+        for value in list( vars( todo.pop() ).values() ):
+            name = ( value.__name__ if inspect.ismodule( value )
+                     else getattr( value, '__module__', None ) )
+            if ( isinstance( name, str ) and name.startswith( 'lib.' ) and
+                 name not in found and name in sys.modules ):
+                found[ name ] = sys.modules[ name ]
+                todo.append( found[ name ] )
+    del found[ module.__name__ ]
+    return found
+
+def codeDigest( func ):
+    """Return a digest of the source file that defines func and of the
+       lib modules it uses"""
+    try:
+        digests = [ fileDigest( inspect.getsourcefile( func ) ) ]
+    except ( TypeError, IOError, OSError ):
+        return getattr( func, '__name__', repr( func ) )
+    module = sys.modules.get( getattr( func, '__module__', None ) )
+    if module is not None:
+        for name, lib in sorted( libModules( module ).items() ):
+            try:
+                digests.append( name + ':' +
+                                fileDigest( inspect.getsourcefile( lib ) ) )
+            except ( TypeError, IOError, OSError ):
+                pass
+    return ' '.join( digests )
+
+def cacheKey( files, options=None, func=None, extra=None, volatile=() ):
+    """Return a cache key for func( options ) applied to files.
+       options may be a dict or an optparse Values object; options
+       named in volatile (such as the ones that choose which figures
+       to draw) are left out of the key, like VOLATILE_OPTS."""
+    if options is not None and not isinstance( options, dict ):
+        options = vars( options )
+    options = dict( ( k, v ) for k, v in ( options or {} ).items()
+                    if k not in VOLATILE_OPTS and k not in volatile )
+    parts = { 'files': [ ( f, fileDigest( f ) ) for f in files ],
+              'options': options,
+              'code': codeDigest( func ) if func else None,
+              'func': getattr( func, '__name__', None ),
+              'extra': extra }
+    text = json.dumps( parts, sort_keys=True, default=repr )
+    return hashlib.sha1( text.encode( 'utf-8' ) ).hexdigest()
+
+
+class PlotCache( object ):
+    "Size-bounded, LRU-evicted cache directory"
+
+    def __init__( self, dirname=DEFAULT_DIR, maxbytes=DEFAULT_MAXBYTES ):
+        self.dirname = dirname
+        self.maxbytes = maxbytes
+        if not os.path.exists( dirname ):
+            os.makedirs( dirname )
+
+    def _path( self, key, suffix='' ):
+        return os.path.join( self.dirname, key + suffix )
+
+    def _touch( self, path ):
+        "Mark an entry as recently used"
+        now = time()
+        os.utime( path, ( now, now ) )
+
+    def fetchFiles( self, key ):
+        """If key holds saved figures, copy them back to the names they
+           were saved under and return those names; else return None"""
+        entry = self._path( key )
+        manifest = os.path.join( entry, 'manifest.json' )
+        if not os.path.exists( manifest ):
+            return None
+        fnames = json.load( open( manifest ) )
+        for i, fname in enumerate( fnames ):
+            dirname = os.path.dirname( fname )
+            if dirname and not os.path.exists( dirname ):
+                os.makedirs( dirname )
+            shutil.copyfile( os.path.join( entry, str( i ) ), fname )
+        self._touch( entry )
+        return fnames
+
+    def storeFiles( self, key, fnames ):
+        "Save copies of fnames under key"
+        entry = self._path( key )
+        tmp = entry + '.tmp%d' % os.getpid()
+        if os.path.exists( tmp ):
+            shutil.rmtree( tmp )
+        os.makedirs( tmp )
+        for i, fname in enumerate( fnames ):
+            shutil.copyfile( fname, os.path.join( tmp, str( i ) ) )
+        json.dump( list( fnames ), open( os.path.join( tmp, 'manifest.json' ),
+                                         'w' ) )
+        if os.path.exists( entry ):
+            shutil.rmtree( entry )
+        os.rename( tmp, entry )
+
+    def memoize( self, key, compute ):
+        "Return the pickled value under key, computing and storing it if absent"
+        path = self._path( key, '.pickle' )
+        if os.path.exists( path ):
+            self._touch( path )
+            f = open( path, 'rb' )
+            value = pickle.load( f )
+            f.close()
+            return value
+        value = compute()
+        tmp = path + '.tmp%d' % os.getpid()
+        f = open( tmp, 'wb' )
+        pickle.dump( value, f, pickle.HIGHEST_PROTOCOL )
+        f.close()
+        os.rename( tmp, path )
+        self.evict()
+        return value
+
+    def _size( self, path ):
+        if os.path.isdir( path ):
+            return sum( os.path.getsize( os.path.join( path, f ) )
+                        for f in os.listdir( path ) )
+        return os.path.getsize( path )
+
+    def evict( self ):
+        "Remove least recently used entries until we fit in maxbytes"
+        entries = []
+        for name in os.listdir( self.dirname ):
+            if '.tmp' in name:
+                continue
+            path = os.path.join( self.dirname, name )
+            entries.append( ( os.path.getmtime( path ), self._size( path ),
+                              path ) )
+        total = sum( size for _, size, _ in entries )
+        for _, size, path in sorted( entries ):
+            if total <= self.maxbytes:
+                break
+            if os.path.isdir( path ):
+                shutil.rmtree( path )
+            else:
+                os.remove( path )
+            total -= size
+        return total
@@ -0,0 +1,131 @@
+"""Parallel, headless figure rendering for the plot scripts.
+
+A figure job is a plotting function plus its arguments.  renderJobs()
+runs each job in its own worker process on the Agg backend, so a report
+with many figures takes about as long as its slowest figure.  Jobs are
+handed to (forked) workers by index, so large parsed results are
+inherited rather than pickled.  Jobs with a cache key are skipped when
+a lib.plotcache.PlotCache already holds their output.
+"""
+
+import os
+import sys
+import multiprocessing
+from optparse import OptionValueError
+from time import time
+
+FORMATS = [ 'pdf', 'png', 'svg' ]
+
+def headless():
+    "Switch matplotlib to the non-interactive Agg backend"
+    if 'matplotlib.pyplot' in sys.modules:
+        sys.modules[ 'matplotlib.pyplot' ].switch_backend( 'Agg' )
+    else:
+        import matplotlib
+        matplotlib.use( 'Agg' )
+
+def formatListCallback( option, opt, value, parser ):
+    "optparse callback for a comma-separated list of output formats"
+    value = [ f.strip().lower() for f in value.split( ',' ) if f.strip() ]
+    for fmt in value:
+        if fmt not in FORMATS:
+            raise OptionValueError( 'option %s: unknown figure format %s '
+                                    '(use %s)' %
+                                    ( opt, fmt, ','.join( FORMATS ) ) )
+    setattr( parser.values, option.dest, value )
+
+# Files saved by the current job, for the plot cache
+_saved = []
+
+def saveFigure( fig, basename, formats ):
+    "Save fig as basename.fmt for each format; return the file names"
+    fnames = []
+    for fmt in formats:
+        fname = '%s.%s' % ( basename, fmt )
+        fig.savefig( fname )
+        fnames.append( fname )
+    _saved.extend( fnames )
+    return fnames
+
+def saveFigures( basename, formats ):
+    """Save every open figure as basename-<fignum>.fmt (or basename.fmt
+       if there is just one); return the file names"""
+    import matplotlib.pyplot as plt
+    nums = plt.get_fignums()
+    fnames = []
+    for num in nums:
+        name = basename if len( nums ) == 1 else '%s-%s' % ( basename, num )
+        fnames += saveFigure( plt.figure( num ), name, formats )
+    return fnames
+
+# Jobs for the current renderJobs() call, inherited by forked workers
+_jobs = []
+
+def _runJob( index ):
+    "Worker: draw one job headlessly and save its figures"
+    headless()
+    import matplotlib.pyplot as plt
+    plt.close( 'all' )
+    name, func, args, basename, formats, key = _jobs[ index ]
+    del _saved[ : ]
+    start = time()
+    func( *args )
+    if basename:
+        saveFigures( basename, formats )
+    plt.close( 'all' )
+    return name, time() - start, list( _saved )
+
+def figureJob( name, func, args=(), basename=None, formats=FORMATS,
+               key=None ):
+    """Return a figure job: func( *args ) draws one or more figures.
+       If basename is None, func saves its own output (e.g. via the
+       script's savePlot); otherwise the renderer saves every figure
+       func opened as basename[-fignum].fmt.
+       key is the job's plot cache key (see lib.plotcache.cacheKey)"""
+    return ( name, func, tuple( args ), basename, list( formats ), key )
+
+def renderJobs( jobs, processes=None, cache=None ):
+    """Render figure jobs in parallel headless worker processes.
+       Jobs found in cache are restored instead of drawn (and reported
+       as taking 0 seconds); new output is stored in cache.
+       Returns a list of (name, seconds, filenames) in job order."""
+    global _jobs
+    jobs = list( jobs )
+    results = [ None ] * len( jobs )
+    if cache:
+        for i, job in enumerate( jobs ):
+            fnames = cache.fetchFiles( job[ -1 ] ) if job[ -1 ] else None
+            if fnames is not None:
+                results[ i ] = ( job[ 0 ], 0.0, fnames )
+    todo = [ i for i, r in enumerate( results ) if r is None ]
+    _jobs = [ jobs[ i ] for i in todo ]
+    if processes is None or processes <= 0:
+        processes = multiprocessing.cpu_count()
+    processes = min( processes, len( _jobs ) )
+    if processes <= 1:
+        rendered = [ _runJob( i ) for i in range( len( _jobs ) ) ]
+    else:
+        # Workers must fork so that they inherit _jobs
+        context = getattr( multiprocessing, 'get_context', None )
+        mp = context( 'fork' ) if context else multiprocessing
+        pool = mp.Pool( processes )
+        try:
+            rendered = pool.map( _runJob, range( len( _jobs ) ),
+                                 chunksize=1 )
+        finally:
+            pool.close()
+            pool.join()
+    _jobs = []
+    for i, result in zip( todo, rendered ):
+        results[ i ] = result
+        key = jobs[ i ][ -1 ]
+        if cache and key and result[ 2 ]:
+            cache.storeFiles( key, result[ 2 ] )
+    if cache:
+        cache.evict()
+    return results
+
+def reportJobs( results, out=sys.stdout ):
+    "Print a one-line summary of each rendered job"
+    for name, seconds, fnames in results:
+        out.write( '%-20s %6.2fs  %s\n' % ( name, seconds, ' '.join( fnames ) ) )
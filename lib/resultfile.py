@@ -0,0 +1,235 @@
+"""Compact binary result files, and one loader for both result formats.
+
+The harnesses write results as JSON lines: a '#' comment, a dict of
+options, then one list per run.  A binary result file (name ending in
+BINARY_EXT) holds the same records, but numeric lists are stored as raw
+float64/int64 arrays instead of text, and each run is appended as it
+finishes.  Layout:
+
+    MAGIC
+    record*     where record = <u64 header length> <JSON header> <payload>
+
+The JSON header carries the record kind ('comment', 'opts' or 'run'),
+the record with every array replaced by {"__array__": i}, and the
+dtype, shape and payload offset of each array, so a reader can skip
+from record to record without touching the payloads.
+
+readRecords() yields records from either format the way the plot
+scripts used to get them from loads( line ): dicts for options and
+lists for runs, with numeric arrays turned back into lists unless
+arrays=True is passed.
+
+Writers sync() each run to disk once it is appended.  A run cut short
+by a crash is at worst an incomplete record at the end of the file:
+readers skip it, and dropPartial() removes it before a resumed sweep
+appends to the file again.
+"""
+
+import os
+import struct
+import sys
+from json import dumps, loads
+
+import numpy as np
+
+MAGIC = b'MBRESULT1\n'
+BINARY_EXT = '.mbr'
+# Sidecar index of a result file (see lib/resultindex.py)
+INDEX_EXT = '.idx'
+LENGTH = struct.Struct( '<Q' )
+
+def isBinary( fname ):
+    "Is fname a binary result file (by name, or by content if it exists)?"
+    if fname and fname.endswith( BINARY_EXT ):
+        return True
+    if fname and os.path.isfile( fname ):
+        f = open( fname, 'rb' )
+        head = f.read( len( MAGIC ) )
+        f.close()
+        return head == MAGIC
+    return False
+
+def _placeholder( a, arrays ):
+    "Append the numeric array a to arrays; return its placeholder"
+    a = a.astype( np.float64 if a.dtype.kind == 'f' else np.int64 )
+    arrays.append( np.ascontiguousarray( a ) )
+    return { '__array__': len( arrays ) - 1 }
+
+def _split( obj, arrays ):
+    """Return obj with numeric (nested) lists and ndarrays replaced by
+       placeholders, appending the arrays to arrays"""
+    if isinstance( obj, dict ):
+        return dict( ( k, _split( v, arrays ) ) for k, v in obj.items() )
+    if isinstance( obj, np.ndarray ):
+        if obj.ndim == 0:
+            return obj.item()
+        # Even when empty (e.g. the rates of a run with a single tick)
+        if obj.dtype.kind in 'iuf':
+            return _placeholder( obj, arrays )
+        return [ _split( v, arrays ) for v in obj ]
+    if isinstance( obj, ( list, tuple ) ) and len( obj ):
+        try:
+            a = np.asarray( obj )
+        except ValueError:
+            a = None
+        if a is not None and a.dtype.kind in 'iuf':
+            return _placeholder( a, arrays )
+        return [ _split( v, arrays ) for v in obj ]
+    if isinstance( obj, np.generic ):
+        return obj.item()
+    return obj
+
+def _join( obj, arrays, aslists ):
+    "Inverse of _split"
+    if isinstance( obj, dict ):
+        if '__array__' in obj and len( obj ) == 1:
+            a = arrays[ obj[ '__array__' ] ]
+            return a.tolist() if aslists else a
+        return dict( ( k, _join( v, arrays, aslists ) )
+                     for k, v in obj.items() )
+    if isinstance( obj, list ):
+        return [ _join( v, arrays, aslists ) for v in obj ]
+    return obj
+
+def encodeRecord( kind, obj ):
+    "Return the bytes of one binary record"
+    arrays = []
+    tree = _split( obj, arrays )
+    specs, offset = [], 0
+    for a in arrays:
+        specs.append( ( a.dtype.str, a.shape, offset ) )
+        offset += a.nbytes
+    header = dumps( { 'kind': kind, 'tree': tree, 'arrays': specs,
+                      'size': offset } ).encode( 'utf-8' )
+    return b''.join( [ LENGTH.pack( len( header ) ), header ] +
+                     [ a.tobytes() for a in arrays ] )
+
+def initBinary( fname, comment, opts ):
+    "Create (or truncate) a binary result file with a comment and options"
+    f = open( fname, 'wb' )
+    f.write( MAGIC )
+    f.write( encodeRecord( 'comment', comment ) )
+    f.write( encodeRecord( 'opts', opts ) )
+    f.close()
+
+def sync( f ):
+    "Flush the open file f and force it to disk"
+    f.flush()
+    os.fsync( f.fileno() )
+
+def appendBinary( fname, obj, kind='run' ):
+    "Append one record (by default a run) to a binary result file"
+    data = encodeRecord( kind, obj )
+    f = open( fname, 'ab' )
+    if f.tell() == 0:
+        data = MAGIC + data
+    f.write( data )
+    sync( f )
+    f.close()
+
+def scanBinary( fname ):
+    """Yield ( offset, header ) for each complete record, reading only
+       the headers; a truncated final record is ignored"""
+    f = open( fname, 'rb' )
+    if f.read( len( MAGIC ) ) != MAGIC:
+        f.close()
+        raise ValueError( '%s is not a binary result file' % fname )
+    size = os.fstat( f.fileno() ).st_size
+    offset = len( MAGIC )
+    while offset + LENGTH.size <= size:
+        f.seek( offset )
+        length, = LENGTH.unpack( f.read( LENGTH.size ) )
+        if offset + LENGTH.size + length > size:
+            break
+        header = loads( f.read( length ).decode( 'utf-8' ) )
+        end = offset + LENGTH.size + length + header[ 'size' ]
+        if end > size:
+            break
+        yield offset, header
+        offset = end
+    f.close()
+
+def readBinaryRecord( f, offset, header=None, aslists=True ):
+    "Read the record at offset from the open file f; return (kind, obj)"
+    f.seek( offset )
+    length, = LENGTH.unpack( f.read( LENGTH.size ) )
+    raw = f.read( length )
+    if header is None:
+        header = loads( raw.decode( 'utf-8' ) )
+    payload = f.read( header[ 'size' ] )
+    arrays = []
+    for dtype, shape, start in header[ 'arrays' ]:
+        count = int( np.prod( shape ) ) if shape else 1
+        arrays.append( np.frombuffer( payload, dtype=dtype, count=count,
+                                      offset=start ).reshape( shape ) )
+    return header[ 'kind' ], _join( header[ 'tree' ], arrays, aslists )
+
+def readBinary( fname, arrays=False ):
+    "Yield ( kind, obj ) for each record of a binary result file"
+    f = open( fname, 'rb' )
+    try:
+        for offset, header in scanBinary( fname ):
+            yield readBinaryRecord( f, offset, header, not arrays )
+    finally:
+        f.close()
+
+def completeSize( fname ):
+    """Return the size of fname up to the end of its last complete
+       record (line, for JSON)"""
+    size = os.path.getsize( fname )
+    if isBinary( fname ):
+        end = len( MAGIC ) if size >= len( MAGIC ) else 0
+        f = open( fname, 'rb' )
+        for offset, header in scanBinary( fname ):
+            f.seek( offset )
+            length, = LENGTH.unpack( f.read( LENGTH.size ) )
+            end = offset + LENGTH.size + length + header[ 'size' ]
+        f.close()
+        return end
+    # Look back from the end for the last newline
+    f = open( fname, 'rb' )
+    end, block = size, 1 << 16
+    while end > 0:
+        start = max( 0, end - block )
+        f.seek( start )
+        data = f.read( end - start )
+        newline = data.rfind( b'\n' )
+        if newline >= 0:
+            f.close()
+            return start + newline + 1
+        end = start
+    f.close()
+    return 0
+
+def dropPartial( fname ):
+    """Truncate fname after its last complete record, removing what a
+       crash left of the record being written; return the bytes removed"""
+    size, end = os.path.getsize( fname ), completeSize( fname )
+    if end < size:
+        f = open( fname, 'r+b' )
+        f.truncate( end )
+        f.close()
+    return size - end
+
+def readRecords( fname, arrays=False ):
+    """Yield the options dicts and run lists of a result file in
+       either format, skipping comments (and nothing for an index, so
+       that globs over a results directory work); fname '-' reads JSON
+       from stdin"""
+    if fname.endswith( INDEX_EXT ):
+        return
+    if fname != '-' and isBinary( fname ):
+        for kind, obj in readBinary( fname, arrays ):
+            if kind != 'comment':
+                yield obj
+        return
+    f = sys.stdin if fname == '-' else open( fname )
+    for line in f:
+        if not line.endswith( '\n' ):
+            # Truncated last line: a run cut short
+            break
+        if line[ 0 ] == '#' or not line.strip():
+            continue
+        yield loads( line )
+    if f is not sys.stdin:
+        f.close()
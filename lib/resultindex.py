@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""On-disk index for result files, for random access by experiment key.
+
+For a result file (JSON lines or binary, see lib/resultfile.py) the
+index is a JSON sidecar, fname + '.idx', that lists each run record's
+byte offset, its key -- hosts, util (total machine utilization), sched
+and run number -- and summary statistics of its cpuvals, along with the
+options of the sweep it belongs to.  A query then reads only the
+index and the matching records:
+
+    for opts, entry, run in query( files, sched='cfs', util=.8, hosts=64 ):
+        ...
+
+The index is rebuilt whenever the result file's size or mtime no longer
+match the ones recorded in it.
+
+Command line: print the matching records' keys and stats
+
+    python lib/resultindex.py --sched cfs --util .8 --hosts 64 results/*/*/*
+"""
+
+import os
+import sys
+from json import dumps, loads
+from optparse import OptionParser
+
+import numpy as np
+
+if __name__ == '__main__':
+    sys.path.insert( 0, os.path.dirname( os.path.dirname(
+        os.path.abspath( __file__ ) ) ) )
+from lib.resultfile import INDEX_EXT, isBinary, scanBinary, readBinaryRecord
+
+VERSION = 1
+# Tolerance when matching utilizations, which are floats
+UTIL_TOLERANCE = 1e-6
+
+def indexName( fname ):
+    "Return the name of fname's index"
+    return fname + INDEX_EXT
+
+def _records( fname ):
+    "Yield ( offset, length, kind, obj ) for each record of fname"
+    if isBinary( fname ):
+        f = open( fname, 'rb' )
+        for offset, header in scanBinary( fname ):
+            kind, obj = readBinaryRecord( f, offset, header,
+                                          aslists=header[ 'kind' ] != 'run' )
+            yield offset, None, kind, obj
+        f.close()
+        return
+    f = open( fname, 'rb' )
+    offset = 0
+    for line in f:
+        if not line.endswith( b'\n' ):
+            # Truncated last line: a run still being written
+            break
+        if line[ :1 ] == b'#' or not line.strip():
+            kind, obj = 'comment', None
+        else:
+            obj = loads( line.decode( 'utf-8' ) )
+            kind = 'opts' if isinstance( obj, dict ) else 'run'
+        yield offset, len( line ), kind, obj
+        offset += len( line )
+    f.close()
+
+def runKey( opts, run ):
+    "Return ( hosts, util, sched ) for a run record and its options"
+    hosts = len( run )
+    util = None
+    first = run[ 0 ] if run and isinstance( run[ 0 ], dict ) else {}
+    if first.get( 'cpulimit' ) is not None and first.get( 'cpucount' ):
+        # cpulimit is each host's share of one core
+        util = round( first[ 'cpulimit' ] * hosts / first[ 'cpucount' ], 6 )
+    elif opts.get( 'cpu' ) is not None:
+        util = opts[ 'cpu' ]
+    return hosts, util, opts.get( 'sched' )
+
+def runStats( run ):
+    "Return summary statistics of a run's cpuvals (empty if it has none)"
+    vals = [ np.asarray( h[ 'cpuvals' ], dtype=np.float64 ).ravel()
+             for h in run if isinstance( h, dict ) and 'cpuvals' in h ]
+    vals = np.concatenate( vals ) if vals else np.zeros( 0 )
+    if not vals.size:
+        return {}
+    mean, stdev = float( vals.mean() ), float( vals.std() )
+    return { 'samples': int( vals.size ), 'mean': mean, 'stdev': stdev,
+             'cv': stdev / mean if mean else None,
+             'min': float( vals.min() ), 'max': float( vals.max() ) }
+
+def buildIndex( fname ):
+    "Scan fname once and return its index"
+    st = os.stat( fname )
+    groups, entries, runs = [], [], {}
+    opts = {}
+    for offset, length, kind, obj in _records( fname ):
+        if kind == 'opts':
+            opts = obj
+            groups.append( { 'offset': offset, 'opts': obj } )
+            runs = {}
+        elif kind == 'run':
+            if not groups:
+                groups.append( { 'offset': None, 'opts': {} } )
+            hosts, util, sched = runKey( opts, obj )
+            key = ( hosts, util, sched )
+            runs[ key ] = runs.get( key, 0 ) + 1
+            entries.append( { 'group': len( groups ) - 1, 'offset': offset,
+                              'length': length, 'hosts': hosts,
+                              'util': util, 'sched': sched,
+                              'run': runs[ key ], 'stats': runStats( obj ) } )
+    return { 'version': VERSION, 'size': st.st_size, 'mtime': st.st_mtime,
+             'binary': isBinary( fname ), 'groups': groups,
+             'entries': entries }
+
+def loadIndex( fname, update=True ):
+    """Return fname's index, (re)building and saving it if it is
+       missing or stale and update is True"""
+    name = indexName( fname )
+    st = os.stat( fname )
+    if os.path.exists( name ):
+        f = open( name )
+        index = loads( f.read() )
+        f.close()
+        if ( index.get( 'version' ) == VERSION and
+             index[ 'size' ] == st.st_size and
+             index[ 'mtime' ] == st.st_mtime ):
+            return index
+    index = buildIndex( fname )
+    if update:
+        tmp = name + '.tmp%d' % os.getpid()
+        try:
+            f = open( tmp, 'w' )
+            f.write( dumps( index ) )
+            f.close()
+            os.rename( tmp, name )
+        except ( IOError, OSError ):
+            # Read-only results directory: use the index unsaved
+            if os.path.exists( tmp ):
+                os.remove( tmp )
+    return index
+
+def _matches( value, wanted, tolerance=0 ):
+    "Does value match wanted (None, a value or a list of values)?"
+    if wanted is None:
+        return True
+    if not isinstance( wanted, ( list, tuple, set ) ):
+        wanted = [ wanted ]
+    if tolerance and value is not None:
+        return any( w is not None and abs( value - w ) <= tolerance
+                    for w in wanted )
+    return value in wanted
+
+def select( index, hosts=None, util=None, sched=None, run=None ):
+    """Return the index entries matching the given keys; each key may be
+       None (any), a value or a list of values"""
+    return [ e for e in index[ 'entries' ]
+             if _matches( e[ 'hosts' ], hosts ) and
+             _matches( e[ 'util' ], util, UTIL_TOLERANCE ) and
+             _matches( e[ 'sched' ], sched ) and
+             _matches( e[ 'run' ], run ) ]
+
+def readEntry( f, index, entry, arrays=False ):
+    "Read the run record of entry from f, fname opened in binary mode"
+    if index[ 'binary' ]:
+        return readBinaryRecord( f, entry[ 'offset' ],
+                                 aslists=not arrays )[ 1 ]
+    f.seek( entry[ 'offset' ] )
+    run = loads( f.read( entry[ 'length' ] ).decode( 'utf-8' ) )
+    if arrays:
+        for h in run:
+            for k, v in h.items():
+                if isinstance( v, list ):
+                    h[ k ] = np.asarray( v )
+    return run
+
+def query( files, hosts=None, util=None, sched=None, run=None,
+           arrays=False ):
+    """Yield ( opts, entry, run ) for the run records in files that match
+       the given keys (see select()), reading only those records"""
+    for fname in files:
+        index = loadIndex( fname )
+        entries = select( index, hosts, util, sched, run )
+        if not entries:
+            continue
+        f = open( fname, 'rb' )
+        for entry in entries:
+            opts = index[ 'groups' ][ entry[ 'group' ] ][ 'opts' ]
+            yield opts, entry, readEntry( f, index, entry, arrays )
+        f.close()
+
+def summaries( files, hosts=None, util=None, sched=None, run=None ):
+    "Yield ( fname, entry ) for matching records without reading them"
+    for fname in files:
+        for entry in select( loadIndex( fname ), hosts, util, sched, run ):
+            yield fname, entry
+
+def listCallback( convert ):
+    "Return an optparse callback for a comma-separated list of convert()"
+    def callback( option, opt, value, parser ):
+        setattr( parser.values, option.dest,
+                 [ convert( v ) for v in value.split( ',' ) ] )
+    return callback
+
+def parseOptions():
+    "Parse command line options"
+    parser = OptionParser( 'usage: %prog [options] results...' )
+    for name, convert in ( ( 'hosts', int ), ( 'util', float ),
+                           ( 'sched', str ), ( 'run', int ) ):
+        parser.add_option( '--' + name, type='string', action='callback',
+                           callback=listCallback( convert ), default=None,
+                           help='match %s (comma-separated list)' % name )
+    options, args = parser.parse_args()
+    if not args:
+        parser.print_help()
+        sys.exit( 1 )
+    return options, args
+
+def main():
+    opts, files = parseOptions()
+    print( '%-6s %-6s %-5s %4s %8s %8s %8s  %s' % (
+        'hosts', 'util', 'sched', 'run', 'mean', 'stdev', 'cv', 'file' ) )
+    for fname, e in summaries( files, opts.hosts, opts.util, opts.sched,
+                               opts.run ):
+        s = e[ 'stats' ]
+        print( '%-6s %-6s %-5s %4d %8.4f %8.4f %8.4f  %s' % (
+            e[ 'hosts' ], e[ 'util' ], e[ 'sched' ], e[ 'run' ],
+            s.get( 'mean', np.nan ), s.get( 'stdev', np.nan ),
+            s.get( 'cv' ) or np.nan, fname ) )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Bounded-memory, mergeable streaming quantile sketch.
+
+KLLSketch is a KLL sketch (Karnin, Lang and Liberty, "Optimal Quantile
+Approximation in Streams", FOCS 2016).  Samples are fed one at a time
+(or in batches) and the sketch keeps O(k log(n/k)) of them; sketches
+built on different hosts or runs can be merged without the raw data.
+
+Error bounds: for a sketch of parameter k, any single quantile query
+returns an item whose true rank is within eps * n of the requested rank
+with 99% confidence, where
+
+    eps ~= 2.296 / k ** 0.9723   (about 1.33% for the default k=200)
+
+(this is the empirical fit published for the reference KLL
+implementation in Apache DataSketches).  The bound is on *rank*, not on
+value: pc99 from a k=200 sketch is some sample whose exact percentile
+lies in [97.67, 100].  The bound holds after any number of merges.
+Count, mean, stdev, min and max are tracked exactly.
+"""
+
+import math
+import random
+
+import numpy as np
+
+
+class KLLSketch(object):
+    "Streaming quantile sketch; see module docstring for error bounds"
+
+    def __init__(self, k=200, c=2.0 / 3.0, seed=None):
+        self.k = k
+        self.c = c
+        self.rng = random.Random(seed)
+        self.compactors = []
+        self.size = 0
+        self.maxsize = 0
+        # Exact moments (Welford) and extremes
+        self.n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._grow()
+
+    def _grow(self):
+        self.compactors.append([])
+        self.maxsize = sum(self._capacity(h)
+                           for h in range(len(self.compactors)))
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.c ** depth * self.k)) + 1
+
+    def _compress(self):
+        for h in range(len(self.compactors)):
+            level = self.compactors[h]
+            if len(level) >= self._capacity(h):
+                if h + 1 >= len(self.compactors):
+                    self._grow()
+                level.sort()
+                # Keep the odd one out (if any) at this level
+                keep = [level.pop()] if len(level) % 2 else []
+                offset = self.rng.randint(0, 1)
+                self.compactors[h + 1].extend(level[offset::2])
+                self.compactors[h] = keep
+                self.size = sum(len(l) for l in self.compactors)
+                if self.size < self.maxsize:
+                    break
+
+    def _addmoments(self, n, mean, m2, lo, hi):
+        "Fold (n, mean, M2, min, max) of another sample into ours"
+        if n == 0:
+            return
+        total = self.n + n
+        delta = mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    def update(self, x):
+        "Add one sample"
+        x = float(x)
+        self._addmoments(1, x, 0.0, x, x)
+        self.compactors[0].append(x)
+        self.size += 1
+        if self.size >= self.maxsize:
+            self._compress()
+
+    def extend(self, values):
+        "Add a batch of samples (any iterable or array)"
+        a = np.asarray(values, dtype=np.float64).ravel()
+        if a.size == 0:
+            return
+        d = a - a.mean()
+        self._addmoments(a.size, a.mean(), np.dot(d, d), a.min(), a.max())
+        start = 0
+        while start < a.size:
+            room = max(self.maxsize - self.size, 1)
+            chunk = a[start:start + room]
+            self.compactors[0].extend(chunk.tolist())
+            self.size += chunk.size
+            start += chunk.size
+            if self.size >= self.maxsize:
+                self._compress()
+
+    def merge(self, other):
+        "Merge another sketch into this one; returns self"
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for h, level in enumerate(other.compactors):
+            self.compactors[h].extend(level)
+        self._addmoments(other.n, other._mean, other._m2,
+                         other.min, other.max)
+        self.size = sum(len(l) for l in self.compactors)
+        while self.size >= self.maxsize:
+            self._compress()
+        return self
+
+    def _weighted(self):
+        "Return sorted items and their cumulative weights"
+        items = np.concatenate([np.asarray(l, dtype=np.float64)
+                                for l in self.compactors])
+        weights = np.concatenate([np.full(len(l), 2 ** h, dtype=np.int64)
+                                  for h, l in enumerate(self.compactors)])
+        order = np.argsort(items, kind='mergesort')
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        """Return approximate qs-quantiles, using the same nearest-rank
+        definition as stats.quantiles: sorted(data)[int(q * n)]"""
+        if self.n == 0:
+            raise ValueError('quantiles(...): empty sketch')
+        items, cum = self._weighted()
+        qs = np.asarray(qs, dtype=np.float64)
+        ranks = np.minimum(np.floor(qs * cum[-1]), cum[-1] - 1)
+        ret = items[np.minimum(np.searchsorted(cum, ranks, side='right'),
+                               items.size - 1)]
+        # Extremes are exact
+        ret = np.where(qs <= 0, self.min, ret)
+        return np.where(qs >= 1, self.max, ret)
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def rank(self, x):
+        "Approximate fraction of samples <= x"
+        if self.n == 0:
+            return 0.0
+        items, cum = self._weighted()
+        i = np.searchsorted(items, x, side='right')
+        return float(cum[i - 1]) / cum[-1] if i else 0.0
+
+    def rank_error(self):
+        "Normalized rank error bound (99% confidence) for this k"
+        return 2.296 / self.k ** 0.9723
+
+    def mean(self):
+        return self._mean
+
+    def stdev(self):
+        return math.sqrt(self._m2 / self.n) if self.n else 0.0
+
+    def pc95(self):
+        return self.quantile(0.95)
+
+    def pc99(self):
+        return self.quantile(0.99)
+
+    def to_dict(self):
+        "Return a JSON-serializable representation"
+        return {'k': self.k, 'c': self.c, 'n': self.n, 'mean': self._mean,
+                'm2': self._m2, 'min': self.min, 'max': self.max,
+                'compactors': [list(l) for l in self.compactors]}
+
+    @classmethod
+    def from_dict(cls, d, seed=None):
+        "Rebuild a sketch from to_dict() output"
+        s = cls(k=d['k'], c=d['c'], seed=seed)
+        s.compactors = []
+        for level in d['compactors']:
+            s._grow()
+            s.compactors[-1] = [float(x) for x in level]
+        s.size = sum(len(l) for l in s.compactors)
+        s.n, s._mean, s._m2 = d['n'], d['mean'], d['m2']
+        s.min, s.max = d['min'], d['max']
+        return s
+
+
+def sketch_file(fname, k=200, scale=1.0):
+    """Stream a file of one number per line into a KLLSketch.
+    Blank lines are skipped; values are multiplied by scale."""
+    s = KLLSketch(k=k)
+    f = open(fname, 'r')
+    for line in f:
+        line = line.strip()
+        if line:
+            s.update(float(line) * scale)
+    f.close()
+    return s
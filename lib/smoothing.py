@@ -0,0 +1,177 @@
+"""Batched smoothing over (hosts x time) series.
+
+Every function takes a 2D array-like (one row per host) or a single 1D
+series, and returns an array of the same dimensionality, so a whole
+sweep is smoothed in one call.  stack() builds the matrix from the
+per-host dicts that parse_cpuacct returns.
+
+Sample-count windows use 'valid' semantics: a window of w samples over
+T samples gives T - w + 1 outputs per row.  Time windows are trailing,
+(x - span, x], and give one output per input sample.
+"""
+
+import numpy as np
+
+
+def as_matrix(values):
+    "Return values as a 2D float64 array; ragged rows are cut to the shortest"
+    if isinstance(values, np.ndarray):
+        a = values.astype(np.float64, copy=False)
+    else:
+        values = list(values)
+        if values and np.ndim(values[0]) > 0:
+            T = min(len(v) for v in values)
+            values = [v[:T] for v in values]
+        a = np.asarray(values, dtype=np.float64)
+    return a.reshape(1, -1) if a.ndim == 1 else a
+
+def _shaped(result, values):
+    "Match the dimensionality of the caller's input"
+    return result[0] if np.ndim(values) == 1 else result
+
+def stack(cpu_usage, field='cpuvals'):
+    """Return (xvals, matrix) for one field of parse_cpuacct output.
+    xvals is hosts x time too, since hosts are sampled separately."""
+    return (as_matrix([h['xvals'] for h in cpu_usage]),
+            as_matrix([h[field] for h in cpu_usage]))
+
+def ewma(alpha, values):
+    """Row-wise version of helper.ewma:
+       y[t] = alpha * y[t-1] + (1 - alpha) * v[t], with y[-1] = 0.
+    The recursion runs over time; each step is vectorized over hosts."""
+    a = as_matrix(values)
+    if alpha == 0:
+        return _shaped(a.copy(), values)
+    ret = np.empty_like(a)
+    prev = np.zeros(a.shape[0])
+    v = (1 - alpha) * a
+    for t in range(a.shape[1]):
+        prev *= alpha
+        prev += v[:, t]
+        ret[:, t] = prev
+    return _shaped(ret, values)
+
+def ewma_time(xvals, values, tau):
+    """EWMA for irregular sample times: each step decays the previous
+    value by exp(-dt/tau), so gaps in xvals are weighted correctly.
+    The first sample of each row seeds the average."""
+    a = as_matrix(values)
+    x = np.broadcast_to(as_matrix(xvals), a.shape)
+    decay = np.exp(-np.diff(x, axis=1) / float(tau))
+    ret = np.empty_like(a)
+    ret[:, 0] = a[:, 0]
+    for t in range(1, a.shape[1]):
+        d = decay[:, t - 1]
+        ret[:, t] = d * ret[:, t - 1] + (1 - d) * a[:, t]
+    return _shaped(ret, values)
+
+def _prefix(a):
+    "Row-wise prefix sums of a and a^2, shifted by each row's mean"
+    a = a - a.mean(axis=1)[:, None]
+    zero = np.zeros((a.shape[0], 1))
+    return (np.hstack([zero, np.cumsum(a, axis=1)]),
+            np.hstack([zero, np.cumsum(a * a, axis=1)]))
+
+def _check_window(a, window):
+    if window < 1 or window > a.shape[1]:
+        raise ValueError('window of %s samples does not fit series of %s'
+                         % (window, a.shape[1]))
+
+def rolling_mean(values, window):
+    a = as_matrix(values)
+    _check_window(a, window)
+    s, _ = _prefix(a)
+    ret = (s[:, window:] - s[:, :-window]) / window + a.mean(axis=1)[:, None]
+    return _shaped(ret, values)
+
+def rolling_var(values, window):
+    "Population variance over each window"
+    a = as_matrix(values)
+    _check_window(a, window)
+    s, ss = _prefix(a)
+    m = (s[:, window:] - s[:, :-window]) / window
+    ret = np.maximum((ss[:, window:] - ss[:, :-window]) / window - m * m, 0)
+    return _shaped(ret, values)
+
+def _rolling_extreme(values, window, ufunc, fill):
+    """van Herk/Gil-Werman: block prefix and suffix scans make every
+    window an O(1) combination, independent of window size"""
+    a = as_matrix(values)
+    _check_window(a, window)
+    h, T = a.shape
+    blocks = -(-T // window)
+    p = np.full((h, blocks * window), fill)
+    p[:, :T] = a
+    p = p.reshape(h, blocks, window)
+    prefix = ufunc.accumulate(p, axis=2).reshape(h, -1)
+    suffix = ufunc.accumulate(p[:, :, ::-1], axis=2)[:, :, ::-1].reshape(h, -1)
+    n = T - window + 1
+    ret = ufunc(suffix[:, :n], prefix[:, window - 1:window - 1 + n])
+    return _shaped(ret, values)
+
+def rolling_min(values, window):
+    return _rolling_extreme(values, window, np.minimum, np.inf)
+
+def rolling_max(values, window):
+    return _rolling_extreme(values, window, np.maximum, -np.inf)
+
+def _time_starts(xvals, shape, span):
+    """Return, for every sample, the row-local index of the first sample
+    in its trailing (x - span, x] window.  Rows are laid end to end with
+    gaps wider than span so one searchsorted serves the whole matrix."""
+    x = np.broadcast_to(as_matrix(xvals), shape)
+    x = x - x[:, :1]
+    gap = np.max(x[:, -1]) + span + 1.0
+    base = np.arange(shape[0])[:, None] * gap
+    flat = (x + base).ravel()
+    starts = np.searchsorted(flat, (x + base - span).ravel(), side='right')
+    return starts.reshape(shape) - np.arange(shape[0])[:, None] * shape[1]
+
+def time_mean(xvals, values, span):
+    "Trailing mean over a time window of width span"
+    a = as_matrix(values)
+    lo = _time_starts(xvals, a.shape, span)
+    hi = np.arange(1, a.shape[1] + 1)[None, :]
+    rows = np.arange(a.shape[0])[:, None]
+    s, _ = _prefix(a)
+    ret = (s[:, 1:] - s[rows, lo]) / (hi - lo) + a.mean(axis=1)[:, None]
+    return _shaped(ret, values)
+
+def time_var(xvals, values, span):
+    "Trailing population variance over a time window of width span"
+    a = as_matrix(values)
+    lo = _time_starts(xvals, a.shape, span)
+    n = np.arange(1, a.shape[1] + 1)[None, :] - lo
+    rows = np.arange(a.shape[0])[:, None]
+    s, ss = _prefix(a)
+    m = (s[:, 1:] - s[rows, lo]) / n
+    ret = np.maximum((ss[:, 1:] - ss[rows, lo]) / n - m * m, 0)
+    return _shaped(ret, values)
+
+def _time_extreme(xvals, values, span, ufunc):
+    """Sparse-table range queries: a window of length L is covered by two
+    power-of-two runs of length 2^floor(log2 L).  Levels are built one at
+    a time, answering the windows of that size, so memory stays O(hT)."""
+    a = as_matrix(values)
+    h, T = a.shape
+    lo = _time_starts(xvals, a.shape, span)
+    hi = np.broadcast_to(np.arange(T)[None, :], a.shape)
+    level = np.floor(np.log2(hi - lo + 1)).astype(int)
+    rows = np.broadcast_to(np.arange(h)[:, None], a.shape)
+    ret = np.empty_like(a)
+    table = a.copy()
+    for k in range(level.max() + 1):
+        if k:
+            width = 1 << (k - 1)
+            table = ufunc(table[:, :-width], table[:, width:])
+        sel = level == k
+        if sel.any():
+            r, l, e = rows[sel], lo[sel], hi[sel] - (1 << k) + 1
+            ret[sel] = ufunc(table[r, l], table[r, e])
+    return _shaped(ret, values)
+
+def time_min(xvals, values, span):
+    return _time_extreme(xvals, values, span, np.minimum)
+
+def time_max(xvals, values, span):
+    return _time_extreme(xvals, values, span, np.maximum)
@@ -0,0 +1,96 @@
+"""ndarray-backed summary statistics.
+
+Drop-in replacements for the list helpers in lib/helper.py (avg, stdev,
+pc95, pc99, coeff_variation, cdf).  Inputs may be lists, tuples or
+arrays; nothing is copied if the input is already a float64 array.
+"""
+
+import numpy as np
+
+
+def as_array(lst):
+    "Return lst as a flat float64 ndarray (no copy if already one)."
+    return np.asarray(lst, dtype=np.float64).ravel()
+
+def moments(lst):
+    """Return (n, mean, variance) in a single pass over the data.
+
+    The sums are shifted by the first sample, which keeps the
+    sum-of-squares formula numerically well behaved for samples that
+    sit far from zero (e.g. timestamps or ns counters)."""
+    a = as_array(lst)
+    n = a.size
+    if n == 0:
+        raise ValueError('moments(...): empty sample')
+    d = a - a[0]
+    s = d.sum()
+    ss = np.dot(d, d)
+    mean = s / n
+    var = max(ss / n - mean * mean, 0.0)
+    return n, a[0] + mean, var
+
+def avg(lst):
+    return moments(lst)[1]
+
+def stdev(lst):
+    return np.sqrt(moments(lst)[2])
+
+def coeff_variation(lst):
+    n, mean, var = moments(lst)
+    return np.sqrt(var) / mean
+
+def quantiles(lst, qs):
+    """Return the qs-quantiles of lst, taken from a single partition.
+
+    Uses the same (nearest-rank, lower) definition as helper.pc95:
+    the q-quantile is sorted(lst)[int(q * len(lst))]."""
+    a = as_array(lst)
+    n = a.size
+    if n == 0:
+        raise ValueError('quantiles(...): empty sample')
+    idx = np.minimum((np.asarray(qs, dtype=np.float64) * n).astype(np.intp),
+                     n - 1)
+    part = np.partition(a, np.unique(idx))
+    return part[idx]
+
+def pc95(lst):
+    return quantiles(lst, [0.95])[0]
+
+def pc99(lst):
+    return quantiles(lst, [0.99])[0]
+
+# Two-sided 95% quantiles of Student's t for 1..30 degrees of freedom
+T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+       2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+       2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+       2.048, 2.045, 2.042)
+
+def ci95(lst):
+    """Return (mean, halfwidth) of the 95% confidence interval for the
+    mean of lst, from Student's t (the normal distribution beyond 30
+    degrees of freedom); halfwidth is inf for a single sample."""
+    n, mean, var = moments(lst)
+    if n < 2:
+        return mean, np.inf
+    t = T95[n - 2] if n - 1 <= len(T95) else 1.960
+    return mean, t * np.sqrt(var / (n - 1))
+
+def summary(lst, qs=(0.5, 0.95, 0.99)):
+    """Return a dict of n, mean, stdev, min, max and the requested
+    quantiles (keyed 'p50', 'p95', ...), using one moment pass and
+    one partition."""
+    a = as_array(lst)
+    n, mean, var = moments(a)
+    ret = {'n': n, 'mean': mean, 'stdev': np.sqrt(var),
+           'min': a.min(), 'max': a.max()}
+    for q, v in zip(qs, quantiles(a, qs)):
+        ret['p%g' % (100.0 * q)] = v
+    return ret
+
+def cdf(values):
+    """Return (x, y) for an empirical CDF, as arrays.
+
+    Unlike helper.cdf, values is not sorted in place."""
+    x = np.sort(as_array(values))
+    y = np.arange(1, x.size + 1, dtype=np.float64) / x.size
+    return (x, y)
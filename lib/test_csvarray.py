@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"Check lib/csvarray.py against helper.read_list's cleaning rules"
+
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib.csvarray import read_chunks, read_array, sidecar_name
+
+def withCSV( text, test ):
+    "Run test( fname ) on a file holding text"
+    tmp = tempfile.mkdtemp()
+    try:
+        fname = os.path.join( tmp, 'data.csv' )
+        f = open( fname, 'w' )
+        f.write( text )
+        f.close()
+        test( fname )
+    finally:
+        shutil.rmtree( tmp )
+
+def chunks( text, delim=',', chunklines=2 ):
+    "Return the rows read_chunks() parses from text, as one array"
+    ret = []
+    withCSV( text, lambda fname: ret.extend(
+        read_chunks( fname, delim, chunklines ) ) )
+    width = max( c.shape[ 1 ] for c in ret )
+    return np.vstack( [ np.hstack( [ c, np.full( ( c.shape[ 0 ],
+                                                   width - c.shape[ 1 ] ),
+                                                 np.nan ) ] )
+                        for c in ret ] )
+
+def same( a, b ):
+    "Are arrays a and b equal, NaNs included?"
+    return np.array_equal( np.isnan( a ), np.isnan( b ) ) and \
+        np.array_equal( np.nan_to_num( a ), np.nan_to_num( b ) )
+
+def test_cleaning():
+    # Empty, 'ms' and 's' cells become 0; other text becomes NaN
+    a = chunks( '1,,ms\n s ,2.5,x\n3,4\n' )
+    assert same( a, np.array( [ [ 1, 0, 0 ], [ 0, 2.5, np.nan ],
+                                [ 3, 4, np.nan ] ] ) )
+
+def test_delimiters():
+    for delim in ( '\t', ' ', ';' ):
+        text = delim.join( [ '1', '', '', '2' ] ) + '\n' + \
+            delim.join( [ '3', 'ms', '4', '' ] ) + '\n'
+        assert same( chunks( text, delim ),
+                     np.array( [ [ 1, 0, 0, 2 ], [ 3, 0, 4, 0 ] ] ) )
+
+def checkSidecar( fname ):
+    a = read_array( fname )
+    assert os.path.exists( sidecar_name( fname ) )
+    assert same( np.asarray( a ), read_array( fname, cache=False ) )
+    assert same( np.asarray( read_array( fname ) ), np.asarray( a ) )
+
+def test_sidecar():
+    withCSV( '1,2\n3,4,5\n6\n', checkSidecar )
+
+if __name__ == '__main__':
+    test_cleaning()
+    test_delimiters()
+    test_sidecar()
+    print( 'ok' )
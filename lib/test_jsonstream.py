@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"Check that writeJSON() writes the same text as json.dumps()"
+
+import json
+import os
+import sys
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib.jsonstream import writeJSON
+
+RECORD = [ { 'host': 'h1', 'cpuvals': [ 0.1, 1e-7, 12345.678, 1e300 ],
+             'xvals': [ 1, 2, 3 ], 'odd': [ 1.5, 2, None, True, False ],
+             'text': u'caf\xe9 "quoted"\n', 'nested': { 'a': [ [], {} ] },
+             1: 'int key', 2.5: 'float key', None: 'null key',
+             'nonfinite': [ float( 'nan' ), float( 'inf' ),
+                            -float( 'inf' ) ] },
+           [], {}, 0, -3, 0.0 ]
+
+def written( obj, **kwargs ):
+    "Return what writeJSON() writes for obj"
+    f = StringIO()
+    writeJSON( f, obj, **kwargs )
+    return f.getvalue()
+
+def test_dumps():
+    assert written( RECORD ) == json.dumps( RECORD )
+    # Chunking mustn't change the output
+    assert written( RECORD, chunksize=1 ) == json.dumps( RECORD )
+    run = [ { 'cpuvals': [ i / 7.0 for i in range( 10000 ) ] } ] * 3
+    assert written( run, chunksize=1000 ) == json.dumps( run )
+
+def test_precision():
+    assert written( [ 1 / 3.0, 2.0 ], precision=4 ) == '[0.3333, 2]'
+
+if __name__ == '__main__':
+    test_dumps()
+    test_precision()
+    print( 'ok' )
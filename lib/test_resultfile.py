@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"Check binary result files against the records written to them"
+
+import os
+import shutil
+import sys
+import tempfile
+from io import StringIO
+
+import numpy as np
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib.resultfile import ( BINARY_EXT, isBinary, initBinary, appendBinary,
+                             readBinary, readRecords, completeSize,
+                             dropPartial )
+
+OPTS = { 'counts': [ 2, 4 ], 'sched': 'cfs', 'cpu': 0.5 }
+RUN = [ { 'host': 'h1', 'cpuvals': [ 0.25, 0.5, 0.75 ], 'xvals': [ 1, 2, 3 ],
+          'percpu': [ [ 1, 2 ], [ 3, 4 ] ], 'mixed': [ 1, 'two', None ],
+          'empty': [], 'scalar': np.float64( 1.5 ), 'zerod': np.array( 7 ),
+          'noticks': np.zeros( 0 ), 'nopercpu': np.zeros( ( 0, 4 ) ),
+          'warmup': None } ]
+
+def withFile( test ):
+    "Run test( fname ) on a fresh binary result file name"
+    tmp = tempfile.mkdtemp()
+    try:
+        test( os.path.join( tmp, 'result' + BINARY_EXT ) )
+    finally:
+        shutil.rmtree( tmp )
+
+def expected():
+    "RUN as it reads back: plain lists and numbers"
+    host = dict( RUN[ 0 ], scalar=1.5, zerod=7, noticks=[], nopercpu=[] )
+    return [ host ]
+
+def checkRoundTrip( fname ):
+    initBinary( fname, 'a comment', OPTS )
+    appendBinary( fname, RUN )
+    appendBinary( fname, 'between runs', 'comment' )
+    appendBinary( fname, RUN )
+    assert isBinary( fname )
+    assert list( readBinary( fname ) ) == [
+        ( 'comment', 'a comment' ), ( 'opts', OPTS ), ( 'run', expected() ),
+        ( 'comment', 'between runs' ), ( 'run', expected() ) ]
+    assert list( readRecords( fname ) ) == [ OPTS, expected(), expected() ]
+    run = list( readRecords( fname, arrays=True ) )[ 1 ]
+    assert run[ 0 ][ 'cpuvals' ].dtype == np.float64
+    assert run[ 0 ][ 'percpu' ].shape == ( 2, 2 )
+    assert run[ 0 ][ 'nopercpu' ].shape == ( 0, 4 )
+
+def checkDropPartial( fname ):
+    initBinary( fname, 'a comment', OPTS )
+    appendBinary( fname, RUN )
+    size = os.path.getsize( fname )
+    appendBinary( fname, RUN )
+    # Cut the second run short, as a crash would
+    cut = os.path.getsize( fname ) - 5
+    f = open( fname, 'r+b' )
+    f.truncate( cut )
+    f.close()
+    assert completeSize( fname ) == size
+    assert list( readRecords( fname ) ) == [ OPTS, expected() ]
+    assert dropPartial( fname ) == cut - size
+    assert os.path.getsize( fname ) == size
+    assert dropPartial( fname ) == 0
+    appendBinary( fname, RUN )
+    assert list( readRecords( fname ) ) == [ OPTS, expected(), expected() ]
+
+def checkJSON( fname ):
+    fname = fname.replace( BINARY_EXT, '.out' )
+    f = open( fname, 'w' )
+    f.write( '# a comment\n{"cpu": 0.5}\n[{"cpuvals": [1.0]}]\n[{"cpu' )
+    f.close()
+    assert not isBinary( fname )
+    assert list( readRecords( fname ) ) == [ { 'cpu': 0.5 },
+                                             [ { 'cpuvals': [ 1.0 ] } ] ]
+    assert dropPartial( fname ) == len( '[{"cpu' )
+
+def test_stdin():
+    stdin = sys.stdin
+    try:
+        sys.stdin = StringIO( u'# a comment\n{"cpu": 0.5}\n[1, 2]\n' )
+        assert list( readRecords( '-' ) ) == [ { 'cpu': 0.5 }, [ 1, 2 ] ]
+    finally:
+        sys.stdin = stdin
+
+def test_round_trip():
+    withFile( checkRoundTrip )
+
+def test_drop_partial():
+    withFile( checkDropPartial )
+
+def test_json():
+    withFile( checkJSON )
+
+if __name__ == '__main__':
+    test_round_trip()
+    test_drop_partial()
+    test_json()
+    test_stdin()
+    print( 'ok' )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"Check KLLSketch's rank error and merging against exact ranks"
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib.sketch import KLLSketch
+
+QS = np.linspace( 0.01, 0.99, 99 )
+
+def rankErrors( sketch, data ):
+    "Return the true normalized rank errors of sketch's quantiles of data"
+    data = np.sort( data )
+    values = sketch.quantiles( QS )
+    lo = np.searchsorted( data, values, side='left' ) / float( data.size )
+    hi = np.searchsorted( data, values, side='right' ) / float( data.size )
+    # Ties: any rank the value occupies will do
+    return np.maximum( 0, np.maximum( lo - QS, QS - hi ) )
+
+def test_rank_error():
+    rng = np.random.RandomState( 1 )
+    data = rng.lognormal( size=100000 )
+    s = KLLSketch( k=200, seed=1 )
+    s.extend( data[ :50000 ] )
+    for x in data[ 50000: ]:
+        s.update( x )
+    assert s.n == data.size
+    assert s.size < 2000
+    assert rankErrors( s, data ).max() <= s.rank_error()
+    assert s.min == data.min() and s.max == data.max()
+    assert abs( s.mean() - data.mean() ) < 1e-9 * abs( data.mean() )
+    assert abs( s.stdev() - data.std() ) < 1e-9 * data.std()
+
+def test_merge():
+    rng = np.random.RandomState( 2 )
+    a, b = rng.normal( size=30000 ), rng.normal( 5, 2, size=70000 )
+    sa, sb = KLLSketch( seed=2 ), KLLSketch( seed=3 )
+    sa.extend( a )
+    sb.extend( b )
+    merged = KLLSketch.from_dict( sa.to_dict(), seed=4 ).merge( sb )
+    data = np.concatenate( [ a, b ] )
+    assert merged.n == data.size
+    assert rankErrors( merged, data ).max() <= merged.rank_error()
+    assert merged.min == data.min() and merged.max == data.max()
+    assert abs( merged.mean() - data.mean() ) < 1e-9 * abs( data.mean() )
+    assert abs( merged.stdev() - data.std() ) < 1e-9 * data.std()
+
+if __name__ == '__main__':
+    test_rank_error()
+    test_merge()
+    print( 'ok' )
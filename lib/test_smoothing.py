@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"Check lib/smoothing.py's rolling and time windows against brute force"
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib import smoothing
+
+def bruteRolling( a, window, func ):
+    "Apply func to every 'valid' window of each row of a"
+    return np.array( [ [ func( row[ t: t + window ] )
+                         for t in range( len( row ) - window + 1 ) ]
+                       for row in a ] )
+
+def bruteTime( x, a, span, func ):
+    "Apply func to every trailing ( x - span, x ] window of each row of a"
+    return np.array( [ [ func( row[ ( xs > xs[ t ] - span ) &
+                                    ( xs <= xs[ t ] ) ] )
+                         for t in range( len( row ) ) ]
+                       for xs, row in zip( x, a ) ] )
+
+def test_rolling():
+    rng = np.random.RandomState( 1 )
+    a = rng.normal( size=( 4, 37 ) )
+    for window in ( 1, 2, 5, 8, 37 ):
+        for func, expect in ( ( smoothing.rolling_min, np.min ),
+                              ( smoothing.rolling_max, np.max ),
+                              ( smoothing.rolling_mean, np.mean ),
+                              ( smoothing.rolling_var, np.var ) ):
+            assert np.allclose( func( a, window ),
+                                bruteRolling( a, window, expect ) )
+    # A single series keeps its dimensionality
+    assert np.array_equal( smoothing.rolling_max( a[ 0 ], 5 ),
+                           bruteRolling( a[ :1 ], 5, np.max )[ 0 ] )
+
+def test_time():
+    rng = np.random.RandomState( 2 )
+    a = rng.normal( size=( 3, 50 ) )
+    x = np.cumsum( rng.uniform( 0.1, 1.0, size=a.shape ), axis=1 )
+    for span in ( 0.05, 1.0, 3.0, 100.0 ):
+        for func, expect in ( ( smoothing.time_min, np.min ),
+                              ( smoothing.time_max, np.max ),
+                              ( smoothing.time_mean, np.mean ),
+                              ( smoothing.time_var, np.var ) ):
+            assert np.allclose( func( x, a, span ),
+                                bruteTime( x, a, span, expect ) )
+
+def test_ewma():
+    values = [ 1.0, 2.0, 4.0 ]
+    y, expect = smoothing.ewma( 0.5, values ), []
+    prev = 0
+    for v in values:
+        prev = 0.5 * prev + 0.5 * v
+        expect.append( prev )
+    assert np.allclose( y, expect )
+
+if __name__ == '__main__':
+    test_rolling()
+    test_time()
+    test_ewma()
+    print( 'ok' )
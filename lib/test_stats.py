@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"Check lib/stats.py against plain numpy"
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                               '..' ) )
+from lib import stats
+
+def test_moments():
+    # Far from zero, where a naive sum of squares loses precision
+    data = 1e9 + np.random.RandomState( 1 ).normal( size=1000 )
+    n, mean, var = stats.moments( data.tolist() )
+    assert n == data.size
+    assert abs( mean - data.mean() ) < 1e-6
+    assert abs( var - data.var() ) < 1e-6 * data.var()
+    assert abs( stats.stdev( data ) - data.std() ) < 1e-6 * data.std()
+
+def test_quantiles():
+    data = np.random.RandomState( 2 ).uniform( size=1001 )
+    ordered = sorted( data )
+    for q in ( 0.0, 0.5, 0.95, 0.99, 1.0 ):
+        expect = ordered[ min( int( q * len( data ) ), len( data ) - 1 ) ]
+        assert stats.quantiles( data, [ q ] )[ 0 ] == expect
+    assert stats.pc95( data ) == ordered[ int( .95 * len( data ) ) ]
+    summary = stats.summary( data )
+    assert summary[ 'p99' ] == stats.pc99( data )
+    assert summary[ 'min' ] == data.min() and summary[ 'max' ] == data.max()
+
+def test_ci95():
+    mean, half = stats.ci95( [ 1.0, 2.0, 3.0 ] )
+    # t(2) = 4.303, standard error = 1 / sqrt( 3 )
+    assert mean == 2.0
+    assert abs( half - 4.303 / np.sqrt( 3 ) ) < 1e-12
+    assert stats.ci95( [ 5.0 ] ) == ( 5.0, np.inf )
+    data = np.arange( 100.0 )
+    _mean, half = stats.ci95( data )
+    assert abs( half - 1.960 * data.std( ddof=1 ) / 10 ) < 1e-9
+
+def test_cdf():
+    data = [ 3.0, 1.0, 2.0 ]
+    x, y = stats.cdf( data )
+    assert list( x ) == [ 1.0, 2.0, 3.0 ]
+    assert list( y ) == [ 1 / 3.0, 2 / 3.0, 1.0 ]
+    assert data == [ 3.0, 1.0, 2.0 ]
+
+if __name__ == '__main__':
+    test_moments()
+    test_quantiles()
+    test_ci95()
+    test_cdf()
+    print( 'ok' )
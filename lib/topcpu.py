@@ -0,0 +1,68 @@
+"""Streaming parser for per-CPU lines from top -b (press '1' view).
+
+Handles both the classic and procps-ng formats:
+    Cpu0  :  0.0%us,  1.0%sy,  0.0%ni, 97.0%id,  0.0%wa,  0.0%hi,  2.0%si,  0.0%st
+    %Cpu0  :  0.0 us,  1.0 sy,  0.0 ni, 97.0 id,  0.0 wa,  0.0 hi,  2.0 si,  0.0 st
+
+The CPU count is taken from the data: an interval ends when the CPU
+number stops increasing.  The result is an (intervals x cpus x
+categories) array with categories in CATEGORIES order.
+"""
+
+import re
+
+import numpy as np
+
+CATEGORIES = ('us', 'sy', 'ni', 'id', 'wa', 'hi', 'si', 'st')
+IDLE = CATEGORIES.index('id')
+
+cpu_re = re.compile(r'\s*%?Cpu(\d+)\s*:(.*)')
+field_re = re.compile(r'([\d.]+)\s*%?\s*([a-z]{2})')
+num_re = re.compile(r'([\d.]+)\s*%?\s*[a-z]{2}')
+
+def parse_top_cpus(fname, cpus=None):
+    """Return an (intervals x cpus x len(CATEGORIES)) array of percents.
+    cpus overrides CPU-count detection.  A trailing partial interval
+    (e.g. from a killed top) is dropped."""
+    flat = []
+    order = None
+    last, count = -1, 0
+    f = open(fname)
+    for line in f:
+        m = cpu_re.match(line)
+        if not m:
+            continue
+        n, rest = int(m.group(1)), m.group(2)
+        if order is None:
+            labels = [l for _, l in field_re.findall(rest)]
+            order = [labels.index(c) if c in labels else None
+                     for c in CATEGORIES]
+            width = len(labels)
+        if cpus is None and n <= last:
+            cpus = count
+        last = n
+        count += 1
+        flat.extend(num_re.findall(rest))
+    f.close()
+    if order is None:
+        return np.zeros((0, cpus or 0, len(CATEGORIES)))
+    cpus = cpus or count
+    vals = np.array(flat, dtype=np.float64).reshape(-1, width)
+    vals = vals[:(len(vals) // cpus) * cpus].reshape(-1, cpus, width)
+    ret = np.zeros(vals.shape[:2] + (len(CATEGORIES),))
+    for i, j in enumerate(order):
+        if j is not None:
+            ret[:, :, i] = vals[:, :, j]
+    return ret
+
+def aggregate(usage):
+    "Average over CPUs: (intervals x categories)"
+    return usage.mean(axis=1)
+
+def busy(usage):
+    "Non-idle percent per interval and CPU: (intervals x cpus)"
+    return 100.0 - usage[:, :, IDLE]
+
+def per_cpu(usage, cpu):
+    "Time series for one CPU: (intervals x categories)"
+    return usage[:, cpu, :]
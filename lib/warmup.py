@@ -0,0 +1,105 @@
+"""Warm-up detection: wait for live counters to reach a steady rate.
+
+The harnesses used to wait a fixed time for their load to get going
+(stressors, iperf flows) before measuring: too long for a quick run, and
+too short for one that ramps up slowly, which then gets measured during
+its ramp-up.  waitSteady() instead polls cumulative counters -- cgroup
+CPU usage, interface byte counts -- and returns as soon as their rates
+have settled:
+
+    read = fileCounters( [ '/sys/class/net/s1-eth1/statistics/tx_bytes' ] )
+    waited, rates = waitSteady( read, tolerance=.1, timeout=30 )
+
+A rate has settled when its mean over the last WINDOW polls is nonzero
+and within tolerance (a fraction) of its mean over the WINDOW polls
+before; averaging over a window keeps the check from tripping over the
+quantization of the counters themselves.  If that doesn't happen within
+timeout seconds, WarmupTimeout says which counters, and at what rates.
+
+waitFor() does the same for a condition, such as a server listening.
+"""
+
+from time import sleep, time
+
+INTERVAL = .1
+WINDOW = 3
+TOLERANCE = .1
+TIMEOUT = 30.0
+
+class WarmupTimeout( Exception ):
+    "The counters (or a condition) didn't settle in time"
+    pass
+
+def fileCounters( paths, field=None ):
+    """Return a function that reads an integer counter from each file in
+       paths (e.g. cpuacct.usage, or an interface's statistics/rx_bytes)
+       and returns them as a list; with field, each file holds
+       'name value' lines (e.g. cgroup v2's cpu.stat) and the counter is
+       field's value"""
+    def read():
+        values = []
+        for path in paths:
+            f = open( path )
+            text = f.read()
+            f.close()
+            if field:
+                text = [ line.split()[ 1 ] for line in text.splitlines()
+                         if line.split()[ :1 ] == [ field ] ][ 0 ]
+            values.append( int( text ) )
+        return values
+    return read
+
+def total( read ):
+    "Return a function that returns the sum of read()'s counters, as one"
+    return lambda: [ sum( read() ) ]
+
+def _means( rows ):
+    "Return the per-column means of a list of equal-length lists"
+    return [ sum( column ) / float( len( rows ) ) for column in zip( *rows ) ]
+
+def waitSteady( read, tolerance=TOLERANCE, interval=INTERVAL, window=WINDOW,
+                timeout=TIMEOUT, name='counters' ):
+    """Poll read(), which returns a list of cumulative counters, every
+       interval seconds until each counter's rate has settled (see
+       above); return ( seconds waited, latest mean rates per second ),
+       or raise WarmupTimeout after timeout seconds"""
+    start = last = time()
+    previous = read()
+    history = []
+    while True:
+        sleep( interval )
+        now, values = time(), read()
+        elapsed = max( now - last, 1e-9 )
+        history.append( [ ( v - p ) / elapsed
+                          for v, p in zip( values, previous ) ] )
+        previous, last = values, now
+        history = history[ -2 * window: ]
+        recent = before = None
+        if len( history ) == 2 * window:
+            recent = _means( history[ window: ] )
+            before = _means( history[ :window ] )
+            if all( r > 0 and abs( r - b ) <= tolerance * r
+                    for r, b in zip( recent, before ) ):
+                return now - start, recent
+        if now - start > timeout:
+            if recent is None:
+                state = 'only %d polls' % len( history )
+            else:
+                state = 'rates %s, %s before' % (
+                    ' '.join( '%.4g' % r for r in recent ),
+                    ' '.join( '%.4g' % b for b in before ) )
+            raise WarmupTimeout(
+                '%s not steady within %g%% after %.1fs (%s)' % (
+                    name, 100.0 * tolerance, now - start, state ) )
+
+def waitFor( condition, timeout=TIMEOUT, interval=INTERVAL,
+             name='condition' ):
+    """Poll condition() every interval seconds until it is true; return
+       the seconds waited, or raise WarmupTimeout after timeout seconds"""
+    start = time()
+    while not condition():
+        if time() - start > timeout:
+            raise WarmupTimeout( '%s still not true after %.1fs' % (
+                name, time() - start ) )
+        sleep( interval )
+    return time() - start
@@ -7,7 +7,9 @@ connected either via a switch or raw links, over time.
 Bob Lantz
 """
 
+import os
 import re
+from sys import path
 from time import sleep, time
 from sys import exit, stdout, stderr
 from optparse import OptionParser
@@ -26,6 +28,13 @@ from mininet.util import quietRun, natural, custom
 
 from decimal import Decimal
 
+path.append( '..' )
+from lib.resultfile import ( isBinary, initBinary, appendBinary, sync,
+                             readRecords, dropPartial )
+from lib.jsonstream import writeJSON
+from lib.warmup import waitSteady, waitFor, fileCounters, total
+from cpuiso.MonitorCgroup import monitorCgroup
+
 # Simple topologies: sets of host pairs
 
 class PairTopo( Topo ):
@@ -142,8 +151,11 @@ def remoteIntf( intf ):
 
 # Iperf pair test
 
-def iperfPairs( opts, clients, servers ):
-    "Run iperf semi-simultaneously one way for all pairs"
+def iperfPairs( opts, clients, servers, monitor=None ):
+    """Run iperf semi-simultaneously one way for all pairs;
+       monitor is an optional MonitorCgroup to charge packetcount to.
+       Returns iperf results, cpu entries, the monitor's overhead
+       and the warm-up time"""
     pairs = len( clients )
     plist = zip( clients, servers )
     info( '*** Clients: %s\n' %  ' '.join( [ c.name for c in clients ] ) )
@@ -156,22 +168,39 @@ def iperfPairs( opts, clients, servers ):
     info( "*** Waiting for servers to start listening\n" )
     for src, dest in plist:
         info( dest.name, '' )
-        while not listening( src, dest ):
-            info( '.' )
-            sleep( .5 )
+        waitFor( lambda: listening( src, dest ), opts.warmuptimeout, .5,
+                 'iperf server listening on %s' % dest.name )
     info( '\n' )
     info( "*** Starting iperf clients\n" )
+    # Run until interrupted below, however long the warm-up takes
     for src, dest in plist:
-        src.sendCmd( "sleep 1; iperf -t %s -i .5 -c %s" % (
-            opts.time, dest.IP() ) )
+        src.sendCmd( "iperf -t %s -i .5 -c %s" % (
+            opts.time + opts.warmuptimeout + 10, dest.IP() ) )
+    warmup = None
+    if opts.steady > 0:
+        # Counters at the destinations, on the root namespace side
+        # (see below)
+        read = fileCounters( [ '/sys/class/net/%s/statistics/tx_bytes' %
+                               remoteIntf( dest.defaultIntf() ).name
+                               for dest in servers ] )
+        warmup, rates = waitSteady( total( read ), opts.steady,
+                                    interval=.25,
+                                    timeout=opts.warmuptimeout,
+                                    name='iperf throughput' )
+        info( '*** Throughput steady at %.1f Mbps after %.2fs\n' % (
+              8e-6 * rates[ 0 ], warmup ) )
     info( '*** Running cpu and packet count monitor\n' )
     startTime = int( time() )
     cmd = "./packetcount %s .5" % ( opts.time + 2 )
+    if monitor:
+        monitor.enter()
     stats = quietRun( cmd  )
+    overhead = monitor.leave() if monitor else {}
     intfEntries, cpuEntries = parseIntfStats( startTime, stats )
     info( "*** Waiting for clients to complete\n" )
     results = []
     for src, dest in plist:
+        src.sendInt()
         result = src.waitOutput()
         dest.cmd( "kill -9 %iperf" )
         # Wait for iperf server to terminate
@@ -188,54 +217,78 @@ def iperfPairs( opts, clients, servers ):
         # the statistics *at the destination*
         results += [ { 'src': src.name, 'dest': dest.name,
                     'destStats(s,txbytes,rxbytes)': intervals } ]
-    return results, cpuEntries
+    return results, cpuEntries, overhead, warmup
+
+def remainingCounts( counts, outfile ):
+    """Return the pair counts that outfile has no results for yet, after
+       dropping any incomplete record at its end"""
+    dropped = dropPartial( outfile )
+    if dropped:
+        warn( '*** Dropped %d bytes of an incomplete run from %s\n' %
+              ( dropped, outfile ) )
+    done = {}
+    for record in readRecords( outfile ):
+        if isinstance( record, list ):
+            for result in record:
+                pairs = result[ 'pairs' ]
+                done[ pairs ] = done.get( pairs, 0 ) + 1
+    remaining = []
+    for pairs in counts:
+        if done.get( pairs ):
+            done[ pairs ] -= 1
+        else:
+            remaining.append( pairs )
+    return remaining
 
 def pairTest( opts ):
     """Run a set of tests for a series of counts, returning
         accumulated iperf bandwidth per interval for each test."""
     results = []
-    initOutput( opts.outfile )
+    counts = opts.counts
+    if opts.resume and opts.outfile and os.path.exists( opts.outfile ):
+        counts = remainingCounts( opts.counts, opts.outfile )
+        info( '*** Resuming: %d of %d pair counts left to run\n' %
+              ( len( counts ), len( opts.counts ) ) )
+    else:
+        initOutput( opts.outfile )
+    monitor = monitorCgroup( warn ) if opts.monitorcg else None
     # 9 categories in linux 2.6+
     cpuHeader = ( 'cpu(start,stop,user%,nice%,sys%,idle%,iowait%,'
                  'irq%,sirq%,steal%,guest%)' )
-    for pairs in opts.counts:
+    for pairs in counts:
         cpu = 4./pairs if opts.cpu else -1
         bw = opts.bw if (opts.bw > 0) else None
         net, clients, servers = pairNet( 
             pairs=pairs, useSwitches=opts.switches, cpu=cpu, bw=bw)
         net.start()
         hosts = dictFromList( net.hosts )
-        intervals, cpuEntries = iperfPairs( opts, clients, servers )
+        intervals, cpuEntries, overhead, warmup = iperfPairs(
+            opts, clients, servers, monitor )
         net.stop()
         # Write output incrementally in case of failure
         result = { 'pairs': pairs, 'results': intervals,
             cpuHeader: cpuEntries }
+        result.update( overhead )
+        if warmup is not None:
+            result[ 'warmup' ] = round( warmup, 3 )
         appendOutput( opts, [ result ] )
         results += [ result ]
+    if monitor:
+        monitor.remove()
     return results
 
-# Floating point madness; thanks stackoverflow
-
-class PrettyFloats( float ):
-    def __repr__( self ):
-        return '%.15g' % self
-
-def prettyFloats( obj):
-    "Beautify floats in dict/list/tuple data structure"
-    if isinstance( obj, float ):
-        return PrettyFloats( obj )
-    elif isinstance( obj, dict ):
-        return dict((k, prettyFloats(v)) for k, v in obj.items())
-    elif isinstance( obj, ( list, tuple ) ):
-        return map( prettyFloats, obj )
-    return obj
-
 # Incrementally create and append to output file
 
+COMMENT = '# pair_intervals results'
+
 def initOutput( name ):
-    "Initialize an output file"
+    """Initialize an output file; names ending in .mbr get the binary
+       format of lib.resultfile"""
+    if name and isBinary( name ):
+        initBinary( name, COMMENT, opts.__dict__ )
+        return
     f =  open( name, 'w') if name else stdout
-    print >>f, '# pair_intervals results'
+    print >>f, COMMENT
     print >>f, dumps( opts.__dict__ )
     if name:
         f.close()
@@ -243,9 +296,15 @@ def initOutput( name ):
 def appendOutput( opts, totals ):
     "Append results as JSON to stdout or opts.outfile"
     info( '*** Dumping result\n' )
+    if opts.outfile and isBinary( opts.outfile ):
+        appendBinary( opts.outfile, totals )
+        return
     f = open( opts.outfile, 'a' ) if opts.outfile else stdout
-    print >>f, dumps( prettyFloats( totals ) )
+    writeJSON( f, totals )
+    f.write( '\n' )
     if opts.outfile:
+        # On disk before we report the run done (see lib/resultfile.py)
+        sync( f )
         f.close()
 
 # Command line options and sanity check
@@ -259,7 +318,9 @@ def parseOptions():
     "Parse command line options"
     parser = OptionParser()
     parser.add_option( '-o', '--output', dest='outfile',
-                      default=None, help='write output to file' )
+                      default=None,
+                      help='write output to file (binary format if it '
+                           'ends in .mbr)' )
     parser.add_option( '-t', '--time', dest='time',
                       type='int', default=10, help='select iperf time interval' )
     parser.add_option( '-c', '--counts', dest='counts',
@@ -274,6 +335,24 @@ def parseOptions():
     parser.add_option( '-p', '--cpu', dest='cpu', 
                       action='store_true', default=False, 
                       help='use cpu isolation' )
+    parser.add_option( '--steady', dest='steady',
+                      type='float', default=0.1,
+                      help='start measuring once the total iperf throughput '
+                           'is steady within this fraction (default: .1); '
+                           '0 to start right away' )
+    parser.add_option( '--warmup-timeout', dest='warmuptimeout',
+                      type='float', default=30.0,
+                      help='give up if the iperf servers are not listening, '
+                           'or the throughput not steady, after this many '
+                           'seconds (default: 30)' )
+    parser.add_option( '--resume', dest='resume',
+                      action='store_true', default=False,
+                      help='keep the existing output file and run only the '
+                           'pair counts it has no results for yet' )
+    parser.add_option( '--no-monitorcg', dest='monitorcg',
+                      default=True, action='store_false',
+                      help="don't measure packetcount's own CPU use "
+                           "in a separate cgroup" )
     options, args = parser.parse_args()
     return options, args
 
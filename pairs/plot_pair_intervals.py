@@ -49,17 +49,27 @@ much value.
 Bob Lantz
 """
 
-import fileinput
 from math import sqrt
-from json import loads
 from optparse import OptionParser
-from sys import exit
+from sys import exit, path
 from operator import and_, add
+import os
 
-# We use python-matplotlib and numpy for graphing
-import matplotlib as mpl
-import matplotlib.pyplot as plt
+path.append( '..' )
+
+# We use python-matplotlib and numpy for graphing; pyplot is only
+# imported once we actually draw something
 import numpy as np
+from lib.lazyplot import pyplot
+from lib.render import formatListCallback, figureJob, renderJobs, reportJobs
+from lib.plotcache import PlotCache, cacheKey
+from lib.resultfile import readRecords
+
+plt = pyplot()
+
+# Options that only choose which figures to draw: left out of each
+# figure's cache key, so asking for one more figure keeps the others
+FIGURE_OPTS = ( 'links', 'entire', 'cpu', 'cpubars', 'total', 'all' )
 
 # Accumulate results and calculate variance
 
@@ -439,6 +449,25 @@ def parseOptions():
     parser.add_option( '-a', '--all', dest='all',
                       default=False, action='store_true',
                       help='create all available plots' )
+    parser.add_option( '-d', '--dir', dest='dir',
+                      type='string', default='',
+                      help='save plots in the directory "dir" rather than'
+                           ' displaying them' )
+    parser.add_option( '-f', '--formats', dest='formats',
+                      action='callback', callback=formatListCallback,
+                      default=[ 'pdf' ], type='string',
+                      help='figure formats to save with --dir, e.g. pdf,png,svg' )
+    parser.add_option( '-j', '--jobs', dest='jobs',
+                      type='int', default=0,
+                      help='parallel rendering processes with --dir '
+                           '(default: one per core)' )
+    parser.add_option( '--cache', dest='cache',
+                      type='string', default='',
+                      help='reuse parsed data and unchanged figures '
+                           'from cache directory "cache"' )
+    parser.add_option( '--cachemb', dest='cachemb',
+                      type='int', default=1024,
+                      help='plot cache size limit in MB (1024)' )
     ( options, args ) = parser.parse_args()
     plotFlags = [ 'iperf', 'rxbytes', 'links', 'aggregate', 'entire', 'cpu',
                  'cpubars' ]
@@ -463,12 +492,9 @@ def readData( files ):
     "Read input data from pair_intervals run"
     results = []
     opts = {}
-    for line in fileinput.input( files ):
-        if line[ 0 ] == '#':
-            continue
-        data = loads( line )
+    for data in ( d for f in files for d in readRecords( f ) ):
         if type( data ) == dict:
-            opts = loads(line)
+            opts = data
         elif type( data ) == list:
             results +=  data
     return results, opts
@@ -476,22 +502,55 @@ def readData( files ):
 if __name__ == '__main__':
     plotopts, args = parseOptions()
     plotopts.args = args
-    results, opts = readData( files=args )
-    if plotopts.rxbytes:
-        calculateRxBw( results )
+    cache = None
+    if plotopts.cache:
+        cache = PlotCache( plotopts.cache, plotopts.cachemb << 20 )
+        # Derived fields depend on rxbytes/iperf, so key on the options
+        def prepare():
+            results, opts = readData( files=args )
+            if plotopts.rxbytes:
+                calculateRxBw( results )
+            if plotopts.aggregate:
+                calculateTotals( plotopts, results )
+            return results, opts
+        results, opts = cache.memoize(
+            cacheKey( args, { 'rxbytes': plotopts.rxbytes,
+                              'iperf': plotopts.iperf,
+                              'aggregate': plotopts.aggregate },
+                      func=readData ), prepare )
+    else:
+        results, opts = readData( files=args )
+        if plotopts.rxbytes:
+            calculateRxBw( results )
+        if plotopts.aggregate:
+            calculateTotals( plotopts, results )
+    fignum = 10
+    jobs = []
     if plotopts.links:
-        plotIntervals( plotopts, results )
+        jobs.append( ( 'links', plotIntervals, ( plotopts, results ) ) )
     if plotopts.aggregate:
-        calculateTotals( plotopts, results )
-        plotIntervalTotals( plotopts, results )
+        jobs.append( ( 'aggregate', plotIntervalTotals,
+                       ( plotopts, results ) ) )
     if plotopts.entire:
-        plotTotal( plotopts, results, aggregate=False )
-    fignum = 10
+        jobs.append( ( 'entire', plotTotal, ( plotopts, results, False ) ) )
     if plotopts.cpu:
-        fignum = plotCpu( fignum, plotopts, results )
+        jobs.append( ( 'cpu', plotCpu, ( fignum, plotopts, results ) ) )
     if plotopts.cpubars:
-        plotCpuBars( fignum, plotopts, results )
+        # Leave room for the cpu figures when drawing in one process
+        jobs.append( ( 'cpubars', plotCpuBars,
+                       ( fignum + 100, plotopts, results ) ) )
     #if plotopts.total:
     #    plotTotal( plotopts, results, aggregate=True )
-    plt.show()
-
+    if plotopts.dir:
+        prefix = os.path.splitext( os.path.basename( args[ 0 ] ) )[ 0 ]
+        reportJobs( renderJobs( [
+            figureJob( name, func, fargs,
+                       '%s/%s-%s' % ( plotopts.dir, prefix, name ),
+                       plotopts.formats,
+                       key=cache and cacheKey( args, plotopts, func,
+                                               volatile=FIGURE_OPTS ) )
+            for name, func, fargs in jobs ], plotopts.jobs, cache ) )
+    else:
+        for name, func, fargs in jobs:
+            func( *fargs )
+        plt.show()
@@ -1,7 +1,5 @@
 #!/usr/bin/python
 
-import fileinput
-from json import loads
 from optparse import OptionParser
 from sys import exit, path
 from operator import and_, add
@@ -11,12 +9,16 @@ import math
 
 path.append( '..' )
 
-import lib.plot_defaults
-import matplotlib.pyplot as plt
+from lib.lazyplot import pyplot
+plt = pyplot( 'lib.plot_defaults' )
 
 from cpuiso.CPUIsolationLib import intListCallback
 from lib.plot import colorGenerator
 from lib.helper import avg, stdev
+from lib.sketch import sketch_file
+from lib.resultfile import readRecords
+from lib.render import ( formatListCallback, saveFigure, figureJob,
+                         renderJobs, reportJobs )
 
 def sched_for(indir):
     if 'cfs' in indir:
@@ -42,11 +44,16 @@ def plot_pingpong(plotopts):
             widths = []
             for n in plotopts.counts:
                 infile = '%s/u-%d' % (indir, n)
-                ping_stats = parsePing(infile)
                 x.append(n)
-                y.append(ping_stats)
+                if plotopts.sketch:
+                    y.append(sketchBoxStats(parsePingSketch(infile)))
+                else:
+                    y.append(parsePing(infile))
                 widths.append(math.log(n,2))
-            plt.boxplot(y, positions=x, widths=widths)
+            if plotopts.sketch:
+                plt.gca().bxp(y, positions=x, widths=widths, showfliers=False)
+            else:
+                plt.boxplot(y, positions=x, widths=widths)
         # plt.xscale('log')
         plt.grid( True )
         # plt.ylim(ymin=0.0, ymax=0.1)
@@ -56,13 +63,20 @@ def plot_pingpong(plotopts):
             widths = []
             for n in plotopts.counts:
                 infile = '%s/u-%d' % (indir, n)
-                ping_stats = parsePing(infile)
                 x.append(n)
-                y.append(avg(ping_stats))
-                sd = 2*stdev(ping_stats)
+                if plotopts.sketch:
+                    s = parsePingSketch(infile)
+                    y.append(s.mean())
+                    sd = 2*s.stdev()
+                    ymin.append(s.min)
+                    ymax.append(s.max)
+                else:
+                    ping_stats = parsePing(infile)
+                    y.append(avg(ping_stats))
+                    sd = 2*stdev(ping_stats)
+                    ymin.append(min(ping_stats))
+                    ymax.append(max(ping_stats))
                 yerr.append(2*sd)
-                ymin.append(min(ping_stats))
-                ymax.append(max(ping_stats))
                 ysd.append(sd)
             color = cgen.next()
             label = sched_for(indir)
@@ -87,16 +101,26 @@ def parsePing(infile):
     f.close()
     # print ping_stats
     return ping_stats
+
+def parsePingSketch(infile):
+    """Like parsePing, but stream the file into a bounded-memory
+       quantile sketch (see lib/sketch.py for error bounds)"""
+    return sketch_file(infile, scale=1000.0)
+
+def sketchBoxStats(s):
+    "Return box plot stats for Axes.bxp() from a ping sketch"
+    q1, med, q3 = s.quantiles([.25, .5, .75])
+    iqr = q3 - q1
+    return { 'med': med, 'q1': q1, 'q3': q3,
+             'whislo': max(s.min, q1 - 1.5*iqr),
+             'whishi': min(s.max, q3 + 1.5*iqr), 'fliers': [] }
         
 def readData( files ):
     "Read input data from pair_intervals run"
     results = []
-    for line in fileinput.input( files ):
-        if line[ 0 ] == '#':
-            continue
-        data = loads( line )
+    for data in ( d for f in files for d in readRecords( f ) ):
         if type( data ) == dict:
-            opts = loads(line)
+            opts = data
         elif type( data ) == list:
             results.append(data)
     return results, opts
@@ -106,9 +130,9 @@ def savePlot(opts, plot_name):
         plt.show()
         return
     file_prefix = os.path.splitext(os.path.basename(opts.args[0]))[0] if opts.prefix == '' else opts.prefix
-    fname = '%s/%s-%s.pdf' % (opts.dir, file_prefix, plot_name)
-    print 'Saving plot to %s' % fname
-    plt.savefig(fname)
+    basename = '%s/%s-%s' % (opts.dir, file_prefix, plot_name)
+    print 'Saving plot to %s.{%s}' % (basename, ','.join(opts.formats))
+    saveFigure(plt.gcf(), basename, opts.formats)
 
 def parseOptions():
     "Parse command line options"
@@ -125,10 +149,25 @@ def parseOptions():
     parser.add_option( '-b', '--box', dest='box',
                       default=False, action='store_true',
                       help='plot box plots' )
+    parser.add_option( '-s', '--sketch', dest='sketch',
+                      default=False, action='store_true',
+                      help='summarize pings with a streaming quantile sketch'
+                           ' rather than loading them all into memory' )
+    parser.add_option( '-f', '--formats', dest='formats',
+        action='callback', callback=formatListCallback, default=[ 'pdf' ],
+        type='string', help='figure formats to save with --dir, e.g. pdf,png' )
+    parser.add_option( '-j', '--jobs', dest='jobs',
+                      type='int', default=0,
+                      help='parallel rendering processes with --dir '
+                           '(default: one per core)' )
     ( options, args ) = parser.parse_args()
     return options, args
 
 if __name__ == '__main__':
     plotopts, args = parseOptions()
     plotopts.args = args
-    plot_pingpong(plotopts)
+    if plotopts.dir:
+        reportJobs(renderJobs([figureJob('pingpong', plot_pingpong,
+                                         (plotopts,))], plotopts.jobs))
+    else:
+        plot_pingpong(plotopts)
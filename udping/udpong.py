@@ -13,7 +13,9 @@ from mininet.net import Mininet
 from mininet.node import CPULimitedHost, Controller
 from cpuiso.CPUIsolationLib import ( cpuStressName, cpuMonitorName,
                                      checkForExec,
-                                     intListCallback, parse_cpuacct )
+                                     intListCallback, parse_cpuacct,
+                                     waitSteadyCPU )
+from lib.warmup import waitFor
 #from CPUIsolationLib import initOutput, appendOutput
 from mininet.util import quietRun, numCores, custom
 from mininet.topo import Topo
@@ -51,9 +53,26 @@ def parseOptions():
     parser.add_option('-e', '--period', dest='period',
                       default=100000, type='int',
                       help='enforcement period (us) for CPU bandwidth limiting')
+    parser.add_option('--steady', dest='steady',
+                      default=0.1, type='float',
+                      help='start pinging once the stress processes\' '
+                           'total CPU usage rate is steady within this '
+                           'fraction (default: .1); 0 for a fixed wait')
+    parser.add_option('--warmup-timeout', dest='warmuptimeout',
+                      default=30.0, type='float',
+                      help='give up if the udping server is not up, or the '
+                           'CPU usage not steady, after this many seconds '
+                           '(default: 30)')
     ( options, args ) = parser.parse_args()
     return options, args
 
+# udping.c's server port, as it appears in /proc/net/udp
+UDPING_PORT = ':%04X ' % 32000
+
+def udpingListening( host ):
+    "Is a udping server bound in host's network namespace?"
+    return UDPING_PORT in host.cmd( 'cat /proc/net/udp' )
+
 class PingPongTopo(Topo):
     "Simple topology: N hosts but only one link"
 
@@ -115,9 +134,27 @@ def pingpongtest(opts):
         h1, h2 = net.get( 'h1', 'h2' )
         h1.cmd('ping -nc%d %s' % (1, h2.IP()))
 
-        info('*** Starting udping server and waiting 5 seconds\n')
+        info('*** Starting udping server\n')
         h2.cmd('%s > /dev/null &' % udping)
-        sleep(5)
+        try:
+            if opts.steady > 0:
+                waitFor(lambda: udpingListening(h2), opts.warmuptimeout,
+                        name='udping server on h2')
+                stressed = [net.get('h%s' % i) for i in xrange(start, n+1)]
+                if stressed:
+                    waitSteadyCPU(stressed, opts.steady, opts.warmuptimeout,
+                                  fallback=5)
+            else:
+                info('*** Waiting 5 seconds\n')
+                sleep(5)
+        except:
+            # Don't leave the stressors and the network running
+            for popen in cmd.values():
+                popen.kill()
+            quietRun('pkill -9 -f ' + cpustress)
+            quietRun('pkill -9 udping')
+            net.stop()
+            raise
 
         info('*** Running udping client for %s pings\n' % opts.pings)
         start = time()